@@ -0,0 +1,23 @@
+from fastapi import Header, HTTPException
+from typing import Optional
+import hmac
+import os
+import env  # noqa: F401  (loads .env before ADMIN_TOKEN is read)
+
+# Shared secret for the operational endpoints (traces, profiling) and full
+# order details. When it is not set those are disabled entirely.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    # compare_digest raises on non-ASCII str, and header values can be any latin-1
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode('utf-8', 'surrogatepass'), ADMIN_TOKEN.encode('utf-8', 'surrogatepass'))
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """FastAPI dependency guarding admin-only endpoints with the X-Admin-Token header"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
@@ -0,0 +1,156 @@
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+import asyncio
+import os
+import time
+import orjson
+import env  # noqa: F401  (loads .env before the ADMISSION_* limits are read)
+from metrics import Counter, Gauge, Histogram
+
+admission_in_flight = Gauge(
+    'admission_in_flight', 'Requests admitted and running per route class', ('route_class',))
+admission_queue_depth = Gauge(
+    'admission_queue_depth', 'Requests waiting for admission per route class', ('route_class',))
+admission_wait_seconds = Histogram(
+    'admission_wait_seconds', 'Time admitted requests waited in the queue', ('route_class',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0))
+admission_rejections_total = Counter(
+    'admission_rejections_total', 'Requests shed with a 503', ('route_class', 'reason'))
+
+
+class Limiter:
+    """Concurrency limit with a bounded FIFO wait queue and a maximum wait"""
+
+    def __init__(self, limit: int, queue_size: int, max_wait: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> Optional[str]:
+        """None once admitted, else why not: 'queue_full' or 'timeout'"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return 'queue_full'
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if waiter.done():
+            return None
+        self._abandon(waiter)
+        return 'timeout'
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done():
+            # Handed a slot just as we gave up; pass it on
+            self.release()
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter so it cannot be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class RouteClass:
+    def __init__(self, name: str, prefixes: Tuple[str, ...], limit: int, queue_size: int, max_wait: float,
+                 retry_after: int = 1):
+        env = f'ADMISSION_{name.upper()}'
+        self.name = name
+        self.prefixes = prefixes
+        self.retry_after = int(os.environ.get(f'{env}_RETRY_AFTER', retry_after))
+        self.limiter = Limiter(int(os.environ.get(f'{env}_LIMIT', limit)),
+                               int(os.environ.get(f'{env}_QUEUE', queue_size)),
+                               float(os.environ.get(f'{env}_MAX_WAIT', max_wait)))
+
+
+# First match wins. Payments have their own pool, so a surge of public
+# traffic can never take the slots checkout and order routes rely on.
+# Limits are per worker process.
+ROUTE_CLASSES = [
+    RouteClass('payments', ('/api/payments', '/api/orders'), limit=32, queue_size=64, max_wait=10.0),
+    RouteClass('public', ('/api/contact', '/api/reviews', '/api/newsletter'), limit=16, queue_size=32, max_wait=2.0),
+    RouteClass('api', ('/api/',), limit=64, queue_size=128, max_wait=5.0),
+]
+# Admin tools (profiles run for seconds) are never shed
+EXEMPT_PREFIXES = ('/api/admin',)
+
+
+def classify(path: str, classes: List[RouteClass] = ROUTE_CLASSES) -> Optional[RouteClass]:
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    for route_class in classes:
+        if path.startswith(route_class.prefixes):
+            return route_class
+    return None
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware limiting concurrent requests per route class.
+
+    Requests over a class's limit wait in its queue; when the queue is
+    full, or a request has waited ``max_wait`` seconds, it gets a 503 with
+    Retry-After instead of piling onto the event loop and Mongo pool.
+    Static files, /metrics and /img are not limited.
+    """
+
+    def __init__(self, app, enabled: Optional[bool] = None, classes: List[RouteClass] = ROUTE_CLASSES):
+        self.app = app
+        if enabled is None:
+            enabled = os.environ.get('ADMISSION_CONTROL', 'true').lower() != 'false'
+        self.enabled = enabled
+        self.classes = classes
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope['path'], self.classes) if self.enabled and scope['type'] == 'http' else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class.name
+        limiter = route_class.limiter
+        start = time.perf_counter()
+        admission_queue_depth.inc(name)
+        try:
+            rejected = await limiter.acquire()
+        finally:
+            admission_queue_depth.dec(name)
+        if rejected:
+            admission_rejections_total.inc(name, rejected)
+            await self._reject(send, route_class)
+            return
+
+        admission_wait_seconds.observe(time.perf_counter() - start, name)
+        admission_in_flight.inc(name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_in_flight.dec(name)
+            limiter.release()
+
+    @staticmethod
+    async def _reject(send, route_class: RouteClass):
+        body = orjson.dumps({"detail": "Server is busy, please retry shortly"})
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(route_class.retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
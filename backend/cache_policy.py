@@ -0,0 +1,102 @@
+from starlette.datastructures import MutableHeaders
+from typing import Any, Dict, List, Optional, Tuple
+
+# Cache-Control values shared by the rules below
+IMMUTABLE = {'Cache-Control': 'public, max-age=31536000, immutable'}
+IMAGES = {'Cache-Control': 'public, max-age=2592000'}
+STATIC = {'Cache-Control': 'public, max-age=604800'}
+NO_STORE = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+}
+
+Headers = Dict[str, str]
+
+
+class CachePolicy:
+    """Maps a request path to the cache headers it should carry.
+
+    Rules are compiled once into a prefix list and an extension dict, so a
+    lookup is a couple of ``startswith`` checks plus one dict lookup on the
+    file extension of the last path segment. Earlier rules win, so a prefix
+    listed before every extension rule decides on its own.
+    """
+
+    def __init__(self, rules: List[Tuple[str, Any, Headers]]):
+        self._prefixes: List[Tuple[int, str, Headers]] = []
+        self._extensions: Dict[str, Tuple[int, Headers]] = {}
+        self._first_extension = len(rules)
+        for priority, (kind, match, headers) in enumerate(rules):
+            if kind == 'prefix':
+                self._prefixes.append((priority, match, headers))
+            elif kind == 'ext':
+                self._first_extension = min(self._first_extension, priority)
+                for ext in match:
+                    self._extensions.setdefault(ext.lower().lstrip('.'), (priority, headers))
+            else:
+                raise ValueError(f"Unknown cache rule kind: {kind}")
+
+    def headers_for(self, path: str) -> Optional[Headers]:
+        """Return the cache headers for ``path`` or None if no rule applies"""
+        best = None
+        for priority, prefix, headers in self._prefixes:
+            if path.startswith(prefix):
+                if priority < self._first_extension:
+                    return headers
+                best = (priority, headers)
+                break
+
+        filename = path.rpartition('/')[2]
+        if '.' in filename:
+            hit = self._extensions.get(filename.rpartition('.')[2].lower())
+            if hit and (best is None or hit[0] < best[0]):
+                best = hit
+
+        return best[1] if best else None
+
+
+DEFAULT_CACHE_POLICY = CachePolicy([
+    # Never cache API responses, whatever the path ends in
+    ('prefix', '/api/', NO_STORE),
+    # Hashed build output is safe to cache for 1 year
+    ('prefix', '/assets/', IMMUTABLE),
+    # Images and video for 30 days
+    ('ext', ['jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'svg', 'ico', 'mp4', 'webm'], IMAGES),
+    # Other static files for 1 week
+    ('ext', ['css', 'js', 'woff', 'woff2', 'ttf', 'eot'], STATIC),
+])
+
+
+class CacheHeadersMiddleware:
+    """Pure ASGI middleware that stamps cache headers on the response start.
+
+    Unlike ``@app.middleware("http")`` this does not wrap the request in
+    BaseHTTPMiddleware, so streaming bodies pass straight through.
+    """
+
+    def __init__(self, app, policy: CachePolicy = DEFAULT_CACHE_POLICY):
+        self.app = app
+        self.policy = policy
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        cache_headers = self.policy.headers_for(scope['path'])
+        if cache_headers is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache_headers(message):
+            # Error responses must not pick up long-lived public caching
+            if message['type'] == 'http.response.start' and (
+                message['status'] < 400 or cache_headers['Cache-Control'].startswith('no-')
+            ):
+                headers = MutableHeaders(scope=message)
+                for name, value in cache_headers.items():
+                    headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
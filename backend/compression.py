@@ -0,0 +1,270 @@
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from typing import Dict, Optional, Tuple
+import gzip
+import hashlib
+import os
+import zlib
+import env  # noqa: F401  (loads .env before the COMPRESSION_* settings are read)
+
+# Brotli and zstd are optional - without them we negotiate gzip only
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+# Server preference when the client accepts several encodings equally
+SUPPORTED_ENCODINGS = [
+    enc for enc, available in (("br", brotli), ("zstd", zstandard), ("gzip", True)) if available
+]
+
+DEFAULT_LEVELS = {
+    "br": int(os.environ.get("COMPRESSION_LEVEL_BR", 4)),
+    "zstd": int(os.environ.get("COMPRESSION_LEVEL_ZSTD", 3)),
+    "gzip": int(os.environ.get("COMPRESSION_LEVEL_GZIP", 6)),
+}
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+}
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+        or media_type.endswith("+xml")
+    )
+
+
+def negotiate_encoding(accept_encoding: str, supported=SUPPORTED_ENCODINGS) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header.
+
+    Highest q-value wins; ties go to the order of ``supported``.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name.strip()] = q
+
+    wildcard = qualities.get("*")
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = qualities.get(encoding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    # mtime=0 keeps output deterministic for identical bodies
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental compressor with a common compress()/flush() interface"""
+
+    def __init__(self, encoding: str, level: int):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self.compress, self.flush = compressor.process, compressor.finish
+        elif encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.compress, self.flush = compressor.compress, compressor.flush
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress, self.flush = compressor.compress, compressor.flush
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by (path, etag, encoding), bounded by total bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Tuple[str, str, str], body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+compressed_body_cache = CompressedBodyCache(int(os.environ.get("COMPRESSION_CACHE_BYTES", 16 * 1024 * 1024)))
+
+
+def body_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class CompressionMiddleware:
+    """Pure ASGI response compression with br / zstd / gzip negotiation.
+
+    Complete bodies are compressed once per (path, ETag, encoding) and then
+    served from ``compressed_body_cache``; responses without an ETag get one
+    derived from a hash of the body. Streaming bodies are compressed
+    incrementally and never cached. Only full 200 responses are touched:
+    anything else, and partial content in particular (Content-Range counts
+    bytes of the identity body), passes through as is.
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, levels: Optional[Dict[str, int]] = None,
+                 cache: CompressedBodyCache = compressed_body_cache):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send, _cache_path(scope))
+        await self.app(scope, receive, responder.send)
+
+
+def _cache_path(scope) -> str:
+    query = scope.get("query_string", b"")
+    return scope["path"] + ("?" + query.decode("latin-1") if query else "")
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send, path: str):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.path = path
+        self.level = middleware.levels[encoding]
+        self.downstream = send
+        self.start_message = None
+        self.passthrough = False
+        self.stream = None
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.start_message = message
+            self.passthrough = (
+                message["status"] != 200
+                or "content-range" in headers
+                or "content-encoding" in headers
+                or not is_compressible(headers.get("content-type", ""))
+            )
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self._flush_start()
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.stream is not None:
+            chunk = self.stream.compress(body)
+            if not more_body:
+                chunk += self.stream.flush()
+            await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        if more_body:
+            await self._start_stream(body)
+        elif len(body) < self.middleware.minimum_size:
+            MutableHeaders(scope=self.start_message).add_vary_header("Accept-Encoding")
+            await self._flush_start()
+            await self.downstream(message)
+        else:
+            await self._send_complete(body)
+
+    async def _flush_start(self):
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            await self.downstream(start)
+
+    async def _send_complete(self, body: bytes):
+        headers = MutableHeaders(scope=self.start_message)
+        etag = headers.get("etag") or body_etag(body)
+        # Weak and strong validators are different keys: a weak ETag only
+        # promises semantic equality, not the same bytes
+        key = (self.path, etag, self.encoding)
+
+        compressed = self.middleware.cache.get(key)
+        if compressed is None:
+            compressed = compress(body, self.encoding, self.level)
+            self.middleware.cache.put(key, compressed)
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        # The encoded representation is only semantically equal to the original
+        headers["ETag"] = etag if etag.startswith("W/") else "W/" + etag
+        headers.add_vary_header("Accept-Encoding")
+        await self._flush_start()
+        await self.downstream({"type": "http.response.body", "body": compressed, "more_body": False})
+
+    async def _start_stream(self, first_chunk: bytes):
+        headers = MutableHeaders(scope=self.start_message)
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "content-length" in headers:
+            del headers["content-length"]
+        self.stream = _StreamCompressor(self.encoding, self.level)
+        await self._flush_start()
+        await self.downstream({
+            "type": "http.response.body",
+            "body": self.stream.compress(first_chunk),
+            "more_body": True,
+        })
@@ -0,0 +1,54 @@
+from typing import Optional
+import os
+import env  # noqa: F401  (loads .env before MONGO_URL and DB_NAME are read)
+from metrics import mongo_command_listener
+from tracing import TracedDatabase
+
+_client = None
+
+
+def get_client():
+    """The process-wide Motor client, created on first use.
+
+    Importing motor/pymongo is a good share of cold start and a client
+    starts its monitor threads when first used, so both wait until a
+    request or the lifespan startup needs Mongo. server and payment_routes
+    share this client and its connection pool.
+    """
+    global _client
+    if _client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        _client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[mongo_command_listener()])
+    return _client
+
+
+def close_client():
+    if _client is not None:
+        _client.close()
+
+
+class LazyDatabase:
+    """The application database, connected on first attribute access"""
+
+    def __init__(self, name: Optional[str] = None):
+        self._name = name
+        self._database: Optional[TracedDatabase] = None
+
+    @property
+    def name(self) -> str:
+        """The database name, known before the client is created"""
+        return self._name or os.environ['DB_NAME']
+
+    def _get(self) -> TracedDatabase:
+        if self._database is None:
+            self._database = TracedDatabase(get_client()[self.name])
+        return self._database
+
+    def __getitem__(self, name: str):
+        return self._get()[name]
+
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+
+
+db = LazyDatabase()
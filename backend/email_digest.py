@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import logging
+import os
+import env  # noqa: F401  (loads .env before EMAIL_DIGEST_MINUTES is read)
+from email_service import email_service
+from email_dispatcher import QUEUED, email_dispatcher
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Minutes between business notification digests; 0 sends each contact form
+# and pre-order notification as it happens
+EMAIL_DIGEST_MINUTES = float(os.environ.get('EMAIL_DIGEST_MINUTES', 0))
+# How often each worker checks whether a digest is due
+EMAIL_DIGEST_POLL_SECONDS = float(os.environ.get('EMAIL_DIGEST_POLL_SECONDS', 30))
+
+email_digests_total = Counter(
+    'email_digests_total', 'Business notification digests', ('outcome',))
+
+CONTACT_FIELDS = {"_id": 0, "name": 1, "email": 1, "phone": 1, "subject": 1, "message": 1, "timestamp": 1}
+PRE_ORDER_FIELDS = {"_id": 0, "customer_name": 1, "customer_email": 1, "amount": 1, "currency": 1,
+                    "payment_status": 1, "created_at": 1, "cart_items.name": 1, "cart_items.quantity": 1}
+
+
+class BusinessDigest:
+    """Batches contact form and pre-order notifications into one email per period.
+
+    Nothing is queued in memory: each digest is rendered from the
+    contact_submissions and payment_transactions stored during its period.
+    The period is claimed in the email_digests collection with
+    find_one_and_update, so with several workers exactly one sends it. If
+    the send fails the claim is rolled back and the next digest covers
+    the missed period too.
+    """
+
+    STATE_ID = "business"
+
+    def __init__(self, minutes: float, poll_seconds: float):
+        self.minutes = minutes
+        self.poll_seconds = poll_seconds
+        self.db = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.minutes > 0
+
+    def start(self, db):
+        if not self.enabled or self._task is not None:
+            return
+        self.db = db
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="email-digest")
+        logger.info("Email digest enabled", extra={"minutes": self.minutes})
+
+    async def stop(self, timeout: float = 0):
+        """Stop after the digest being sent, if any, waiting up to ``timeout`` seconds.
+
+        Cancelling between claiming a period and queueing its email would
+        leave that period out of every digest.
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        await asyncio.wait((self._task,), timeout=max(0.0, timeout))
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.send_due()
+            except Exception:
+                logger.exception("Email digest failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self, now: datetime) -> Optional[datetime]:
+        """Claim the period ending now if it is due; returns its start"""
+        state = self.db.email_digests
+        await state.update_one(
+            {"_id": self.STATE_ID},
+            {"$setOnInsert": {"since": now, "due": now + timedelta(minutes=self.minutes)}},
+            upsert=True,
+        )
+        previous = await state.find_one_and_update(
+            {"_id": self.STATE_ID, "due": {"$lte": now}},
+            {"$set": {"since": now, "due": now + timedelta(minutes=self.minutes)}},
+        )
+        return previous["since"] if previous else None
+
+    async def send_due(self) -> Optional[bool]:
+        """Send the digest if one is due; None when there was nothing to do"""
+        now = datetime.utcnow()
+        since = await self._claim(now)
+        if since is None:
+            return None
+
+        window = {"$gte": since, "$lt": now}
+        contacts = await self.db.contact_submissions.find(
+            {"timestamp": window}, CONTACT_FIELDS).sort("timestamp", 1).to_list(None)
+        pre_orders = await self.db.payment_transactions.find(
+            {"created_at": window}, PRE_ORDER_FIELDS).sort("created_at", 1).to_list(None)
+        if not contacts and not pre_orders:
+            email_digests_total.inc('empty')
+            return None
+
+        sent = await email_dispatcher.send(
+            "notifications", email_service.send_business_digest, contacts, pre_orders, since, now)
+        email_digests_total.inc('queued' if sent == QUEUED else 'sent' if sent else 'failed')
+        logger.info("Email digest processed", extra={
+            "contacts": len(contacts), "pre_orders": len(pre_orders), "email_sent": sent})
+        if not sent:
+            # Hand the period back so the next digest includes it
+            await self.db.email_digests.update_one(
+                {"_id": self.STATE_ID, "since": now}, {"$set": {"since": since}})
+        return sent
+
+
+business_digest = BusinessDigest(EMAIL_DIGEST_MINUTES, EMAIL_DIGEST_POLL_SECONDS)
@@ -0,0 +1,327 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+import env  # noqa: F401  (loads .env before EMAIL_LANES is read)
+from email_service import email_service
+from metrics import Counter, Gauge, Histogram
+from rate_limit import TokenBucket
+from resilience import CLOSED, CircuitBreaker, smtp_breaker
+
+logger = logging.getLogger(__name__)
+
+# name=concurrency:per_minute, highest priority first. Each order sends two
+# transactional emails, so that lane allows ten orders a second
+DEFAULT_LANES = "transactional=4:1200,notifications=2:120,marketing=1:20"
+EMAIL_LANES = os.environ.get('EMAIL_LANES', DEFAULT_LANES)
+# SMTP sessions open at once across all lanes
+EMAIL_MAX_CONCURRENCY = int(os.environ.get('EMAIL_MAX_CONCURRENCY', 4))
+# Seconds a request waits for its email before answering that it is queued
+EMAIL_REQUEST_WAIT = float(os.environ.get('EMAIL_REQUEST_WAIT', 2))
+# Seconds between checks for mail that stopped workers left in the outbox
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', 30))
+
+# send() result for mail that is still queued and will go out later
+QUEUED = "queued"
+
+email_queue_depth = Gauge(
+    'email_queue_depth', 'Emails waiting in each dispatcher lane', ('lane',))
+email_queue_wait_seconds = Histogram(
+    'email_queue_wait_seconds', 'Time an email waited in its lane before sending', ('lane',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0))
+email_sends_total = Counter(
+    'email_sends_total', 'Emails sent by the dispatcher', ('lane', 'outcome'))
+email_outbox_total = Counter(
+    'email_outbox_total', 'Unsent emails saved at shutdown, picked up again, or lost', ('lane', 'action'))
+
+
+class PrioritySlots:
+    """Semaphore that hands freed slots to the highest priority (lowest number) waiter"""
+
+    def __init__(self, slots: int):
+        self.free = slots
+        self._waiters: List[tuple] = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.free > 0 and not self._waiters:
+            self.free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._order), waiter)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.free += 1
+
+
+class Lane:
+    def __init__(self, name: str, priority: int, concurrency: int, per_minute: float):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.per_minute = per_minute
+        self.queue: Optional[asyncio.Queue] = None
+        self.bucket = TokenBucket(per_minute / 60, max(1, concurrency))
+        self.last_wait = 0.0
+
+
+class _Job:
+    __slots__ = ('lane', 'send', 'args', 'future', 'enqueued')
+
+    def __init__(self, lane: str, send: Callable[..., bool], args: tuple, future: asyncio.Future):
+        self.lane = lane
+        self.send = send
+        self.args = args
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+def parse_lanes(spec: str) -> List[Lane]:
+    lanes = []
+    for priority, item in enumerate(i.strip() for i in spec.split(',') if i.strip()):
+        name, _, budget = item.partition('=')
+        concurrency, _, per_minute = budget.partition(':')
+        lanes.append(Lane(name.strip(), priority, int(concurrency or 1), float(per_minute or 60)))
+    return lanes
+
+
+class EmailDispatcher:
+    """Queued email delivery in priority lanes.
+
+    Each lane has its own queue, worker count and per-minute rate budget, so
+    order mail never waits behind a backlog of contact notifications or
+    marketing. The lanes share EMAIL_MAX_CONCURRENCY SMTP sessions, which go
+    to the highest priority lane with work waiting. Sends run through
+    ``runner`` (EmailService.send_async) and resolve to True/False.
+
+    While ``breaker`` is open the lanes hold their mail instead of failing
+    it: a send that fails with the breaker not closed goes back in its
+    lane, its future unresolved, and goes out once SMTP recovers; callers
+    of ``send`` get QUEUED meanwhile.
+
+    On shutdown ``drain`` gives queued and in-flight mail until a deadline
+    to go out and saves the rest to the ``email_outbox`` collection, by
+    ``service`` method name and arguments. Every worker claims saved mail
+    from there at startup and every EMAIL_OUTBOX_POLL_SECONDS, so a
+    restart or rolling deploy does not drop notifications. An email cut
+    off mid-send is saved too and may go out twice; one claimed by a
+    worker that is killed outright (no drain) is lost, never sent twice.
+    """
+
+    def __init__(self, lanes: List[Lane], max_concurrency: int, runner: Callable,
+                 breaker: Optional[CircuitBreaker] = None, service: Any = None,
+                 outbox_poll_seconds: float = EMAIL_OUTBOX_POLL_SECONDS, request_wait: float = EMAIL_REQUEST_WAIT):
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        self.max_concurrency = max_concurrency
+        self.slots = PrioritySlots(max_concurrency)
+        self.runner = runner
+        self.breaker = breaker
+        self.service = service
+        self.outbox_poll_seconds = outbox_poll_seconds
+        self.request_wait = request_wait
+        self.outbox = None
+        self._workers: List[asyncio.Task] = []
+        self._active: Set[_Job] = set()
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Start the lane workers on the running loop (called lazily by submit)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._workers = []
+        self.slots = PrioritySlots(self.max_concurrency)
+        for lane in self.lanes.values():
+            lane.queue = asyncio.Queue()
+            for i in range(lane.concurrency):
+                self._workers.append(asyncio.create_task(self._work(lane), name=f"email-{lane.name}-{i}"))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
+
+    def submit(self, lane: str, send: Callable[..., bool], *args) -> asyncio.Future:
+        """Queue ``send(*args)``; the returned future resolves to its result"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.lanes[lane].queue.put_nowait(_Job(lane, send, args, future))
+        email_queue_depth.inc(lane)
+        return future
+
+    async def send(self, lane: str, send: Callable[..., bool], *args) -> Union[bool, str]:
+        """Queue ``send(*args)`` and wait up to ``request_wait`` seconds for the result.
+
+        Returns True or False once it is sent or has failed, or QUEUED when
+        it is still waiting for a free SMTP session and will go out later.
+        Mail that has to wait for its lane's budget, or for SMTP to recover,
+        is QUEUED straight away: the request never waits on either.
+        """
+        future = self.submit(lane, send, *args)
+        if self.breaker is not None and self.breaker.is_open:
+            # Don't wait out the outage; the mail goes out when SMTP recovers
+            return QUEUED
+        budget = self.lanes[lane]
+        if budget.queue.qsize() > budget.bucket.available():
+            # More mail queued in the lane than it may send now, this included
+            return QUEUED
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.request_wait)
+        except asyncio.TimeoutError:
+            return QUEUED
+
+    async def _work(self, lane: Lane):
+        while True:
+            job = await lane.queue.get()
+            email_queue_depth.dec(lane.name)
+            # Until it has a result the job counts as unsent, for drain
+            self._active.add(job)
+            try:
+                if self.breaker is not None:
+                    await self.breaker.wait_until_closed()
+                await lane.bucket.acquire()
+                await self.slots.acquire(lane.priority)
+                try:
+                    lane.last_wait = time.monotonic() - job.enqueued
+                    email_queue_wait_seconds.observe(lane.last_wait, lane.name)
+                    result = await self.runner(job.send, *job.args)
+                finally:
+                    self.slots.release()
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception:
+                logger.exception("Email dispatch failed", extra={"lane": lane.name})
+                result = False
+            self._active.discard(job)
+            deferred = not result and self.breaker is not None and self.breaker.state != CLOSED
+            email_sends_total.inc(lane.name, 'ok' if result else 'deferred' if deferred else 'error')
+            if deferred:
+                # Still going out, so the caller's future waits for the retry
+                lane.queue.put_nowait(job)
+                email_queue_depth.inc(lane.name)
+            elif not job.future.done():
+                job.future.set_result(result)
+
+    def pending(self) -> int:
+        """Emails queued or being sent"""
+        return sum(lane.queue.qsize() for lane in self.lanes.values() if lane.queue) + len(self._active)
+
+    def start_outbox(self, db):
+        """Pick up mail saved by stopped workers, now and every outbox_poll_seconds"""
+        if self.service is None or self._outbox_task is not None:
+            return
+        self.outbox = db.email_outbox
+        self._outbox_task = asyncio.create_task(self._poll_outbox(), name="email-outbox")
+
+    async def _poll_outbox(self):
+        while True:
+            try:
+                await self.restore()
+            except Exception:
+                logger.exception("Could not load saved emails")
+            await asyncio.sleep(self.outbox_poll_seconds)
+
+    async def restore(self) -> int:
+        """Queue every email in the outbox; returns how many"""
+        restored = 0
+        while True:
+            # Deleted as it is claimed, so each saved email goes to one worker
+            saved = await self.outbox.find_one_and_delete({}, sort=[("saved_at", 1)])
+            if saved is None:
+                break
+            send = getattr(self.service, saved["send"], None)
+            if send is None:
+                logger.error("Dropping saved email with an unknown sender", extra={"send": saved["send"]})
+                email_outbox_total.inc(saved["lane"], 'lost')
+                continue
+            # Lanes may have been reconfigured since; unknown ones go first
+            lane = saved["lane"] if saved["lane"] in self.lanes else next(iter(self.lanes))
+            self.submit(lane, send, *saved["args"])
+            email_outbox_total.inc(lane, 'restored')
+            restored += 1
+        if restored:
+            logger.info("Queued saved emails", extra={"count": restored})
+        return restored
+
+    async def drain(self, deadline: float) -> int:
+        """Stop once the lanes are empty or at ``deadline`` (time.monotonic()).
+
+        Emails still unsent then are saved to the outbox; returns how many.
+        """
+        if self._outbox_task is not None:
+            self._outbox_task.cancel()
+            await asyncio.gather(self._outbox_task, return_exceptions=True)
+            self._outbox_task = None
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await self.stop()
+
+        unsent = list(self._active)
+        self._active.clear()
+        for lane in self.lanes.values():
+            while lane.queue is not None and not lane.queue.empty():
+                unsent.append(lane.queue.get_nowait())
+                email_queue_depth.dec(lane.name)
+        saved = 0
+        for job in unsent:
+            saved += await self._save(job)
+        if unsent:
+            logger.warning("Saved unsent emails for the next worker", extra={"saved": saved, "lost": len(unsent) - saved})
+        return saved
+
+    async def _save(self, job: _Job) -> bool:
+        name = getattr(job.send, '__name__', '')
+        # Only service methods can be looked up again by name
+        saveable = self.outbox is not None and getattr(self.service, name, None) == job.send
+        try:
+            if saveable:
+                await self.outbox.insert_one(
+                    {"lane": job.lane, "send": name, "args": list(job.args), "saved_at": datetime.utcnow()})
+        except Exception:
+            logger.exception("Could not save unsent email", extra={"lane": job.lane, "send": name})
+            saveable = False
+        if not saveable:
+            logger.error("Unsent email lost", extra={"lane": job.lane, "send": name})
+            email_outbox_total.inc(job.lane, 'lost')
+            return False
+        email_outbox_total.inc(job.lane, 'saved')
+        return True
+
+    def stats(self) -> dict:
+        return {
+            name: {"queued": lane.queue.qsize() if lane.queue else 0, "last_wait_s": round(lane.last_wait, 3),
+                   "concurrency": lane.concurrency, "per_minute": lane.per_minute}
+            for name, lane in self.lanes.items()
+        }
+
+
+def create_dispatcher(runner: Callable, breaker: Optional[CircuitBreaker] = None, service: Any = None) -> EmailDispatcher:
+    return EmailDispatcher(parse_lanes(EMAIL_LANES), EMAIL_MAX_CONCURRENCY, runner, breaker, service)
+
+
+email_dispatcher = create_dispatcher(email_service.send_async, smtp_breaker, email_service)
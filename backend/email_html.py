@@ -0,0 +1,191 @@
+from collections import Counter
+from functools import lru_cache
+from html import escape
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+import re
+
+# Elements whose surrounding whitespace never renders
+BLOCK_TAGS = {
+    'html', 'head', 'body', 'title', 'meta', 'style', 'div', 'p', 'table', 'thead', 'tbody', 'tfoot',
+    'tr', 'td', 'th', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'br', 'hr', 'center',
+}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'img', 'input', 'link', 'meta', 'hr', 'source', 'wbr'}
+PRESERVE_TAGS = {'pre', 'textarea', 'style', 'script'}
+_WHITESPACE = re.compile(r'[ \t\r\n\f]+')
+
+
+@lru_cache(maxsize=1024)
+def normalize_style(style: str) -> str:
+    """``color: #333; padding: 8px;`` -> ``color:#333;padding:8px``"""
+    if '(' not in style:
+        declarations = style.split(';')
+    else:
+        # Keep semicolons inside url(...) and friends
+        declarations, depth, current = [], 0, ''
+        for char in style:
+            depth += (char == '(') - (char == ')')
+            if char == ';' and depth == 0:
+                declarations.append(current)
+                current = ''
+            else:
+                current += char
+        declarations.append(current)
+    result = []
+    for declaration in declarations:
+        name, _, value = declaration.partition(':')
+        if name.strip() and value.strip():
+            result.append(f"{name.strip().lower()}:{_WHITESPACE.sub(' ', value.strip())}")
+    return ';'.join(result)
+
+
+def _preserves_whitespace(tag: str, attrs: List[Tuple[str, Optional[str]]]) -> bool:
+    if tag in PRESERVE_TAGS:
+        return True
+    style = dict(attrs).get('style') or ''
+    return 'white-space:pre' in normalize_style(style)
+
+
+class _Tokenizer(HTMLParser):
+    """Splits a document into (kind, value) tokens, keeping entities as written"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.tokens: List[tuple] = []
+
+    def handle_starttag(self, tag, attrs):
+        self.tokens.append(('start', tag, attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.tokens.append(('start', tag, attrs))
+
+    def handle_endtag(self, tag):
+        self.tokens.append(('end', tag, None))
+
+    def handle_data(self, data):
+        self.tokens.append(('text', data, None))
+
+    def handle_entityref(self, name):
+        self.tokens.append(('text', f'&{name};', None))
+
+    def handle_charref(self, name):
+        self.tokens.append(('text', f'&#{name};', None))
+
+    def handle_comment(self, data):
+        # Keep conditional comments, Outlook relies on them
+        if data.startswith('[if') or data.endswith('[endif]'):
+            self.tokens.append(('raw', f'<!--{data}-->', None))
+
+    def handle_decl(self, decl):
+        self.tokens.append(('raw', f'<!{decl}>', None))
+
+
+def tokenize(html: str) -> List[tuple]:
+    parser = _Tokenizer()
+    parser.feed(html)
+    parser.close()
+    return parser.tokens
+
+
+def _render_start(tag: str, attrs: List[Tuple[str, Optional[str]]]) -> str:
+    parts = [tag]
+    for name, value in attrs:
+        if value is None:
+            parts.append(name)
+        else:
+            parts.append(f'{name}="{escape(value, quote=True)}"')
+    return f"<{' '.join(parts)}>"
+
+
+def _is_block(token: Optional[tuple]) -> bool:
+    return token is None or (token[0] in ('start', 'end') and token[1] in BLOCK_TAGS) or token[0] == 'raw'
+
+
+def minify_html(html: str) -> str:
+    """Drop source indentation and comments and normalize inline styles.
+
+    Whitespace runs become one space, and disappear next to block-level
+    tags where they could not render. Text inside <pre> or an element
+    styled ``white-space: pre*`` is left exactly as it was.
+    """
+    # Merge text split around entities so each run sits between two tags
+    tokens: List[tuple] = []
+    for kind, value, attrs in tokenize(html):
+        if kind == 'text' and tokens and tokens[-1][0] == 'text':
+            tokens[-1] = ('text', tokens[-1][1] + value, None)
+        elif kind == 'start' and attrs:
+            tokens.append((kind, value, [(n, normalize_style(v) if n == 'style' and v else v) for n, v in attrs]))
+        else:
+            tokens.append((kind, value, attrs))
+
+    out: List[str] = []
+    preserve: List[str] = []
+    for index, (kind, value, attrs) in enumerate(tokens):
+        if kind == 'start':
+            out.append(_render_start(value, attrs))
+            if value not in VOID_TAGS and (preserve or _preserves_whitespace(value, attrs)):
+                preserve.append(value)
+        elif kind == 'end':
+            out.append(f'</{value}>')
+            if value in preserve:
+                while preserve.pop() != value:
+                    pass
+        elif kind == 'raw' or preserve:
+            out.append(value)
+        else:
+            text = _WHITESPACE.sub(' ', value)
+            if _is_block(tokens[index - 1] if index else None):
+                text = text.lstrip(' ')
+            if _is_block(tokens[index + 1] if index + 1 < len(tokens) else None):
+                text = text.rstrip(' ')
+            out.append(text)
+    return ''.join(out)
+
+
+def collapse_styles(html: str, min_repeats: int = 3, prefix: str = 's') -> str:
+    """Move inline styles used at least ``min_repeats`` times into one <style> block.
+
+    Each repeated style becomes a short class (``s0``, ``s1``...). Only use
+    this where the receiving clients honour <style> in <head>: Gmail,
+    Apple Mail and Outlook do; some webmail and older Android clients
+    strip it and would render the affected elements unstyled.
+    """
+    tokens = tokenize(html)
+    counts = Counter(normalize_style(dict(attrs).get('style') or '')
+                     for kind, _, attrs in tokens if kind == 'start' and attrs)
+    counts.pop('', None)
+    classes: Dict[str, str] = {}
+    for style, count in counts.most_common():
+        if count >= min_repeats and len(style) > len(prefix) + 6:
+            classes[style] = f'{prefix}{len(classes)}'
+    if not classes:
+        return html
+
+    sheet = '<style>' + ''.join(f'.{name}{{{style}}}' for style, name in classes.items()) + '</style>'
+    out: List[str] = []
+    has_head = any(kind == 'start' and value == 'head' for kind, value, _ in tokens)
+    has_html = any(kind == 'start' and value == 'html' for kind, value, _ in tokens)
+    if not has_html and not has_head:
+        out.append(sheet)
+    for kind, value, attrs in tokens:
+        if kind == 'start':
+            if attrs:
+                style = normalize_style(dict(attrs).get('style') or '')
+                if style in classes:
+                    existing = dict(attrs).get('class')
+                    attrs = [(n, v) for n, v in attrs if n not in ('style', 'class')]
+                    attrs.append(('class', f'{existing} {classes[style]}' if existing else classes[style]))
+            out.append(_render_start(value, attrs))
+            if value == 'head' or (value == 'html' and not has_head):
+                out.append(sheet if value == 'head' else f'<head>{sheet}</head>')
+        elif kind == 'end':
+            out.append(f'</{value}>')
+        else:
+            out.append(value)
+    return ''.join(out)
+
+
+def compact_html(html: str, style_classes: bool = False) -> str:
+    """What EmailService sends: minified HTML, optionally with repeated styles collapsed"""
+    html = minify_html(html)
+    return collapse_styles(html) if style_classes else html
@@ -1,69 +1,102 @@
+import asyncio
 import smtplib
+from email import charset
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional
+import logging
 import os
 from datetime import datetime
-from pathlib import Path
-from dotenv import load_dotenv
+import env  # noqa: F401  (loads .env before resilience reads SMTP_TIMEOUT)
+from email_html import compact_html
+from metrics import smtp_send_duration_seconds
+from resilience import SMTP_TIMEOUT, smtp_breaker
+from tracing import span
 
-# Load environment variables
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+logger = logging.getLogger(__name__)
+
+# Bodies are mostly ASCII, so quoted-printable keeps them close to their real
+# size; MIMEText's default for utf-8 is base64, a flat third larger
+UTF8_QP = charset.Charset('utf-8')
+UTF8_QP.body_encoding = charset.QP
 
 class EmailService:
     def __init__(self):
-        self.smtp_server = "smtp.gmail.com"
-        self.smtp_port = 587
+        self.smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
+        self.smtp_port = int(os.environ.get('SMTP_PORT', 587))
+        self.smtp_starttls = os.environ.get('SMTP_STARTTLS', 'true').lower() != 'false'
+        self.smtp_timeout = SMTP_TIMEOUT
         self.sender_email = os.environ.get('SENDER_EMAIL', 'noreply@absigns.com')
         self.notification_email = os.environ.get('NOTIFICATION_EMAIL', 'acrylicbraillesigns@gmail.com')
         # For Gmail, you'll need an App Password, not your regular password
         self.sender_password = os.environ.get('SENDER_PASSWORD', '')
+        # Seconds a request waits for one email before reporting it as failed
+        self.send_timeout = float(os.environ.get('EMAIL_SEND_TIMEOUT', 30))
+        # Minify HTML bodies before sending; EMAIL_STYLE_CLASSES also moves
+        # repeated inline styles into a <style> block (see email_html)
+        self.compact_html = os.environ.get('EMAIL_COMPACT_HTML', 'true').lower() != 'false'
+        self.style_classes = os.environ.get('EMAIL_STYLE_CLASSES', 'false').lower() == 'true'
+    
+    async def send_async(self, send: Callable[..., bool], *args, timeout: Optional[float] = None) -> bool:
+        """Run one of the blocking send_* methods in a worker thread without blocking the event loop.
+
+        Returns False if the send fails or takes longer than ``timeout``
+        (EMAIL_SEND_TIMEOUT by default). On timeout the thread is left to
+        finish on its own; only the caller stops waiting.
+        """
+        timeout = self.send_timeout if timeout is None else timeout
+        with span(f"email.{send.__name__}"):
+            try:
+                return await asyncio.wait_for(asyncio.to_thread(send, *args), timeout)
+            except asyncio.TimeoutError:
+                logger.error("Email send timed out", extra={"send": send.__name__, "timeout": timeout})
+            except Exception:
+                logger.exception("Email send failed", extra={"send": send.__name__})
+            return False
+    
+    def build_message(self, to_email: str, subject: str, body_html: str, body_text: str = None) -> MIMEMultipart:
+        """The MIME message send_email delivers"""
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = self.sender_email
+        message["To"] = to_email
+        
+        # Add plain text version if provided
+        if body_text:
+            part1 = MIMEText(body_text, "plain", UTF8_QP)
+            message.attach(part1)
+        
+        # Add HTML version
+        if self.compact_html:
+            body_html = compact_html(body_html, self.style_classes)
+        part2 = MIMEText(body_html, "html", UTF8_QP)
+        message.attach(part2)
+        return message
     
     def send_email(self, to_email: str, subject: str, body_html: str, body_text: str = None):
         """Send an email with HTML and optional plain text content"""
         try:
-            # Log email content for debugging
-            print(f"\n{'='*80}")
-            print(f"📧 EMAIL NOTIFICATION")
-            print(f"{'='*80}")
-            print(f"To: {to_email}")
-            print(f"Subject: {subject}")
-            print(f"{'='*80}")
-            if body_text:
-                print(body_text)
-            print(f"{'='*80}\n")
-            
             # If no password is set, skip SMTP sending (for testing)
             if not self.sender_password:
-                print("⚠️  SMTP password not configured - Email logged but not sent")
-                print(f"📝 Email would be sent to: {to_email}")
+                logger.info("Email not sent: SMTP password not configured", extra={"to": to_email, "subject": subject})
+                logger.debug("Email body", extra={"to": to_email, "body_text": body_text})
                 return True
             
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = self.sender_email
-            message["To"] = to_email
-            
-            # Add plain text version if provided
-            if body_text:
-                part1 = MIMEText(body_text, "plain")
-                message.attach(part1)
-            
-            # Add HTML version
-            part2 = MIMEText(body_html, "html")
-            message.attach(part2)
+            message = self.build_message(to_email, subject, body_html, body_text)
             
             # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.sendmail(self.sender_email, to_email, message.as_string())
+            with smtp_send_duration_seconds.time(), span("smtp.send", to_domain=to_email.rpartition('@')[2]), \
+                    smtp_breaker.guard():
+                with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.smtp_timeout) as server:
+                    if self.smtp_starttls:
+                        server.starttls()
+                    server.login(self.sender_email, self.sender_password)
+                    server.sendmail(self.sender_email, to_email, message.as_string())
             
-            print("✅ Email sent successfully via SMTP")
+            logger.info("Email sent", extra={"to": to_email, "subject": subject})
             return True
         except Exception as e:
-            print(f"❌ Error sending email: {str(e)}")
+            logger.error("Error sending email", extra={"to": to_email, "subject": subject, "error": str(e)})
             return False
     
     def send_contact_form_notification(self, form_data: Dict[str, Any]):
@@ -585,9 +618,87 @@ NOTE: Customer is now at payment page.
             return self.send_email(self.notification_email, subject, body_html, body_text)
             
         except Exception as e:
-            print(f"❌ Error sending pre-order notification: {str(e)}")
+            logger.exception("Error sending pre-order notification")
             return False
     
+    def send_business_digest(self, contacts: List[Dict[str, Any]], pre_orders: List[Dict[str, Any]],
+                             since: datetime, until: datetime) -> bool:
+        """Send one summary of the contact forms and pre-orders received between ``since`` and ``until``"""
+        window = f"{since.strftime('%b %d, %H:%M')} - {until.strftime('%b %d, %H:%M')} UTC"
+        subject = f"📬 {len(contacts)} contact / {len(pre_orders)} pre-order notifications ({window})"
+
+        contacts_html = ""
+        contacts_text = ""
+        for form in contacts:
+            received = form['timestamp'].strftime('%H:%M') if form.get('timestamp') else ''
+            is_quote_request = 'Custom Quote Request' in (form.get('subject') or '')
+            contacts_html += f"""
+                <tr style="border-bottom: 1px solid #e5e7eb;">
+                  <td style="padding: 8px; vertical-align: top; white-space: nowrap;">{received}</td>
+                  <td style="padding: 8px; vertical-align: top;">
+                    <strong>{form.get('name', 'N/A')}</strong>{' (quote request)' if is_quote_request else ''}<br>
+                    {form.get('email', 'N/A')} {form.get('phone') or ''}<br>
+                    <em>{form.get('subject') or ''}</em>
+                    <div style="white-space: pre-wrap; color: #555;">{form.get('message', '')}</div>
+                  </td>
+                </tr>
+            """
+            contacts_text += (f"{received} {form.get('name', 'N/A')} <{form.get('email', 'N/A')}> "
+                              f"{form.get('subject') or ''}\n{form.get('message', '')}\n\n")
+
+        pre_orders_html = ""
+        pre_orders_text = ""
+        for order in pre_orders:
+            received = order['created_at'].strftime('%H:%M') if order.get('created_at') else ''
+            items = ", ".join(f"{item.get('name', 'Unknown')} x{item.get('quantity', 1)}"
+                              for item in order.get('cart_items', []))
+            amount = f"${order.get('amount', 0):.2f} {order.get('currency', 'CAD').upper()}"
+            pre_orders_html += f"""
+                <tr style="border-bottom: 1px solid #e5e7eb;">
+                  <td style="padding: 8px; vertical-align: top; white-space: nowrap;">{received}</td>
+                  <td style="padding: 8px; vertical-align: top;">
+                    <strong>{order.get('customer_name', 'N/A')}</strong> - {order.get('customer_email', 'N/A')}<br>
+                    {items}
+                  </td>
+                  <td style="padding: 8px; vertical-align: top; text-align: right; white-space: nowrap;">
+                    {amount}<br><span style="font-size: 12px; color: #6b7280;">{order.get('payment_status', 'initiated')}</span>
+                  </td>
+                </tr>
+            """
+            pre_orders_text += (f"{received} {order.get('customer_name', 'N/A')} <{order.get('customer_email', 'N/A')}> "
+                                f"{amount} [{order.get('payment_status', 'initiated')}] {items}\n")
+
+        body_html = f"""
+        <html>
+          <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px;">
+              <h2 style="color: #2563eb; border-bottom: 2px solid #2563eb; padding-bottom: 10px;">
+                Notification digest
+              </h2>
+              <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0;">
+                <p><strong>Period:</strong> {window}</p>
+              </div>
+              {f'''<h3 style="color: #1e40af;">Contact Form Submissions ({len(contacts)})</h3>
+              <table style="width: 100%; border-collapse: collapse;">{contacts_html}</table>''' if contacts else ''}
+              {f'''<h3 style="color: #1e40af;">Pre-orders ({len(pre_orders)})</h3>
+              <table style="width: 100%; border-collapse: collapse;">{pre_orders_html}</table>''' if pre_orders else ''}
+              <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; font-size: 12px; color: #666;">
+                <p>Paid orders are still sent individually as they complete.</p>
+              </div>
+            </div>
+          </body>
+        </html>
+        """
+
+        body_text = f"""Notification digest ({window})
+
+Contact form submissions ({len(contacts)}):
+{contacts_text}
+Pre-orders ({len(pre_orders)}):
+{pre_orders_text}"""
+
+        return self.send_email(self.notification_email, subject, body_html, body_text)
+
     def send_order_complete_notification(self, order_data: Dict[str, Any]) -> bool:
         """Send order complete email after successful payment"""
         try:
@@ -734,7 +845,7 @@ NOTE: Customer is now at payment page.
             return True
             
         except Exception as e:
-            print(f"❌ Error sending order complete notification: {str(e)}")
+            logger.exception("Error sending order complete notification")
             return False
 
 # Create a singleton instance
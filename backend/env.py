@@ -0,0 +1,14 @@
+"""
+Loads backend/.env into the environment, once
+
+Modules read their settings from os.environ at import time, so every
+module that does (directly or through its imports) imports this first;
+Python's module cache makes the load happen a single time per process.
+"""
+
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+
+load_dotenv(ROOT_DIR / '.env')
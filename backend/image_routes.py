@@ -0,0 +1,237 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import env  # noqa: F401  (loads .env before the IMAGE_* settings are read)
+
+# Pillow is optional - without it /img serves the original file untouched
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover
+    Image = None
+    features = None
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = Path(__file__).parent
+FRONTEND_DIR = ROOT_DIR.parent / 'frontend'
+
+logger = logging.getLogger(__name__)
+
+image_router = APIRouter(prefix="/img", tags=["images"])
+
+# Where source images are looked up, in order
+IMAGE_SOURCE_DIRS = [
+    Path(p) for p in os.environ.get('IMAGE_SOURCE_DIRS', '').split(os.pathsep) if p
+] or [FRONTEND_DIR / 'dist' / 'lovable-uploads', FRONTEND_DIR / 'public' / 'lovable-uploads']
+
+IMAGE_CACHE_DIR = Path(os.environ.get('IMAGE_CACHE_DIR', ROOT_DIR / '.image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+# Requested widths and qualities are rounded up to one of these so the
+# cache stays small
+ALLOWED_WIDTHS = [64, 128, 200, 256, 320, 400, 480, 640, 768, 960, 1200, 1600, 2048]
+ALLOWED_QUALITIES = [30, 50, 65, 80, 90, 95]
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'avif': ('AVIF', 'image/avif'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+
+def _round_up(value: int, allowed: list) -> int:
+    """The smallest allowed value >= ``value``, or the largest one"""
+    return allowed[min(bisect.bisect_left(allowed, value), len(allowed) - 1)]
+
+
+def _format_supported(fmt: str) -> bool:
+    if Image is None:
+        return False
+    if fmt in ('webp', 'avif'):
+        return bool(features.check(fmt))
+    return True
+
+
+def _transform(source: str, target: str, width: int, fmt: str, quality: int):
+    """Resize and transcode one image. Runs in the process pool."""
+    with Image.open(source) as img:
+        img.load()
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        pil_format = FORMATS[fmt][0]
+        if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        options = {'optimize': True} if pil_format in ('JPEG', 'PNG') else {}
+        if pil_format != 'PNG':
+            options['quality'] = quality
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, pil_format, **options)
+    os.replace(tmp, target)
+
+
+class ImageCache:
+    """Content-addressed disk cache of transformed images with LRU eviction.
+
+    Entries are named by a hash of the source bytes and the transform
+    parameters. Hits bump the file mtime, and when the total size passes
+    ``max_bytes`` the least recently used files are removed.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, workers: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.total_bytes: Optional[int] = None
+        self._pool: Optional['ProcessPoolExecutor'] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._source_digests: Dict[Tuple[str, int, int], str] = {}
+
+    @property
+    def pool(self) -> 'ProcessPoolExecutor':
+        if self._pool is None:
+            # Imported here: multiprocessing is a noticeable part of cold start
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def source_digest(self, source: Path) -> str:
+        stat = source.stat()
+        key = (str(source), stat.st_mtime_ns, stat.st_size)
+        digest = self._source_digests.get(key)
+        if digest is None:
+            with open(source, 'rb') as f:
+                digest = hashlib.file_digest(f, 'blake2b').hexdigest()[:32]
+            self._source_digests[key] = digest
+        return digest
+
+    def path_for(self, key: str, fmt: str) -> Path:
+        return self.directory / key[:2] / f"{key}.{fmt}"
+
+    async def get(self, source: Path, width: int, fmt: str, quality: int) -> Tuple[Path, str]:
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, self.source_digest, source)
+        key = hashlib.blake2b(f"{digest}:{width}:{fmt}:{quality}".encode(), digest_size=16).hexdigest()
+        target = self.path_for(key, fmt)
+
+        try:
+            os.utime(target)
+            return target, key
+        except FileNotFoundError:
+            pass
+
+        # Concurrent requests for the same variant share one transform
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._produce(source, target, width, fmt, quality))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(task)
+        return target, key
+
+    async def _produce(self, source: Path, target: Path, width: int, fmt: str, quality: int):
+        loop = asyncio.get_running_loop()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        await loop.run_in_executor(self.pool, _transform, str(source), str(target), width, fmt, quality)
+        await loop.run_in_executor(None, self._account, target)
+
+    def _account(self, added: Path):
+        if self.total_bytes is None:
+            self.total_bytes = sum(p.stat().st_size for p in self.directory.rglob('*.*') if p.is_file())
+        else:
+            self.total_bytes += added.stat().st_size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until we are at 90% of the budget"""
+        entries = []
+        for p in self.directory.rglob('*.*'):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        goal = self.max_bytes * 0.9
+        for _, size, p in entries:
+            if total <= goal:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+        self.total_bytes = total
+        logger.info("Image cache evicted", extra={"total_bytes": total})
+
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_WORKERS)
+
+
+def find_source(name: str) -> Optional[Path]:
+    if '/' in name or '\\' in name or name.startswith('.'):
+        return None
+    for directory in IMAGE_SOURCE_DIRS:
+        candidate = directory / name
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def pick_format(fmt: str, accept: str) -> Optional[str]:
+    if fmt == 'auto':
+        for candidate in ('avif', 'webp'):
+            if f"image/{candidate}" in accept and _format_supported(candidate):
+                return candidate
+        return None
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    return fmt if _format_supported(fmt) else 'webp' if _format_supported('webp') else None
+
+
+@image_router.get("/{name}")
+async def get_image(name: str, request: Request, w: Optional[int] = None, fmt: str = 'auto', q: int = 80):
+    """Serve a resized / transcoded product image, transforming it on first request"""
+    source = find_source(name)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {'Vary': 'Accept'} if fmt == 'auto' else {}
+    target_format = pick_format(fmt, request.headers.get('accept', ''))
+    if Image is None or (target_format is None and w is None):
+        return FileResponse(source, headers=headers)
+
+    if target_format is None:
+        target_format = source.suffix.lstrip('.').lower().replace('jpg', 'jpeg')
+        if target_format not in FORMATS:
+            return FileResponse(source, headers=headers)
+
+    width = ALLOWED_WIDTHS[-1] if w is None else _round_up(max(w, 1), ALLOWED_WIDTHS)
+    # PNG is lossless, so q would only multiply identical cache entries
+    quality = 0 if target_format == 'png' else _round_up(q, ALLOWED_QUALITIES)
+
+    try:
+        path, key = await image_cache.get(source, width, target_format, quality)
+    except Exception:
+        logger.exception("Error transforming image, serving the original",
+                         extra={"image": name, "width": width, "format": target_format})
+        return FileResponse(source, headers=headers)
+
+    headers['ETag'] = f'"{key}"'
+    return FileResponse(path, media_type=FORMATS[target_format][1], headers=headers)
@@ -0,0 +1,348 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from fastapi import APIRouter
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Sequence, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import env  # noqa: F401  (loads .env before METRICS_MULTIPROC_DIR is read)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# With several uvicorn workers each one writes its snapshot here and
+# /metrics merges them all
+MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+_LABEL_SEP = '\x1f'
+
+
+class _Metric:
+    """Base for metrics whose values live in per-thread shards.
+
+    Each thread only ever writes to its own dict, so recording a value takes
+    no lock; a scrape sums the shards. The lock is only taken the first time
+    a thread touches the metric.
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            with self._shards_lock:
+                self._shards.append(values)
+            self._local.values = values
+            return values
+
+    def _check(self, labels: tuple):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+
+    def samples(self) -> dict:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        value = shard.get(labels)
+        if value is None:
+            self._check(labels)
+            value = 0
+        shard[labels] = value + amount
+
+    def samples(self) -> Dict[tuple, float]:
+        totals: Dict[tuple, float] = {}
+        for shard in list(self._shards):
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+
+class Gauge(Counter):
+    """Up/down value, e.g. in-flight requests. Per-thread deltas are summed."""
+
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            self._check(labels)
+            # [per-bucket counts (last is +Inf), sum, count]
+            entry = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> Dict[tuple, list]:
+        totals: Dict[tuple, list] = {}
+        for shard in list(self._shards):
+            for labels, (counts, total, count) in list(shard.items()):
+                merged = totals.get(labels)
+                if merged is None:
+                    totals[labels] = [list(counts), total, count]
+                else:
+                    merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                    merged[1] += total
+                    merged[2] += count
+        return totals
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of a block; an ``outcome`` label (ok/error) is appended"""
+        start = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            self.observe(time.perf_counter() - start, *labels, outcome)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self) -> dict:
+        """JSON-safe view of every metric in this process"""
+        snapshot = {}
+        for metric in self.metrics.values():
+            entry = {'type': metric.kind, 'help': metric.documentation, 'labelnames': list(metric.labelnames),
+                     'samples': {_LABEL_SEP.join(k): v for k, v in metric.samples().items()}}
+            if isinstance(metric, Histogram):
+                entry['buckets'] = list(metric.buckets)
+            snapshot[metric.name] = entry
+        return snapshot
+
+
+REGISTRY = Registry()
+
+
+def merge_snapshots(snapshots: List[Tuple[dict, bool]]) -> dict:
+    """Sum snapshots from several processes; gauges of dead processes are dropped"""
+    merged: dict = {}
+    for snapshot, alive in snapshots:
+        for name, entry in snapshot.items():
+            if entry['type'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, {**entry, 'samples': {}})
+            samples = target['samples']
+            for key, value in entry['samples'].items():
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = value
+                elif entry['type'] == 'histogram':
+                    samples[key] = [[a + b for a, b in zip(current[0], value[0])],
+                                    current[1] + value[1], current[2] + value[2]]
+                else:
+                    samples[key] = current + value
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition format 0.0.4"""
+    lines = []
+    for name in sorted(snapshot):
+        entry = snapshot[name]
+        names = entry['labelnames']
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for key, value in sorted(entry['samples'].items()):
+            values = key.split(_LABEL_SEP) if names else []
+            if entry['type'] == 'histogram':
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(entry['buckets']) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{name}_bucket{_format_labels(names, values, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, values)} {total}")
+                lines.append(f"{name}_count{_format_labels(names, values)} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(names, values)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# Multiprocess aggregation
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_snapshot(directory: str = None):
+    directory = directory or MULTIPROC_DIR
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def collect() -> str:
+    if not MULTIPROC_DIR:
+        return render(REGISTRY.snapshot())
+
+    write_snapshot()
+    snapshots = []
+    for filename in os.listdir(MULTIPROC_DIR):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(MULTIPROC_DIR, filename)) as f:
+                snapshots.append((json.load(f), _pid_alive(int(filename[:-5]))))
+        except (OSError, ValueError):
+            continue
+    return render(merge_snapshots(snapshots))
+
+
+async def flush_periodically():
+    """Keep this worker's snapshot file fresh so any worker can answer /metrics"""
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    while True:
+        try:
+            await run_in_threadpool(write_snapshot)
+        except Exception:
+            logger.exception("Error writing metrics snapshot")
+        await asyncio.sleep(FLUSH_INTERVAL)
+
+
+# Application metrics
+
+http_requests_total = Counter(
+    'http_requests_total', 'HTTP requests by route template and status', ('method', 'route', 'status'))
+http_request_duration_seconds = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ('method', 'route'))
+http_requests_in_flight = Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled')
+mongo_command_duration_seconds = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency', ('command', 'outcome'))
+smtp_send_duration_seconds = Histogram(
+    'smtp_send_duration_seconds', 'Time spent sending one email over SMTP', ('outcome',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+stripe_call_duration_seconds = Histogram(
+    'stripe_call_duration_seconds', 'Stripe API call latency', ('operation', 'outcome'),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+def mongo_command_listener():
+    """pymongo command listener feeding mongo_command_duration_seconds.
+
+    Built on demand with the Mongo client so that importing metrics does
+    not import pymongo.
+    """
+    from pymongo import monitoring
+
+    class MongoCommandMetrics(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            mongo_command_duration_seconds.observe(event.duration_micros / 1e6, event.command_name, 'ok')
+
+        def failed(self, event):
+            mongo_command_duration_seconds.observe(event.duration_micros / 1e6, event.command_name, 'error')
+
+    return MongoCommandMetrics()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request counts, latency and in-flight requests.
+
+    Requests are labelled by the matched route template (``/api/reviews/{product_id}``)
+    so path parameters do not explode the label space.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get('route')
+            template = route.path if route is not None else ('static' if 'endpoint' in scope else 'unmatched')
+            http_request_duration_seconds.observe(elapsed, scope['method'], template)
+            http_requests_total.inc(scope['method'], template, str(status))
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    body = await run_in_threadpool(collect) if MULTIPROC_DIR else collect()
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
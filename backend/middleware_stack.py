@@ -0,0 +1,144 @@
+from starlette.middleware.cors import CORSMiddleware
+from typing import Dict, Iterable, Optional
+import os
+import time
+import env  # noqa: F401  (loads .env before COMPRESSION_MIN_SIZE is read)
+from admission import AdmissionMiddleware
+from cache_policy import CacheHeadersMiddleware
+from compression import CompressionMiddleware
+from logging_config import RequestIdMiddleware
+from metrics import MetricsMiddleware
+from tracing import TracingMiddleware
+from profiling import ProfilingMiddleware
+
+
+# Middleware layers, innermost first. Every layer is a pure ASGI app so none
+# of them buffers the response body or spawns a task per request.
+LAYERS = [
+    # Per-request cProfile output for admins (X-Profile: 1)
+    ("profiling", ProfilingMiddleware, {}),
+    # br / zstd / gzip compression with a cache of compressed bodies
+    ("compression", CompressionMiddleware, {"minimum_size": int(os.environ.get("COMPRESSION_MIN_SIZE", 1000))}),
+    # Concurrency limits per route class, 503 + Retry-After when saturated
+    # (inside CORS so browsers can read the 503)
+    ("admission", AdmissionMiddleware, {}),
+    # CORS - Allow all origins for preview environment
+    ("cors", CORSMiddleware, {
+        "allow_credentials": True,
+        "allow_origins": ["*"],  # Allow all origins for Emergent preview
+        "allow_methods": ["*"],
+        "allow_headers": ["*"],
+    }),
+    # Cache headers for static assets and API responses
+    ("cache_headers", CacheHeadersMiddleware, {}),
+    # Request counts, latency per route template and in-flight requests
+    ("metrics", MetricsMiddleware, {}),
+    # Sampled request traces with Mongo / SMTP / Stripe spans
+    ("tracing", TracingMiddleware, {}),
+    # Request IDs for log correlation (outermost so every layer logs with it)
+    ("request_id", RequestIdMiddleware, {}),
+]
+
+LAYER_NAMES = [name for name, _, _ in LAYERS]
+
+
+class LayerTimings:
+    """Per-process totals of the nanoseconds spent inside each layer"""
+
+    def __init__(self):
+        self._stats: Dict[str, list] = {}
+
+    def record(self, name: str, elapsed_ns: int):
+        stats = self._stats.get(name)
+        if stats is None:
+            self._stats[name] = [1, elapsed_ns, elapsed_ns]
+            return
+        stats[0] += 1
+        stats[1] += elapsed_ns
+        if elapsed_ns > stats[2]:
+            stats[2] = elapsed_ns
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {
+                "count": count,
+                "total_ns": total,
+                "avg_ns": total // count,
+                "max_ns": max_ns,
+            }
+            for name, (count, total, max_ns) in self._stats.items()
+        }
+
+    def reset(self):
+        self._stats.clear()
+
+
+layer_timings = LayerTimings()
+
+
+class _InnerProbe:
+    """Sits between a timed layer and the app it wraps to subtract downstream time"""
+
+    def __init__(self, app, name: str):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope, receive, send):
+        start = time.perf_counter_ns()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            inner = scope.setdefault("layer_inner_ns", {})
+            inner[self.name] = inner.get(self.name, 0) + time.perf_counter_ns() - start
+
+
+class TimedLayer:
+    """Wraps one middleware class and records its own (exclusive) time per request"""
+
+    def __init__(self, app, name: str, layer, options: dict, timings: LayerTimings = layer_timings):
+        self.name = name
+        self.timings = timings
+        self.layer = layer(_InnerProbe(app, name), **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.layer(scope, receive, send)
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            await self.layer(scope, receive, send)
+        finally:
+            total = time.perf_counter_ns() - start
+            inner = scope.get("layer_inner_ns", {}).get(self.name, 0)
+            self.timings.record(self.name, total - inner)
+
+
+def _env_list(name: str) -> list:
+    return [item.strip() for item in os.environ.get(name, "").split(",") if item.strip()]
+
+
+def install_middleware(app, disabled: Optional[Iterable[str]] = None, timing: Optional[bool] = None):
+    """Add the middleware layers to ``app``.
+
+    ``disabled`` names layers to leave out (defaults to MIDDLEWARE_DISABLED,
+    comma separated) and ``timing`` wraps each layer in TimedLayer (defaults
+    to MIDDLEWARE_TIMING).
+    """
+    if disabled is None:
+        disabled = _env_list("MIDDLEWARE_DISABLED")
+    if timing is None:
+        timing = os.environ.get("MIDDLEWARE_TIMING", "").lower() in ("1", "true", "yes")
+
+    disabled = set(disabled)
+    unknown = disabled - set(LAYER_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown middleware layers: {', '.join(sorted(unknown))}")
+
+    for name, layer, options in LAYERS:
+        if name in disabled:
+            continue
+        if timing:
+            app.add_middleware(TimedLayer, name=name, layer=layer, options=options)
+        else:
+            app.add_middleware(layer, **options)
@@ -1,34 +1,27 @@
 from fastapi import APIRouter, HTTPException, Request, Header
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
-from motor.motor_asyncio import AsyncIOMotorClient
-from emergentintegrations.payments.stripe.checkout import (
-    StripeCheckout,
-    CheckoutSessionResponse,
-    CheckoutStatusResponse,
-    CheckoutSessionRequest
-)
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Union
+import asyncio
 import os
-from dotenv import load_dotenv
 from datetime import datetime
 import logging
-from email_service import EmailService
+import env  # noqa: F401  (loads .env before STRIPE_API_KEY is read)
+from admin_auth import require_admin
+from database import db
+from email_service import email_service
+from email_dispatcher import email_dispatcher
+from email_digest import business_digest
+from metrics import stripe_call_duration_seconds
+from resilience import STRIPE_TIMEOUT, CircuitOpenError, stripe_breaker
+from tracing import span
 
-load_dotenv()
-
-# Initialize email service
-email_service = EmailService()
+if TYPE_CHECKING:
+    from emergentintegrations.payments.stripe.checkout import CheckoutSessionResponse, CheckoutStatusResponse
 
 # Initialize router
 payment_router = APIRouter(prefix="/api/payments", tags=["payments"])
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-db_name = os.environ.get('DB_NAME')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-payment_transactions = db['payment_transactions']
-
 # Stripe API Key
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
 
@@ -54,6 +47,59 @@ class PaymentMethodRequest(BaseModel):
     payment_method: str = Field(..., description="Payment method: 'stripe' or 'paypal'")
 
 
+class OrderItemSummary(BaseModel):
+    name: Optional[str] = None
+    quantity: Optional[int] = None
+    price: Optional[Any] = None
+
+
+class OrderSummary(BaseModel):
+    """What the order confirmation page shows; no addresses or metadata"""
+    session_id: str
+    status: Optional[str] = None
+    payment_status: Optional[str] = None
+    amount: Optional[float] = None
+    currency: Optional[str] = None
+    customer_name: Optional[str] = None
+    customer_email: Optional[str] = None
+    cart_items: List[OrderItemSummary] = []
+    created_at: Optional[datetime] = None
+
+
+class OrderDetails(OrderSummary):
+    cart_items: List[Dict[str, Any]] = []
+    shipping_address: Dict[str, str] = {}
+    billing_address: Dict[str, str] = {}
+    metadata: Dict[str, str] = {}
+    updated_at: Optional[datetime] = None
+
+
+# Mongo projections per view, so only the fields a view returns are read
+ORDER_VIEWS = {
+    "summary": (OrderSummary, {
+        "_id": 0, "session_id": 1, "status": 1, "payment_status": 1, "amount": 1, "currency": 1,
+        "customer_name": 1, "customer_email": 1, "created_at": 1,
+        "cart_items.name": 1, "cart_items.quantity": 1, "cart_items.price": 1,
+    }),
+    "full": (OrderDetails, {"_id": 0, **{name: 1 for name in OrderDetails.model_fields}}),
+}
+
+
+def stripe_unavailable(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when Stripe will be tried again"""
+    return HTTPException(
+        status_code=503,
+        detail="Payment provider temporarily unavailable, please try again shortly",
+        headers={"Retry-After": str(max(1, round(error.retry_after)))},
+    )
+
+
+def stripe_checkout_client(webhook_url: str):
+    """A StripeCheckout; the Stripe SDK is only imported once a payment route needs it"""
+    from emergentintegrations.payments.stripe.checkout import StripeCheckout
+    return StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+
+
 @payment_router.post("/create-checkout-session")
 async def create_checkout_session(payment_request: PaymentRequest):
     """Create a Stripe checkout session for the cart"""
@@ -64,7 +110,7 @@ async def create_checkout_session(payment_request: PaymentRequest):
         # Initialize Stripe Checkout
         host_url = payment_request.host_url
         webhook_url = f"{host_url}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+        stripe_checkout = stripe_checkout_client(webhook_url)
         
         # Create success and cancel URLs
         success_url = f"{host_url}/order-confirmation?session_id={{CHECKOUT_SESSION_ID}}"
@@ -83,6 +129,7 @@ async def create_checkout_session(payment_request: PaymentRequest):
         }
         
         # Create checkout session request with correct currency
+        from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
         checkout_request = CheckoutSessionRequest(
             amount=total_amount,
             currency=payment_request.currency.lower(),
@@ -92,7 +139,9 @@ async def create_checkout_session(payment_request: PaymentRequest):
         )
         
         # Create session
-        session: CheckoutSessionResponse = await stripe_checkout.create_checkout_session(checkout_request)
+        with stripe_call_duration_seconds.time("create_checkout_session"), span("stripe.create_checkout_session"):
+            session: CheckoutSessionResponse = await stripe_breaker.call(
+                stripe_checkout.create_checkout_session, checkout_request, timeout=STRIPE_TIMEOUT)
         
         # Store transaction in database
         transaction_data = {
@@ -111,37 +160,44 @@ async def create_checkout_session(payment_request: PaymentRequest):
             "updated_at": datetime.utcnow()
         }
         
-        await payment_transactions.insert_one(transaction_data)
+        await db.payment_transactions.insert_one(transaction_data)
         
-        logger.info(f"✅ Created checkout session: {session.session_id}")
+        logger.info("Created checkout session", extra={"session_id": session.session_id})
         
-        # Send pre-order email notification
-        try:
-            pre_order_data = {
-                "customer_name": payment_request.customer_name,
-                "customer_email": payment_request.customer_email,
-                "cart_items": payment_request.cart_items,
-                "shipping_address": payment_request.shipping_address,
-                "subtotal": payment_request.subtotal,
-                "tax": payment_request.tax,
-                "shipping": payment_request.shipping,
-                "total": payment_request.total,
-                "currency": payment_request.currency,
-                "session_id": session.session_id
-            }
-            email_service.send_pre_order_notification(pre_order_data)
-            logger.info("✅ Pre-order email sent")
-        except Exception as email_error:
-            logger.error(f"⚠️ Pre-order email failed: {str(email_error)}")
-            # Don't fail the checkout if email fails
+        # Send pre-order email notification (in digest mode the next digest
+        # lists it from payment_transactions instead)
+        if not business_digest.enabled:
+            try:
+                pre_order_data = {
+                    "customer_name": payment_request.customer_name,
+                    "customer_email": payment_request.customer_email,
+                    "cart_items": payment_request.cart_items,
+                    "shipping_address": payment_request.shipping_address,
+                    "subtotal": payment_request.subtotal,
+                    "tax": payment_request.tax,
+                    "shipping": payment_request.shipping,
+                    "total": payment_request.total,
+                    "currency": payment_request.currency,
+                    "session_id": session.session_id
+                }
+                email_dispatcher.submit("notifications", email_service.send_pre_order_notification, pre_order_data)
+                logger.info("Pre-order email queued")
+            except Exception:
+                logger.exception("Pre-order email failed")
+                # Don't fail the checkout if email fails
         
         return {
             "url": session.url,
             "session_id": session.session_id
         }
         
+    except CircuitOpenError as e:
+        raise stripe_unavailable(e)
+    except asyncio.TimeoutError:
+        logger.error("Stripe call timed out", extra={"timeout": STRIPE_TIMEOUT})
+        raise HTTPException(status_code=504, detail="Payment provider timed out, please try again")
     except Exception as e:
-        logger.error(f"❌ Error creating checkout session: {str(e)}")
+        logger.exception("Error creating checkout session")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -152,13 +208,15 @@ async def get_checkout_status(session_id: str, request: Request):
         # Initialize Stripe Checkout
         host_url = str(request.base_url).rstrip('/')
         webhook_url = f"{host_url}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+        stripe_checkout = stripe_checkout_client(webhook_url)
         
         # Get checkout status from Stripe
-        checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
+        with stripe_call_duration_seconds.time("get_checkout_status"), span("stripe.get_checkout_status"):
+            checkout_status: CheckoutStatusResponse = await stripe_breaker.call(
+                stripe_checkout.get_checkout_status, session_id, timeout=STRIPE_TIMEOUT)
         
         # Update transaction in database
-        existing_transaction = await payment_transactions.find_one({"session_id": session_id})
+        existing_transaction = await db.payment_transactions.find_one({"session_id": session_id})
         
         if existing_transaction:
             # Only update if payment_status has changed to avoid duplicate processing
@@ -169,12 +227,13 @@ async def get_checkout_status(session_id: str, request: Request):
                     "updated_at": datetime.utcnow()
                 }
                 
-                await payment_transactions.update_one(
+                await db.payment_transactions.update_one(
                     {"session_id": session_id},
                     {"$set": update_data}
                 )
                 
-                logger.info(f"✅ Updated payment status for session {session_id}: {checkout_status.payment_status}")
+                logger.info("Updated payment status",
+                            extra={"session_id": session_id, "payment_status": checkout_status.payment_status})
                 
                 # Send order complete email if payment is successful
                 if checkout_status.payment_status == "paid":
@@ -191,10 +250,12 @@ async def get_checkout_status(session_id: str, request: Request):
                             "currency": checkout_status.currency.upper(),
                             "session_id": session_id
                         }
-                        email_service.send_order_complete_notification(order_complete_data)
-                        logger.info("✅ Order complete email sent")
-                    except Exception as email_error:
-                        logger.error(f"⚠️ Order complete email failed: {str(email_error)}")
+                        email_dispatcher.submit(
+                            "transactional", email_service.send_order_complete_notification, order_complete_data
+                        )
+                        logger.info("Order complete email queued")
+                    except Exception:
+                        logger.exception("Order complete email failed")
         
         return {
             "status": checkout_status.status,
@@ -204,8 +265,13 @@ async def get_checkout_status(session_id: str, request: Request):
             "metadata": checkout_status.metadata
         }
         
+    except CircuitOpenError as e:
+        raise stripe_unavailable(e)
+    except asyncio.TimeoutError:
+        logger.error("Stripe call timed out", extra={"timeout": STRIPE_TIMEOUT})
+        raise HTTPException(status_code=504, detail="Payment provider timed out, please try again")
     except Exception as e:
-        logger.error(f"❌ Error getting checkout status: {str(e)}")
+        logger.exception("Error getting checkout status")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -220,14 +286,15 @@ async def stripe_webhook(request: Request):
         # Initialize Stripe Checkout
         host_url = str(request.base_url).rstrip('/')
         webhook_url = f"{host_url}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+        stripe_checkout = stripe_checkout_client(webhook_url)
         
         # Handle webhook
-        webhook_response = await stripe_checkout.handle_webhook(body, signature)
+        with stripe_call_duration_seconds.time("handle_webhook"), span("stripe.handle_webhook"):
+            webhook_response = await asyncio.wait_for(stripe_checkout.handle_webhook(body, signature), STRIPE_TIMEOUT)
         
         # Update transaction based on webhook event
         if webhook_response.event_type == "checkout.session.completed":
-            await payment_transactions.update_one(
+            await db.payment_transactions.update_one(
                 {"session_id": webhook_response.session_id},
                 {
                     "$set": {
@@ -236,31 +303,34 @@ async def stripe_webhook(request: Request):
                     }
                 }
             )
-            logger.info(f"✅ Webhook processed for session {webhook_response.session_id}")
+            logger.info("Webhook processed", extra={"session_id": webhook_response.session_id})
         
         return {"status": "success"}
         
     except Exception as e:
-        logger.error(f"❌ Error processing webhook: {str(e)}")
+        logger.exception("Error processing webhook")
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@payment_router.get("/order/{session_id}")
-async def get_order_details(session_id: str):
-    """Get order details by session ID"""
+@payment_router.get("/order/{session_id}", response_model=Union[OrderSummary, OrderDetails])
+async def get_order_details(session_id: str, view: Literal["summary", "full"] = "summary",
+                            x_admin_token: Optional[str] = Header(None)):
+    """Get order details by session ID (``view=full`` adds addresses, metadata and full cart items, admin only)"""
+    if view == "full":
+        # The session ID is in the customer's redirect URL; it must not unlock their addresses
+        await require_admin(x_admin_token)
     try:
-        transaction = await payment_transactions.find_one({"session_id": session_id})
+        model, projection = ORDER_VIEWS[view]
+        transaction = await db.payment_transactions.find_one({"session_id": session_id}, projection)
         
         if not transaction:
             raise HTTPException(status_code=404, detail="Order not found")
         
-        # Convert MongoDB _id to string
-        transaction['_id'] = str(transaction['_id'])
-        
-        return transaction
+        # Validated once here; returning a Response skips FastAPI's second pass
+        return Response(model.model_validate(transaction).model_dump_json(), media_type="application/json")
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Error getting order details: {str(e)}")
+        logger.exception("Error getting order details")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,159 @@
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Optional, Set
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from admin_auth import is_admin_token, require_admin
+
+MAX_PROFILE_SECONDS = 60
+PSTATS_SORT_KEYS = {'cumulative', 'tottime', 'ncalls', 'time', 'calls'}
+
+_frame_labels: Dict[object, str] = {}
+
+
+def _label(code) -> str:
+    label = _frame_labels.get(code)
+    if label is None:
+        label = _frame_labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_label(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+def sample_stacks(seconds: float, interval: float, thread_ids: Optional[Set[int]] = None) -> Counter:
+    """Sample the stacks of ``thread_ids`` (default: all other threads) every ``interval`` seconds"""
+    own = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (thread_ids is not None and thread_id not in thread_ids):
+                continue
+            stacks[_collapse(frame)] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def to_flamegraph(stacks: Counter) -> dict:
+    """Nested {name, value, children} tree as used by d3-flame-graph and speedscope imports"""
+    root = {'name': 'root', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            child = node['children'].get(name)
+            if child is None:
+                child = node['children'][name] = {'name': name, 'value': 0, 'children': {}}
+            child['value'] += count
+            node = child
+
+    def finish(node):
+        node['children'] = [finish(child) for child in node['children'].values()]
+        return node
+    return finish(root)
+
+
+profile_router = APIRouter(prefix="/api/admin/profile", tags=["admin"], dependencies=[Depends(require_admin)])
+
+_sampling = asyncio.Lock()
+
+
+@profile_router.post("")
+async def profile_worker(seconds: float = 10, interval_ms: float = 5, format: str = 'collapsed',
+                         all_threads: bool = False):
+    """Run a sampling profiler on this worker for ``seconds`` and return its stacks.
+
+    By default only the event loop thread is sampled. ``format`` is
+    ``collapsed`` (flamegraph.pl / speedscope input) or ``json``.
+    """
+    if format not in ('collapsed', 'json'):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'json'")
+    if _sampling.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+
+    async with _sampling:
+        thread_ids = None if all_threads else {threading.get_ident()}
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        interval = min(max(interval_ms, 1), 1000) / 1000
+        stacks = await run_in_threadpool(sample_stacks, seconds, interval, thread_ids)
+
+    headers = {'X-Worker-Pid': str(os.getpid()), 'X-Profile-Samples': str(sum(stacks.values()))}
+    if format == 'json':
+        return JSONResponse({'pid': os.getpid(), 'seconds': seconds, 'flamegraph': to_flamegraph(stacks)}, headers=headers)
+    body = '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return PlainTextResponse(body + '\n', headers=headers)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware returning cProfile stats for one request.
+
+    Send ``X-Profile: 1`` with a valid X-Admin-Token and the response body is
+    replaced by pstats output (``X-Profile-Sort`` picks the sort key, default
+    cumulative); the original status is in ``X-Profiled-Status``. cProfile
+    sees the whole event loop thread, so other requests running at the same
+    time show up too - profile on a quiet worker for clean numbers.
+    """
+
+    def __init__(self, app, limit: int = 60):
+        self.app = app
+        self.limit = limit
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self._busy:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope['headers'])
+        if headers.get(b'x-profile') != b'1' or not is_admin_token(headers.get(b'x-admin-token', b'').decode('latin-1')):
+            await self.app(scope, receive, send)
+            return
+
+        sort = headers.get(b'x-profile-sort', b'cumulative').decode('latin-1')
+        if sort not in PSTATS_SORT_KEYS:
+            sort = 'cumulative'
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        profiler = cProfile.Profile()
+        self._busy = True
+        profiler.enable()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.disable()
+            self._busy = False
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(self.limit)
+        body = out.getvalue().encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/plain; charset=utf-8'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-profiled-status', str(status).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
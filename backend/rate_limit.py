@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+from fastapi import HTTPException
+import env  # noqa: F401  (loads .env before the RATE_LIMIT_* settings are read)
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the shared counters before failing open
+RATE_LIMIT_MONGO_TIMEOUT = float(os.environ.get('RATE_LIMIT_MONGO_TIMEOUT', 1))
+# Local buckets kept per process (least recently used are dropped)
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 10000))
+
+rate_limit_decisions_total = Counter(
+    'rate_limit_decisions_total', 'Form rate limit decisions', ('form', 'key', 'decision'))
+
+
+class TokenBucket:
+    """Allows ``rate`` operations per second with bursts of up to ``burst``"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def available(self) -> float:
+        """Tokens that can be spent right now"""
+        self._refill()
+        return self.tokens
+
+    def retry_after(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """``"5/600"`` -> 5 requests per 600 seconds"""
+    count, _, seconds = spec.partition('/')
+    return int(count), float(seconds or 60)
+
+
+class Limit:
+    """``count`` requests per ``seconds`` as a token bucket with a burst of ``count``"""
+
+    def __init__(self, count: int, seconds: float):
+        self.count = count
+        self.seconds = seconds
+        self.interval = seconds / count
+
+    @classmethod
+    def from_env(cls, name: str, default: str) -> 'Limit':
+        return cls(*parse_limit(os.environ.get(name, default)))
+
+
+# Per form: (per IP, per email). RATE_LIMIT_<FORM>_IP / _EMAIL override,
+# as "<requests>/<seconds>"
+FORM_LIMITS: Dict[str, Tuple[Limit, Limit]] = {
+    form: (Limit.from_env(f'RATE_LIMIT_{form.upper()}_IP', ip), Limit.from_env(f'RATE_LIMIT_{form.upper()}_EMAIL', email))
+    for form, ip, email in (
+        ('contact', '5/600', '3/600'),
+        ('review', '10/3600', '5/3600'),
+        ('newsletter', '5/3600', '2/3600'),
+    )
+}
+
+
+class RateLimiter:
+    """Per-IP and per-email token buckets for the public forms.
+
+    Each key is checked against a local bucket first. A worker only sees
+    part of the traffic, so a local bucket always has at least as many
+    tokens as the shared one: an empty local bucket rejects without a
+    round trip. Otherwise the shared bucket in Mongo decides, kept as a
+    GCRA "theoretical arrival time" (``tat``, the equivalent of a token
+    bucket in one number) that two conditional updates advance
+    atomically, so every worker and node enforces the same limit.
+    ``expires_at`` has a TTL index, so idle keys clean themselves up.
+    Without a collection (before start) or when Mongo is unreachable only
+    the local buckets apply.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[Limit, Limit]] = FORM_LIMITS, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self.collection = None
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+
+    async def start(self, db):
+        self.collection = db.rate_limits
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception:
+            logger.exception("Could not create the rate limit TTL index")
+
+    def _local(self, key: str, limit: Limit) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(1 / limit.interval, limit.count)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def _shared(self, key: str, limit: Limit) -> Optional[float]:
+        """None if allowed, else seconds until the next request would be"""
+        # pymongo is loaded by now (the collection exists); imported here so
+        # importing this module does not pull it in at startup
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        now = time.time()
+        tolerance = limit.seconds - limit.interval
+        expires_at = datetime.utcfromtimestamp(now + limit.seconds)
+        try:
+            # Bucket full again (or new key): start from now
+            await self.collection.find_one_and_update(
+                {"_id": key, "tat": {"$lt": now}},
+                {"$set": {"tat": now + limit.interval, "expires_at": expires_at}},
+                upsert=True,
+            )
+            return None
+        except DuplicateKeyError:
+            pass
+        # Tokens left: spend one
+        updated = await self.collection.find_one_and_update(
+            {"_id": key, "tat": {"$lte": now + tolerance}},
+            {"$inc": {"tat": limit.interval}, "$set": {"expires_at": expires_at}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated is not None:
+            return None
+        current = await self.collection.find_one({"_id": key}, {"tat": 1})
+        return max(0.0, current["tat"] - tolerance - now) if current else limit.interval
+
+    async def hit(self, form: str, key_type: str, value: str, limit: Limit) -> Optional[float]:
+        key = f"{form}:{key_type}:{value.lower()}"
+        bucket = self._local(key, limit)
+        if not bucket.try_acquire():
+            rate_limit_decisions_total.inc(form, key_type, 'rejected_local')
+            return bucket.retry_after()
+        if self.collection is not None:
+            try:
+                retry_after = await asyncio.wait_for(self._shared(key, limit), RATE_LIMIT_MONGO_TIMEOUT)
+            except Exception:
+                logger.warning("Shared rate limit unavailable, using the local limit", exc_info=True)
+                retry_after = None
+            if retry_after is not None:
+                rate_limit_decisions_total.inc(form, key_type, 'rejected')
+                return retry_after
+        rate_limit_decisions_total.inc(form, key_type, 'allowed')
+        return None
+
+    async def check(self, form: str, ip: Optional[str], email: Optional[str] = None):
+        """Raise a 429 with Retry-After if this IP or email is over the form's limit"""
+        ip_limit, email_limit = self.limits[form]
+        for key_type, value, limit in (('ip', ip, ip_limit), ('email', email, email_limit)):
+            if not value:
+                continue
+            retry_after = await self.hit(form, key_type, value, limit)
+            if retry_after is not None:
+                logger.info("Form submission rate limited", extra={"form": form, "key": key_type})
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many submissions, please try again later",
+                    headers={"Retry-After": str(max(1, round(retry_after)))},
+                )
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+import asyncio
+import logging
+import os
+import smtplib
+import threading
+import time
+import env  # noqa: F401  (loads .env before the timeouts and breaker settings are read)
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a call to a dependency is abandoned
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 10))
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 15))
+# Consecutive failures that open a breaker, and seconds it stays open
+# before letting one probe call through
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', 30))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+circuit_breaker_state = Gauge(
+    'circuit_breaker_state', 'Workers with the breaker in each state (1 per process)', ('dependency', 'state'))
+circuit_breaker_transitions_total = Counter(
+    'circuit_breaker_transitions_total', 'Breaker state changes', ('dependency', 'state'))
+circuit_breaker_rejections_total = Counter(
+    'circuit_breaker_rejections_total', 'Calls failed fast by an open breaker', ('dependency',))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after ``failures`` consecutive failures.
+
+    While open, calls raise CircuitOpenError at once. After
+    ``reset_seconds`` the breaker goes half-open and lets a single probe
+    through: success closes it, failure opens it for another period.
+    ``is_failure`` decides which exceptions count against the dependency;
+    caller errors such as a refused recipient or a Stripe 4xx should not.
+    Thread-safe, as SMTP calls run in worker threads.
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS,
+                 is_failure: Callable[[BaseException], bool] = lambda exc: True):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.is_failure = is_failure
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        # When wait_until_closed last let a waiter through to make the probe
+        self._admitted_at = float('-inf')
+        self._lock = threading.Lock()
+        circuit_breaker_state.inc(name, CLOSED)
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        circuit_breaker_state.dec(self.name, self.state)
+        circuit_breaker_state.inc(self.name, state)
+        circuit_breaker_transitions_total.inc(self.name, state)
+        log = logger.warning if state == OPEN else logger.info
+        log("Circuit breaker state changed", extra={"dependency": self.name, "from": self.state, "to": state})
+        self.state = state
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN and self.retry_after() > 0
+
+    def acquire(self):
+        """Admit a call or raise CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN and self.retry_after() == 0:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            circuit_breaker_rejections_total.inc(self.name)
+            raise CircuitOpenError(self.name, self.retry_after() or self.reset_seconds)
+
+    def record(self, exc: Optional[BaseException] = None):
+        with self._lock:
+            self._probing = False
+            if exc is None or not self.is_failure(exc):
+                self.consecutive_failures = 0
+                self._set_state(CLOSED)
+                return
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failures:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    @contextmanager
+    def guard(self):
+        """``with breaker.guard():`` around a blocking call"""
+        self.acquire()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # The caller gave up; says nothing about the dependency
+            with self._lock:
+                self._probing = False
+            raise
+        except Exception as exc:
+            self.record(exc)
+            raise
+        self.record()
+
+    async def call(self, fn: Callable[..., Awaitable], *args, timeout: Optional[float] = None, **kwargs):
+        """Await ``fn(*args, **kwargs)`` through the breaker, abandoning it after ``timeout`` seconds"""
+        with self.guard():
+            return await asyncio.wait_for(fn(*args, **kwargs), timeout)
+
+    async def wait_until_closed(self):
+        """Sleep until the breaker closes.
+
+        Once it is due a probe, one waiter is let through to make it and
+        the rest keep waiting for the outcome; if that waiter never calls,
+        another is let through after ``reset_seconds``.
+        """
+        while True:
+            with self._lock:
+                if self.state == CLOSED:
+                    return
+                now = time.monotonic()
+                if not self._probing and self.retry_after() == 0 and now - self._admitted_at >= self.reset_seconds:
+                    self._admitted_at = now
+                    return
+            await asyncio.sleep(max(self.retry_after(), 0.1))
+
+
+def _smtp_outage(exc: BaseException) -> bool:
+    # A bad address is the caller's problem, not the server's
+    return not isinstance(exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused))
+
+
+def _stripe_outage(exc: BaseException) -> bool:
+    # Stripe errors carry the HTTP status; 4xx other than 429 is a bad request
+    status = getattr(exc, 'http_status', None)
+    return status is None or status >= 500 or status == 429
+
+
+smtp_breaker = CircuitBreaker('smtp', is_failure=_smtp_outage)
+stripe_breaker = CircuitBreaker('stripe', is_failure=_stripe_outage)
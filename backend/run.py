@@ -0,0 +1,222 @@
+"""
+Production launcher for the backend
+
+    python backend/run.py                      # one worker per available core
+    python backend/run.py --workers 4 --port 8001
+
+Runs the app under gunicorn with uvicorn workers when gunicorn is
+installed: the app is imported once in the master (PRELOAD) so workers
+share its memory copy-on-write, and each worker is replaced after
+MAX_REQUESTS (default 10000, +/- MAX_REQUESTS_JITTER) requests to bound
+memory creep. Without gunicorn it falls back to uvicorn's own process
+manager, which cannot preload and does not replace exited workers: there
+a worker is only recycled when MAX_REQUESTS is set, and only a single
+one, which an external supervisor must restart.
+
+uvloop and httptools are used when installed (LOOP / HTTP override).
+Settings come from the environment, and the flags below override them:
+WEB_CONCURRENCY, HOST, PORT, KEEP_ALIVE, BACKLOG, MAX_REQUESTS,
+MAX_REQUESTS_JITTER, PRELOAD, GRACEFUL_TIMEOUT, ACCESS_LOG,
+PROXY_HEADERS, FORWARDED_ALLOW_IPS.
+
+Behind a reverse proxy or load balancer, set FORWARDED_ALLOW_IPS to its
+addresses (comma separated, or "*" when only the proxy can reach the
+app): the client address, which the form rate limits key on, is only
+taken from X-Forwarded-For when the request comes from one of them, and
+otherwise every client would share the proxy's. Proxy headers are on
+when FORWARDED_ALLOW_IPS is set and off otherwise, for clients that
+connect directly; PROXY_HEADERS (--[no-]proxy-headers) overrides that.
+Proxy headers on without FORWARDED_ALLOW_IPS trust only 127.0.0.1, with
+a warning.
+"""
+
+from pathlib import Path
+from typing import Optional
+import argparse
+import importlib.util
+import logging
+import math
+import os
+import sys
+import env  # noqa: F401  (so .env can set the settings below too)
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() not in ('false', '0', 'no')
+
+
+def available_cpus() -> int:
+    """Cores this process may run on, capped by a cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not available on macOS
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" for no limit
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()
+        if quota != 'max':
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def pick_loop(loop: str) -> str:
+    if loop == 'auto':
+        return 'uvloop' if installed('uvloop') else 'asyncio'
+    return loop
+
+
+def pick_http(http: str) -> str:
+    if http == 'auto':
+        return 'httptools' if installed('httptools') else 'h11'
+    return http
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    getenv = os.environ.get
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default='server:app', help='ASGI app as module:attribute')
+    parser.add_argument('--app-dir', default=str(BACKEND_DIR), help='directory the app module is imported from')
+    parser.add_argument('--host', default=getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(getenv('PORT', 8001)))
+    parser.add_argument('--workers', type=int, default=int(getenv('WEB_CONCURRENCY', 0)),
+                        help='worker processes (default: available cores)')
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'uvicorn'), default=getenv('SERVER', 'auto'),
+                        help='process manager (auto: gunicorn when installed)')
+    parser.add_argument('--loop', choices=('auto', 'asyncio', 'uvloop'), default=getenv('LOOP', 'auto'))
+    parser.add_argument('--http', choices=('auto', 'h11', 'httptools'), default=getenv('HTTP', 'auto'))
+    parser.add_argument('--keep-alive', type=float, default=float(getenv('KEEP_ALIVE', 75)),
+                        help='seconds an idle connection is kept open; above the proxy/load balancer idle timeout')
+    parser.add_argument('--backlog', type=int, default=int(getenv('BACKLOG', 2048)),
+                        help='pending connections the listen socket queues')
+    parser.add_argument('--max-requests', type=int,
+                        default=int(getenv('MAX_REQUESTS')) if getenv('MAX_REQUESTS') else None,
+                        help='replace a worker after this many requests (0 = never; default: 10000 under gunicorn, '
+                             'never under uvicorn)')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(getenv('MAX_REQUESTS_JITTER', -1)),
+                        help='random extra requests per worker so they do not restart together (default: 10%%)')
+    parser.add_argument('--graceful-timeout', type=float, default=float(getenv('GRACEFUL_TIMEOUT', 30)),
+                        help='seconds a stopping worker gets to finish requests and shutdown hooks')
+    parser.add_argument('--no-preload', dest='preload', action='store_false', default=_flag('PRELOAD', 'true'),
+                        help='import the app in each worker instead of once in the master')
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false',
+                        default=_flag('ACCESS_LOG', 'true'))
+    parser.add_argument('--proxy-headers', action=argparse.BooleanOptionalAction,
+                        default=_flag('PROXY_HEADERS', 'true' if getenv('FORWARDED_ALLOW_IPS') else 'false'),
+                        help='read the client address and scheme from X-Forwarded-For/-Proto '
+                             '(default: on when FORWARDED_ALLOW_IPS is set)')
+    parser.add_argument('--forwarded-allow-ips', default=getenv('FORWARDED_ALLOW_IPS', ''),
+                        help='proxies trusted for X-Forwarded-For/-Proto')
+    parser.add_argument('--log-level', default=getenv('LOG_LEVEL', 'info').lower())
+    parser.add_argument('--print-config', action='store_true', help='print the resolved settings and exit')
+    args = parser.parse_args(argv)
+    if args.proxy_headers and not args.forwarded_allow_ips:
+        logger.warning("Proxy headers are on but FORWARDED_ALLOW_IPS is not set; only trusting 127.0.0.1. "
+                       "Behind a proxy on another host every client shares its address")
+        args.forwarded_allow_ips = '127.0.0.1'
+
+    args.workers = args.workers or available_cpus()
+    args.loop = pick_loop(args.loop)
+    args.http = pick_http(args.http)
+    if args.server == 'auto':
+        args.server = 'gunicorn' if installed('gunicorn') else 'uvicorn'
+    if args.server == 'uvicorn':
+        # uvicorn's supervisor does not replace a worker that exits, so
+        # recycling would shrink the pool; only a lone worker, restarted by
+        # the process supervisor, may exit after max_requests
+        if args.max_requests and args.workers > 1:
+            logger.warning("Worker recycling needs gunicorn with several workers; MAX_REQUESTS ignored")
+            args.max_requests = 0
+        args.max_requests = args.max_requests or 0
+        args.max_requests_jitter = 0
+        args.preload = False
+    elif args.max_requests is None:
+        args.max_requests = 10000
+    if args.max_requests_jitter < 0:
+        args.max_requests_jitter = args.max_requests // 10
+    return args
+
+
+def run_gunicorn(args: argparse.Namespace):
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {'loop': args.loop, 'http': args.http, 'proxy_headers': args.proxy_headers}
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'{args.host}:{args.port}',
+                'workers': args.workers,
+                'worker_class': Worker,
+                'keepalive': args.keep_alive,
+                'backlog': args.backlog,
+                'max_requests': args.max_requests,
+                'max_requests_jitter': args.max_requests_jitter,
+                'preload_app': args.preload,
+                'graceful_timeout': args.graceful_timeout,
+                'forwarded_allow_ips': args.forwarded_allow_ips or '127.0.0.1',
+                'accesslog': '-' if args.access_log else None,
+                'loglevel': args.log_level,
+                'proc_name': 'backend',
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            module, _, attribute = args.app.partition(':')
+            return getattr(importlib.import_module(module), attribute)
+
+    Application().run()
+
+
+def run_uvicorn(args: argparse.Namespace):
+    import uvicorn
+
+    uvicorn.run(
+        args.app,
+        app_dir=args.app_dir,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_keep_alive=int(args.keep_alive),
+        timeout_graceful_shutdown=int(args.graceful_timeout),
+        backlog=args.backlog,
+        limit_max_requests=args.max_requests or None,
+        proxy_headers=args.proxy_headers,
+        forwarded_allow_ips=args.forwarded_allow_ips or None,
+        access_log=args.access_log,
+        log_level=args.log_level,
+    )
+
+
+def main(argv: Optional[list] = None):
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    args = parse_args(argv)
+    settings = {key: value for key, value in vars(args).items() if key != 'print_config'}
+    if args.print_config:
+        for key, value in settings.items():
+            print(f"{key}={value}")
+        return
+    logger.info("Starting %s", ' '.join(f"{key}={value}" for key, value in settings.items()))
+    sys.path.insert(0, args.app_dir)
+    if args.server == 'gunicorn':
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == '__main__':
+    main()
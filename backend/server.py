@@ -1,30 +1,72 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from fastapi.responses import Response
-from fastapi.middleware.gzip import GZipMiddleware
-from dotenv import load_dotenv
-from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
+import asyncio
 import logging
-from pathlib import Path
+import os
+import time
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Dict, Any, Optional
 import uuid
 from datetime import datetime
+import orjson
+import env  # noqa: F401  (loads .env before the modules below read their settings)
+from database import close_client, db
 from email_service import email_service
+from email_dispatcher import QUEUED, email_dispatcher
+from email_digest import business_digest
+from rate_limit import rate_limiter
 from payment_routes import payment_router
+from image_routes import image_router, image_cache
+from middleware_stack import install_middleware
+from logging_config import setup_logging, shutdown_logging
+import metrics
+from metrics import metrics_router
+from tracing import trace_router
+from profiling import profile_router
+from static_files import create_static_app
+
+
+# Configure logging (JSON lines written off-thread, see logging_config)
+setup_logging()
+logger = logging.getLogger(__name__)
 
-
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
-# Create the main app without a prefix
-app = FastAPI()
+# Seconds shutdown gives queued email and background work to finish; with
+# the time in-flight requests take it should fit in the launcher's
+# GRACEFUL_TIMEOUT (see run.py)
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 15))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The Mongo client (see database.db) is created by the first of these
+    # to touch it rather than at import
+    flush_task = None
+    if metrics.MULTIPROC_DIR:
+        # Multi-worker mode: each worker publishes its metrics for /metrics to merge
+        flush_task = asyncio.create_task(metrics.flush_periodically())
+    business_digest.start(db)
+    await rate_limiter.start(db)
+    # Mail that stopped workers could not send
+    email_dispatcher.start_outbox(db)
+    yield
+
+    # The server has stopped accepting connections and finished in-flight
+    # requests; drain background work, then save unsent mail to Mongo
+    deadline = time.monotonic() + SHUTDOWN_DRAIN_SECONDS
+    await business_digest.stop(timeout=deadline - time.monotonic())
+    saved = await email_dispatcher.drain(deadline)
+    logger.info("Shutdown drained", extra={"emails_saved": saved})
+    if flush_task is not None:
+        flush_task.cancel()
+    close_client()
+    image_cache.shutdown()
+    shutdown_logging()
+
+
+# Create the main app without a prefix. orjson renders responses several
+# times faster than stdlib json and handles datetime/UUID natively.
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -55,6 +97,21 @@ class ContentSectionCreate(BaseModel):
     font_family: str
     plain_text: str
 
+# Read path: documents are written from these models, so instead of
+# building a model per document and having FastAPI validate it again
+# against response_model, fetch exactly the model's fields and serialize
+# them as they come back from Mongo
+def mongo_fields(model) -> dict:
+    """Projection returning exactly the fields of ``model``"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+STATUS_CHECK_FIELDS = mongo_fields(StatusCheck)
+CONTENT_SECTION_FIELDS = mongo_fields(ContentSection)
+
+def json_response(documents) -> Response:
+    # default=str only runs for types orjson does not know, such as an ObjectId
+    return Response(orjson.dumps(documents, default=str, option=orjson.OPT_UTC_Z), media_type="application/json")
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -69,8 +126,8 @@ async def create_status_check(input: StatusCheckCreate):
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+    status_checks = await db.status_checks.find({}, STATUS_CHECK_FIELDS).to_list(1000)
+    return json_response(status_checks)
 
 @api_router.post("/content/{section_id}", response_model=ContentSection)
 async def save_content_section(section_id: str, input: ContentSectionCreate):
@@ -93,17 +150,18 @@ async def save_content_section(section_id: str, input: ContentSectionCreate):
     
     return content_obj
 
-@api_router.get("/content/{section_id}", response_model=ContentSection)
+@api_router.get("/content/{section_id}", response_model=ContentSection,
+                responses={404: {"description": "No content has been saved for this section"}})
 async def get_content_section(section_id: str):
-    content = await db.content_sections.find_one({"section_id": section_id})
-    if content:
-        return ContentSection(**content)
-    return None
+    content = await db.content_sections.find_one({"section_id": section_id}, CONTENT_SECTION_FIELDS)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Content section not found")
+    return json_response(content)
 
 @api_router.get("/content", response_model=List[ContentSection])
 async def get_all_content():
-    contents = await db.content_sections.find().to_list(1000)
-    return [ContentSection(**content) for content in contents]
+    contents = await db.content_sections.find({}, CONTENT_SECTION_FIELDS).to_list(1000)
+    return json_response(contents)
 
 
 # Email Models
@@ -159,34 +217,46 @@ class NewsletterSubscription(BaseModel):
     source: Optional[str] = 'website'
     subscribed_at: str
 
+# Proxies trusted for X-Forwarded-For (see run.py)
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get('FORWARDED_ALLOW_IPS', '').split(',')} - {'', '*'}
+
+def client_ip(request: Request) -> Optional[str]:
+    # Behind a proxy, uvicorn's --proxy-headers fills this from X-Forwarded-For.
+    # A request still coming from a proxy had no forwarded address; keyed
+    # on the proxy, every such client would share one bucket, so it is
+    # limited by email only
+    host = request.client.host if request.client else None
+    return None if host in TRUSTED_PROXIES else host
+
 # Email Endpoints
 @api_router.post("/contact")
-async def submit_contact_form(form_data: ContactFormData):
+async def submit_contact_form(form_data: ContactFormData, request: Request):
     """Handle contact form submissions and send email notification"""
+    await rate_limiter.check("contact", client_ip(request), form_data.email)
     try:
-        print(f"📨 Contact form submission received from: {form_data.name}")
-        print(f"📧 Email: {form_data.email}")
+        logger.info("Contact form submission received", extra={"contact_email": form_data.email})
         
         # Save to database
         contact_dict = form_data.dict()
         contact_dict['id'] = str(uuid.uuid4())
         contact_dict['timestamp'] = datetime.utcnow()
         await db.contact_submissions.insert_one(contact_dict)
-        print(f"✅ Saved to database")
         
-        # Send email notification
-        success = email_service.send_contact_form_notification(form_data.dict())
-        print(f"📧 Email notification: {'Success' if success else 'Failed'}")
+        # Send email notification, unless it goes out with the next digest
+        if business_digest.enabled:
+            success = True
+        else:
+            success = await email_dispatcher.send("notifications", email_service.send_contact_form_notification, form_data.dict())
+        logger.info("Contact form processed", extra={"contact_id": contact_dict['id'], "email_sent": success})
         
-        if success:
+        if success is True:
             return {"status": "success", "message": "Contact form submitted successfully"}
+        elif success == QUEUED:
+            return {"status": "queued", "message": "Form submitted, the notification will be sent shortly"}
         else:
             return {"status": "warning", "message": "Form submitted but email notification failed"}
     except Exception as e:
-        logging.error(f"❌ Error submitting contact form: {str(e)}")
-        print(f"❌ Full error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error submitting contact form")
         raise HTTPException(status_code=500, detail=f"Failed to submit contact form: {str(e)}")
 
 @api_router.post("/orders/notify")
@@ -200,19 +270,30 @@ async def notify_order(order_data: OrderData):
         order_dict['status'] = 'pending'
         await db.orders.insert_one(order_dict)
         
-        # Send email notification to business
-        business_email_success = email_service.send_order_notification(order_data.dict())
-        
-        # Send confirmation email to customer
-        customer_email_success = email_service.send_customer_confirmation(order_data.dict())
+        # Notify the business and confirm to the customer concurrently in the
+        # transactional lane. The request waits at most EMAIL_REQUEST_WAIT for
+        # them; mail still queued then (SMTP down or busy) goes out later
+        order = order_data.dict()
+        business_email, customer_email = await asyncio.gather(
+            email_dispatcher.send("transactional", email_service.send_order_notification, order),
+            email_dispatcher.send("transactional", email_service.send_customer_confirmation, order),
+        )
+        business_email_failed = business_email is not True and business_email != QUEUED
+        customer_email_failed = customer_email is not True and customer_email != QUEUED
         
-        if business_email_success and customer_email_success:
+        if business_email is True and customer_email is True:
             return {
                 "status": "success", 
                 "message": "Order saved and emails sent successfully", 
                 "order_id": order_data.order_id
             }
-        elif business_email_success:
+        elif not business_email_failed and not customer_email_failed:
+            return {
+                "status": "queued",
+                "message": "Order saved, email notifications will be sent shortly",
+                "order_id": order_data.order_id
+            }
+        elif not business_email_failed:
             return {
                 "status": "partial_success", 
                 "message": "Order saved, business notified, but customer confirmation failed", 
@@ -224,13 +305,14 @@ async def notify_order(order_data: OrderData):
                 "message": "Order saved but email notifications failed", 
                 "order_id": order_data.order_id
             }
-    except Exception as e:
-        logging.error(f"Error processing order notification: {str(e)}")
+    except Exception:
+        logger.exception("Error processing order notification")
         raise HTTPException(status_code=500, detail="Failed to process order notification")
 
 @api_router.post("/reviews")
-async def submit_review(review_data: ReviewData):
+async def submit_review(review_data: ReviewData, request: Request):
     """Handle product review submissions"""
+    await rate_limiter.check("review", client_ip(request), review_data.email)
     try:
         # Save to database
         review_dict = review_data.dict()
@@ -241,8 +323,8 @@ async def submit_review(review_data: ReviewData):
         await db.reviews.insert_one(review_dict)
         
         return {"status": "success", "message": "Review submitted for moderation"}
-    except Exception as e:
-        logging.error(f"Error submitting review: {str(e)}")
+    except Exception:
+        logger.exception("Error submitting review")
         raise HTTPException(status_code=500, detail="Failed to submit review")
 
 @api_router.get("/reviews/{product_id}")
@@ -252,7 +334,7 @@ async def get_product_reviews(product_id: str):
         reviews = await db.reviews.find({
             "productId": product_id,
             "status": "approved"
-        }).to_list(100)
+        }, {"_id": 0}).to_list(100)
         
         # Calculate average rating
         if reviews:
@@ -268,13 +350,14 @@ async def get_product_reviews(product_id: str):
                 "averageRating": 0,
                 "totalReviews": 0
             }
-    except Exception as e:
-        logging.error(f"Error fetching reviews: {str(e)}")
+    except Exception:
+        logger.exception("Error fetching reviews")
         raise HTTPException(status_code=500, detail="Failed to fetch reviews")
 
 @api_router.post("/newsletter/subscribe")
-async def subscribe_newsletter(subscription: NewsletterSubscription):
+async def subscribe_newsletter(subscription: NewsletterSubscription, request: Request):
     """Handle newsletter subscriptions"""
+    await rate_limiter.check("newsletter", client_ip(request), subscription.email)
     try:
         # Check if already subscribed
         existing = await db.newsletter_subscribers.find_one({"email": subscription.email})
@@ -292,56 +375,23 @@ async def subscribe_newsletter(subscription: NewsletterSubscription):
         # email_service.send_welcome_email(subscription.email)
         
         return {"status": "success", "message": "Successfully subscribed to newsletter"}
-    except Exception as e:
-        logging.error(f"Error subscribing to newsletter: {str(e)}")
+    except Exception:
+        logger.exception("Error subscribing to newsletter")
         raise HTTPException(status_code=500, detail="Failed to subscribe")
 
 
 # Include the router in the main app
 app.include_router(api_router)
 app.include_router(payment_router)
-
-# Add GZip compression middleware
-app.add_middleware(GZipMiddleware, minimum_size=1000)
-
-# Add CORS middleware - Allow all origins for preview environment
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],  # Allow all origins for Emergent preview
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Add caching headers for static assets
-@app.middleware("http")
-async def add_cache_headers(request, call_next):
-    response = await call_next(request)
-    
-    # Cache static assets for 1 year
-    if request.url.path.startswith('/assets/'):
-        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
-    # Cache images for 30 days
-    elif any(ext in request.url.path for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico']):
-        response.headers['Cache-Control'] = 'public, max-age=2592000'
-    # Cache other static files for 1 week
-    elif any(ext in request.url.path for ext in ['.css', '.js', '.woff', '.woff2', '.ttf', '.eot']):
-        response.headers['Cache-Control'] = 'public, max-age=604800'
-    # Don't cache API responses
-    elif request.url.path.startswith('/api/'):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-    
-    return response
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app.include_router(image_router)
+app.include_router(metrics_router)
+app.include_router(trace_router)
+app.include_router(profile_router)
+
+# Serve the built frontend and uploads when present (API routes match first)
+static_app = create_static_app()
+if static_app:
+    app.mount("/", static_app, name="static")
+
+# Add middleware (compression, CORS, cache headers) - see middleware_stack.LAYERS
+install_middleware(app)
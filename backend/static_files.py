@@ -0,0 +1,298 @@
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from typing import Dict, List, Optional, Tuple
+import mimetypes
+import os
+import time
+import env  # noqa: F401  (loads .env before SERVE_STATIC and STATIC_DIRS are read)
+from compression import negotiate_encoding
+
+ROOT_DIR = Path(__file__).parent
+FRONTEND_DIR = ROOT_DIR.parent / 'frontend'
+
+# Built frontend first, then the raw public folder (lovable-uploads, hero video)
+DEFAULT_STATIC_DIRS = [FRONTEND_DIR / 'dist', FRONTEND_DIR / 'public']
+
+# Files up to this size are sent as one body message (and can be compressed and
+# cached by CompressionMiddleware); larger files are streamed in chunks
+SINGLE_READ_LIMIT = 256 * 1024
+CHUNK_SIZE = 256 * 1024
+
+# Precompressed siblings we look for next to each file, in preference order
+PRECOMPRESSED = [('br', '.br'), ('gzip', '.gz')]
+
+for _ext, _type in (('.webp', 'image/webp'), ('.avif', 'image/avif'), ('.woff2', 'font/woff2'),
+                    ('.webmanifest', 'application/manifest+json'), ('.mp4', 'video/mp4')):
+    mimetypes.add_type(_type, _ext)
+
+
+class StaticFile:
+    """Everything we need to answer a request for one file, taken from a single stat"""
+
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'last_modified', 'content_type', 'variants')
+
+    def __init__(self, path: str, stat: os.stat_result, variants: Dict[str, Tuple[str, int]]):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        self.variants = variants
+
+
+class StatCache:
+    """Path -> StaticFile (or None for misses), refreshed after ``ttl`` seconds"""
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[float, Optional[StaticFile]]] = {}
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return False, None
+        return True, entry[1]
+
+    def put(self, key: str, value: Optional[StaticFile]):
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (time.monotonic(), value)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into an inclusive (start, end).
+
+    Returns None when the header should be ignored (multiple ranges or
+    malformed) and raises RangeNotSatisfiable when it cannot be served.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if start_s == '':
+            suffix = int(end_s)
+            start, end = max(size - suffix, 0), size - 1
+            if suffix == 0:
+                raise RangeNotSatisfiable(header)
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class StaticAssets:
+    """ASGI app serving the built frontend and uploaded images.
+
+    Stat results are cached in memory, ``.br``/``.gz`` siblings are served
+    when the client accepts them, single byte ranges are honoured (video
+    seeking), and the file body goes out through the server's pathsend or
+    zerocopysend extension when available, falling back to threaded reads.
+    Unknown extension-less paths fall back to index.html for client routing.
+    """
+
+    def __init__(self, directories: List[Path], index: str = 'index.html', stat_ttl: float = 60.0,
+                 exclude_prefixes: Tuple[str, ...] = ('/api/',)):
+        self.directories = [str(d.resolve()) for d in directories if d.is_dir()]
+        self.index = index
+        self.exclude_prefixes = exclude_prefixes
+        self.stat_cache = StatCache(stat_ttl)
+
+    async def __call__(self, scope, receive, send):
+        assert scope['type'] == 'http'
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self._send_status(send, 405, [(b'allow', b'GET, HEAD')])
+            return
+
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        # Unmatched API paths stay 404 instead of falling through to the SPA
+        if path.startswith(self.exclude_prefixes):
+            await self._send_status(send, 404)
+            return
+
+        file = await self.lookup(path)
+        if file is None and '.' not in path.rpartition('/')[2]:
+            file = await self.lookup('/' + self.index)
+        if file is None:
+            await self._send_status(send, 404)
+            return
+
+        await self.serve(file, scope, send)
+
+    async def lookup(self, path: str) -> Optional[StaticFile]:
+        found, file = self.stat_cache.get(path)
+        if not found:
+            file = await run_in_threadpool(self._stat, path)
+            self.stat_cache.put(path, file)
+        return file
+
+    def _stat(self, path: str) -> Optional[StaticFile]:
+        relative = path.lstrip('/')
+        if not relative or '\x00' in relative or '..' in relative.split('/'):
+            return None
+        for directory in self.directories:
+            full = os.path.realpath(os.path.join(directory, relative))
+            if os.path.commonpath([directory, full]) != directory:
+                continue
+            try:
+                stat = os.stat(full)
+            except OSError:
+                continue
+            if not os.path.isfile(full):
+                continue
+            variants = {}
+            for encoding, suffix in PRECOMPRESSED:
+                try:
+                    variants[encoding] = (full + suffix, os.stat(full + suffix).st_size)
+                except OSError:
+                    pass
+            return StaticFile(full, stat, variants)
+        return None
+
+    async def serve(self, file: StaticFile, scope, send):
+        request_headers = Headers(scope=scope)
+        headers = [
+            (b'content-type', file.content_type.encode()),
+            (b'etag', file.etag.encode()),
+            (b'last-modified', file.last_modified.encode()),
+            (b'accept-ranges', b'bytes'),
+        ]
+        if file.content_type.startswith('text/html'):
+            headers.append((b'cache-control', b'no-cache'))
+        if file.variants:
+            headers.append((b'vary', b'Accept-Encoding'))
+
+        if self._not_modified(request_headers, file):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        head = scope['method'] == 'HEAD'
+        path, offset, count, status = file.path, 0, file.size, 200
+
+        range_header = request_headers.get('range')
+        if_range = request_headers.get('if-range')
+        if range_header and (if_range is None or if_range in (file.etag, file.last_modified)):
+            try:
+                byte_range = parse_range(range_header, file.size)
+            except RangeNotSatisfiable:
+                await self._send_status(send, 416, [(b'content-range', f'bytes */{file.size}'.encode())])
+                return
+            if byte_range is not None:
+                offset, end = byte_range
+                count = end - offset + 1
+                status = 206
+                headers.append((b'content-range', f'bytes {offset}-{end}/{file.size}'.encode()))
+
+        if status == 200 and file.variants:
+            encoding = negotiate_encoding(request_headers.get('accept-encoding', ''), list(file.variants))
+            if encoding:
+                path, count = file.variants[encoding]
+                headers.append((b'content-encoding', encoding.encode()))
+
+        headers.append((b'content-length', str(count).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if head:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await self._send_file(scope, send, path, offset, count, whole=status == 200)
+
+    @staticmethod
+    def _not_modified(request_headers: Headers, file: StaticFile) -> bool:
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return file.etag in tags or '*' in tags
+        if_modified_since = request_headers.get('if-modified-since')
+        if if_modified_since:
+            try:
+                return int(parsedate_to_datetime(if_modified_since).timestamp()) >= file.mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def _send_file(self, scope, send, path: str, offset: int, count: int, whole: bool):
+        extensions = scope.get('extensions') or {}
+
+        if whole and 'http.response.pathsend' in extensions:
+            await send({'type': 'http.response.pathsend', 'path': path})
+            return
+
+        if 'http.response.zerocopysend' in extensions:
+            with open(path, 'rb') as f:
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': f,
+                    'offset': offset,
+                    'count': count,
+                    'more_body': False,
+                })
+            return
+
+        if count <= SINGLE_READ_LIMIT:
+            body = await run_in_threadpool(_read_range, path, offset, count)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+            return
+
+        f = await run_in_threadpool(open, path, 'rb')
+        try:
+            await run_in_threadpool(f.seek, offset)
+            remaining = count
+            while remaining > 0:
+                chunk = await run_in_threadpool(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining > 0:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            await run_in_threadpool(f.close)
+
+    @staticmethod
+    async def _send_status(send, status: int, headers: Optional[list] = None):
+        body = {404: b'Not Found', 405: b'Method Not Allowed', 416: b'Range Not Satisfiable'}.get(status, b'')
+        headers = (headers or []) + [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', str(len(body)).encode())]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _read_range(path: str, offset: int, count: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(count)
+
+
+def create_static_app() -> Optional[StaticAssets]:
+    """StaticAssets over STATIC_DIRS (os.pathsep separated) or the frontend build.
+
+    Returns None when SERVE_STATIC is off or none of the directories exist,
+    so deployments that keep assets on a CDN are unaffected.
+    """
+    if os.environ.get('SERVE_STATIC', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    configured = os.environ.get('STATIC_DIRS')
+    directories = [Path(p) for p in configured.split(os.pathsep)] if configured else DEFAULT_STATIC_DIRS
+    static_app = StaticAssets(directories, stat_ttl=float(os.environ.get('STATIC_STAT_TTL', 60)))
+    return static_app if static_app.directories else None
@@ -0,0 +1,316 @@
+from collections import deque
+from contextvars import ContextVar
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.datastructures import MutableHeaders
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+import env  # noqa: F401  (loads .env before the TRACE_* settings are read)
+from admin_auth import is_admin_token, require_admin
+from logging_config import request_id_var
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests traced; 1% keeps the overhead well under 1% of CPU
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.01))
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', 500))
+TRACE_EXPORT_FILE = os.environ.get('TRACE_EXPORT_FILE')
+MAX_SPANS_PER_TRACE = 256
+
+
+class Trace:
+    """One sampled request and the spans recorded under it"""
+
+    __slots__ = ('trace_id', 'name', 'started_at', 'start', 'duration_ms', 'status', 'spans', '_next_id')
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.spans: List[dict] = []
+        self._next_id = 0
+
+    def next_span_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'spans': self.spans,
+        }
+
+
+# (trace, current span id) for the request being handled, if it is sampled
+_current: ContextVar[Optional[Tuple[Trace, Optional[str]]]] = ContextVar('trace', default=None)
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'attributes', 'start', 'token')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = trace.next_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.token = _current.set((self.trace, self.span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current.reset(self.token)
+        if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            entry = {
+                'span_id': self.span_id,
+                'parent_id': self.parent_id,
+                'name': self.name,
+                'offset_ms': round((self.start - self.trace.start) * 1000, 3),
+                'duration_ms': round((end - self.start) * 1000, 3),
+            }
+            if self.attributes:
+                entry['attributes'] = self.attributes
+            if exc is not None:
+                entry['error'] = repr(exc)
+            self.trace.spans.append(entry)
+        return False
+
+
+class _NullSpan:
+    """Returned when the current request is not sampled; costs one contextvar read"""
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **attributes):
+    """Context manager recording a child span of the current trace (no-op when unsampled)"""
+    current = _current.get()
+    if current is None:
+        return NULL_SPAN
+    trace, parent_id = current
+    return _Span(trace, name, parent_id, attributes)
+
+
+class TraceRecorder:
+    """Keeps the last N traces in memory and optionally appends them to a JSON lines file"""
+
+    def __init__(self, size: int, export_file: Optional[str] = None):
+        self.traces: deque = deque(maxlen=size)
+        self.export_file = export_file
+        self._queue: Optional[queue.SimpleQueue] = None
+        if export_file:
+            self._queue = queue.SimpleQueue()
+            self._start_writer()
+            if hasattr(os, 'register_at_fork'):
+                # A worker forked from a preloaded master needs its own writer thread
+                os.register_at_fork(after_in_child=self._start_writer)
+
+    def _start_writer(self):
+        threading.Thread(target=self._write_loop, name='trace-export', daemon=True).start()
+
+    def record(self, trace: Trace):
+        self.traces.append(trace)
+        if self._queue is not None:
+            self._queue.put(trace)
+
+    def _write_loop(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                with open(self.export_file, 'a') as f:
+                    f.write(json.dumps(trace.to_dict(), default=str) + '\n')
+            except OSError:
+                logger.exception("Error exporting trace", extra={"file": self.export_file})
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        for trace in reversed(self.traces):
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+
+trace_recorder = TraceRecorder(TRACE_BUFFER_SIZE, TRACE_EXPORT_FILE)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware that starts a trace for a sample of requests.
+
+    The trace ID is the request ID so traces line up with log lines. Admins
+    can force a trace with ``X-Trace: 1`` plus their X-Admin-Token.
+    """
+
+    def __init__(self, app, sample_rate: float = None, recorder: TraceRecorder = trace_recorder):
+        self.app = app
+        self.sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.recorder = recorder
+
+    def _sampled(self, scope) -> bool:
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        headers = dict(scope['headers'])
+        return headers.get(b'x-trace') == b'1' and is_admin_token(headers.get(b'x-admin-token', b'').decode('latin-1'))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(request_id_var.get() or uuid.uuid4().hex, f"{scope['method']} {scope['path']}")
+
+        async def send_with_trace_id(message):
+            if message['type'] == 'http.response.start':
+                trace.status = message['status']
+                MutableHeaders(scope=message)['x-trace-id'] = trace.trace_id
+            await send(message)
+
+        token = _current.set((trace, None))
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            _current.reset(token)
+            trace.duration_ms = round((time.perf_counter() - trace.start) * 1000, 3)
+            route = scope.get('route')
+            if route is not None:
+                trace.name = f"{scope['method']} {route.path}"
+            self.recorder.record(trace)
+
+
+# Motor instrumentation
+
+_TRACED_METHODS = {
+    'insert_one', 'insert_many', 'find_one', 'find_one_and_update', 'find_one_and_delete',
+    'update_one', 'update_many', 'replace_one', 'delete_one', 'delete_many',
+    'count_documents', 'distinct', 'bulk_write',
+}
+
+
+class TracedCursor:
+    def __init__(self, cursor, collection: str, operation: str):
+        self._cursor = cursor
+        self._collection = collection
+        self._operation = operation
+
+    async def to_list(self, *args, **kwargs):
+        with span(f"mongo.{self._operation}", collection=self._collection) as s:
+            documents = await self._cursor.to_list(*args, **kwargs)
+            s.set(documents=len(documents))
+            return documents
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def chain(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return TracedCursor(result, self._collection, self._operation) if result is self._cursor else result
+        return chain
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class TracedCollection:
+    """Proxy for a Motor collection that records a span per operation"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._name = collection.name
+        self._wrapped: Dict[str, object] = {}
+
+    def __getattr__(self, name):
+        wrapped = self._wrapped.get(name)
+        if wrapped is not None:
+            return wrapped
+
+        attr = getattr(self._collection, name)
+        if name in _TRACED_METHODS:
+            async def wrapped(*args, **kwargs):
+                with span(f"mongo.{name}", collection=self._name):
+                    return await attr(*args, **kwargs)
+        elif name in ('find', 'aggregate'):
+            def wrapped(*args, **kwargs):
+                return TracedCursor(attr(*args, **kwargs), self._name, name)
+        else:
+            return attr
+
+        self._wrapped[name] = wrapped
+        return wrapped
+
+    def __getitem__(self, name):
+        return TracedCollection(self._collection[name])
+
+
+class TracedDatabase:
+    """Proxy for a Motor database handing out TracedCollections"""
+
+    def __init__(self, database):
+        self._database = database
+        self._collections: Dict[str, TracedCollection] = {}
+
+    def __getitem__(self, name: str) -> TracedCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = TracedCollection(self._database[name])
+        return collection
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._database, name)
+        # Unknown attributes on a Motor database are collections
+        return self[name] if hasattr(attr, 'find_one') else attr
+
+
+# Admin endpoints
+
+trace_router = APIRouter(prefix="/api/admin/traces", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@trace_router.get("")
+async def list_traces(limit: int = 50, min_duration_ms: float = 0):
+    """Most recent sampled traces, newest first"""
+    traces = [t for t in reversed(trace_recorder.traces) if (t.duration_ms or 0) >= min_duration_ms][:limit]
+    return {
+        "sample_rate": TRACE_SAMPLE_RATE,
+        "traces": [
+            {"trace_id": t.trace_id, "name": t.name, "status": t.status,
+             "duration_ms": t.duration_ms, "spans": len(t.spans), "started_at": t.started_at}
+            for t in traces
+        ],
+    }
+
+
+@trace_router.get("/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = trace_recorder.find(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.to_dict()
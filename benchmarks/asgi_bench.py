@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+In-process ASGI benchmark
+
+Calls the FastAPI app over httpx.ASGITransport (no sockets) with Motor and
+EmailService replaced by in-memory fakes, and breaks the per-request cost
+of a few endpoints down into:
+
+    full           whole request through the app with all middleware
+    no_middleware  same request against the routers alone
+    handler        the endpoint coroutine called directly
+    validation     building the request body model from the JSON payload
+    serialization  response_model validation + JSON encoding, as FastAPI does
+    transport      a no-op ASGI app through the same client (subtracted)
+
+and derives middleware = full - no_middleware and framework = no_middleware
+- transport - handler - validation - serialization. The email templates are
+timed on their own. All times are microseconds per call.
+
+The email lanes get budgets high enough never to throttle, so notify_order
+measures the cost of a call rather than the transactional lane's per-minute
+budget: past the lane's burst a call answers with the mail queued without
+sending it.
+
+    python benchmarks/asgi_bench.py --iterations 2000
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+import httpx
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+os.environ.setdefault('EMAIL_LANES', 'transactional=4:1000000,notifications=2:1000000,marketing=1:1000000')
+
+import bench_app  # noqa: F401  installs the fake database
+from fakes import record_emails
+from load_test import contact_payload, order_payload, section_payload
+from report import compare, metadata, percentile, print_table, write_results
+import server
+
+SECTION_ID = 'section-1'
+PRODUCT_ID = 'product-1'
+
+
+class Case:
+    def __init__(self, method: str, path: str, payload: Optional[dict], model, handler: Callable,
+                 response_model: Any = None):
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.model = model
+        self.handler = handler
+        self.response_model = response_model
+
+
+CASES = {
+    'notify_order': Case(
+        'POST', '/api/orders/notify', order_payload(1), server.OrderData,
+        lambda body: server.notify_order(body)),
+    'save_content_section': Case(
+        'POST', f'/api/content/{SECTION_ID}', section_payload(1), server.ContentSectionCreate,
+        lambda body: server.save_content_section(SECTION_ID, body), server.ContentSection),
+    'get_product_reviews': Case(
+        'GET', f'/api/reviews/{PRODUCT_ID}', None, None,
+        lambda body: server.get_product_reviews(PRODUCT_ID)),
+}
+
+RENDERERS = {
+    'contact_form_notification': lambda s: s.send_contact_form_notification(contact_payload(1)),
+    'order_notification': lambda s: s.send_order_notification(order_payload(1)),
+    'customer_confirmation': lambda s: s.send_customer_confirmation(order_payload(1)),
+    'pre_order_notification': lambda s: s.send_pre_order_notification(checkout_payload(1)),
+    'order_complete_notification': lambda s: s.send_order_complete_notification(
+        {**checkout_payload(1), 'amount': 353.93}),
+    'business_digest': lambda s: s.send_business_digest(
+        [{**contact_payload(i), 'timestamp': datetime(2024, 5, 1, 9, i)} for i in range(5)],
+        [{**checkout_payload(i), 'amount': 353.93, 'payment_status': 'initiated',
+          'created_at': datetime(2024, 5, 1, 9, i)} for i in range(5)],
+        datetime(2024, 5, 1, 9), datetime(2024, 5, 1, 10)),
+}
+
+
+def checkout_payload(i: int) -> dict:
+    return {**order_payload(i), 'session_id': f'cs_test_{i}', 'cart_items': order_payload(i)['items'],
+            'subtotal': 299.94, 'tax': 38.99, 'shipping': 15.0, 'total': 353.93, 'currency': 'cad'}
+
+
+def serialize(content, response_model=None) -> bytes:
+    """FastAPI's response path: validate against response_model, then encode to JSON"""
+    if response_model is not None:
+        adapter = TypeAdapter(response_model)
+        content = adapter.dump_python(adapter.validate_python(jsonable_encoder(content)), mode='json')
+    else:
+        content = jsonable_encoder(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+async def measure(call, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await call()
+    gc.collect()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        await call()
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    return {
+        'mean_us': round(sum(timings) / len(timings) / 1000, 2),
+        'p50_us': round(percentile(timings, 50) / 1000, 2),
+        'p99_us': round(percentile(timings, 99) / 1000, 2),
+    }
+
+
+async def noop_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-length', b'2')]})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+def bare_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(server.api_router)
+    return app
+
+
+async def bench_case(case: Case, clients: dict, iterations: int, warmup: int) -> dict:
+    async def request(client):
+        response = await client.request(case.method, case.path, json=case.payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{case.method} {case.path} returned {response.status_code}: {response.text[:200]}")
+
+    body = case.model(**case.payload) if case.model else None
+    result = await case.handler(body)
+
+    async def validate():
+        case.model(**case.payload)
+
+    async def encode():
+        serialize(result, case.response_model)
+
+    row = {
+        'full': await measure(lambda: request(clients['full']), iterations, warmup),
+        'no_middleware': await measure(lambda: request(clients['bare']), iterations, warmup),
+        'transport': await measure(lambda: clients['noop'].get('/'), iterations, warmup),
+        'handler': await measure(lambda: case.handler(body), iterations, warmup),
+        'serialization': await measure(encode, iterations, warmup),
+    }
+    if case.model:
+        row['validation'] = await measure(validate, iterations, warmup)
+
+    mean = {name: m['mean_us'] for name, m in row.items()}
+    summary = {f'{name}_us': value for name, value in mean.items()}
+    summary['full_p99_us'] = row['full']['p99_us']
+    summary['middleware_us'] = round(mean['full'] - mean['no_middleware'], 2)
+    summary['framework_us'] = round(mean['no_middleware'] - mean['transport'] - mean['handler']
+                                    - mean.get('validation', 0) - mean['serialization'], 2)
+    return summary
+
+
+async def bench_renderers(iterations: int, warmup: int) -> dict:
+    results = {}
+    for name, render in RENDERERS.items():
+        async def call():
+            render(server.email_service)
+        results[name] = (await measure(call, iterations, warmup))['mean_us']
+    return results
+
+
+async def run(args) -> dict:
+    record_emails(server.email_service, keep=False)
+
+    def client(app):
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench')
+
+    clients = {'full': client(server.app), 'bare': client(bare_app()), 'noop': client(noop_app)}
+    try:
+        cases = {}
+        for name in args.cases:
+            cases[name] = await bench_case(CASES[name], clients, args.iterations, args.warmup)
+        renderers = await bench_renderers(args.iterations, args.warmup)
+    finally:
+        for c in clients.values():
+            await c.aclose()
+    return {'scenarios': cases, 'renderers': renderers}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', default=','.join(CASES), help=f"comma separated, from: {', '.join(CASES)}")
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--output', help='results file (default benchmarks/results/asgi-<rev>-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+    args.cases = [c for c in args.cases.split(',') if c]
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    try:
+        measured = asyncio.run(run(args))
+    finally:
+        server.shutdown_logging()
+
+    results = {'meta': metadata(kind='asgi', iterations=args.iterations), **measured}
+    print_table([{'case': k, **v} for k, v in measured['scenarios'].items()],
+                ['case', 'full_us', 'full_p99_us', 'middleware_us', 'framework_us', 'handler_us',
+                 'validation_us', 'serialization_us', 'transport_us'])
+    print()
+    print_table([{'template': k, 'render_us': v} for k, v in measured['renderers'].items()], ['template', 'render_us'])
+    path = write_results(results, args.output, 'asgi')
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare(args.compare, results, fields=('full_us', 'middleware_us', 'handler_us', 'serialization_us'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+The backend app wired to in-memory fakes, for benchmarks
+
+Importing this module imports ``server`` and swaps the Mongo database it
+shares with the payment routes for a FakeDatabase seeded with status
+checks, content sections and approved reviews. Run it under uvicorn with:
+
+    uvicorn bench_app:app --app-dir benchmarks
+
+Set SMTP_SERVER/SMTP_PORT/SENDER_PASSWORD to send email to a local sink;
+with no SENDER_PASSWORD EmailService skips delivery as usual.
+BENCH_MONGO_LATENCY_MS adds a simulated round trip to every fake Mongo call.
+The form rate limits are raised out of reach (unless RATE_LIMIT_* are set),
+as every benchmark request comes from the same address.
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from bson import ObjectId
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('SERVE_STATIC', 'false')
+for form in ('CONTACT', 'REVIEW', 'NEWSLETTER'):
+    for key in ('IP', 'EMAIL'):
+        os.environ.setdefault(f'RATE_LIMIT_{form}_{key}', '1000000/1')
+
+from fakes import FakeDatabase  # noqa: E402
+import payment_routes  # noqa: E402
+import server  # noqa: E402
+from tracing import TracedDatabase  # noqa: E402
+
+SEED_STATUS_CHECKS = 200
+SEED_SECTIONS = 20
+SEED_PRODUCTS = 10
+SEED_REVIEWS_PER_PRODUCT = 25
+
+fake_db = FakeDatabase(latency=float(os.environ.get('BENCH_MONGO_LATENCY_MS', 0)) / 1000)
+
+
+def seed(database: FakeDatabase):
+    now = datetime.utcnow()
+    for i in range(SEED_STATUS_CHECKS):
+        database.status_checks.documents.append({
+            '_id': ObjectId(),
+            'id': str(uuid.uuid4()),
+            'client_name': f'client-{i}',
+            'timestamp': now,
+        })
+    for i in range(SEED_SECTIONS):
+        database.content_sections.documents.append({
+            '_id': ObjectId(),
+            'id': str(uuid.uuid4()),
+            'section_id': f'section-{i}',
+            'content': f'<p>Section {i} content with <strong>markup</strong></p>' * 5,
+            'font_size': '16px',
+            'font_family': 'Inter',
+            'plain_text': f'Section {i} content with markup' * 5,
+            'timestamp': now,
+        })
+    for p in range(SEED_PRODUCTS):
+        for r in range(SEED_REVIEWS_PER_PRODUCT):
+            database.reviews.documents.append({
+                '_id': ObjectId(),
+                'id': str(uuid.uuid4()),
+                'productId': f'product-{p}',
+                'productName': f'Product {p}',
+                'rating': 1 + (r % 5),
+                'title': 'Great sign',
+                'content': 'Clear braille, solid acrylic, fast shipping. ' * 3,
+                'author': f'Customer {r}',
+                'email': f'customer{r}@example.com',
+                'timestamp': now.isoformat(),
+                'status': 'approved',
+                'helpful': r,
+                'verified': True,
+            })
+
+
+seed(fake_db)
+server.db = payment_routes.db = TracedDatabase(fake_db)
+
+app = server.app
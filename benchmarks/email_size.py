@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Email payload size report
+
+Renders every EmailService template with sample data and reports, per
+message, the HTML body as written in the template, after minification
+(email_html.minify_html) and with repeated inline styles collapsed into
+classes (EMAIL_STYLE_CLASSES=true), plus the size of the whole MIME message
+on the wire before (template HTML, MIMEText's default base64) and after
+(EmailService.build_message). Sizes in bytes; compact_us is the time
+compact_html adds to each send.
+
+    python benchmarks/email_size.py
+"""
+
+import argparse
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from asgi_bench import RENDERERS
+from fakes import record_emails
+from report import compare, metadata, print_table, write_results
+from email_html import collapse_styles, compact_html, minify_html
+from email_service import EmailService
+
+
+def legacy_message(email: dict) -> MIMEMultipart:
+    """The message as send_email built it before compaction"""
+    message = MIMEMultipart("alternative")
+    message["Subject"] = email['subject']
+    message["To"] = email['to']
+    if email['text']:
+        message.attach(MIMEText(email['text'], "plain"))
+    message.attach(MIMEText(email['html'], "html"))
+    return message
+
+
+def measure(email: dict, service: EmailService, iterations: int) -> dict:
+    html = email['html']
+    minified = minify_html(html)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        compact_html(html)
+    compact_us = (time.perf_counter() - start) / iterations * 1e6
+    before = len(legacy_message(email).as_bytes())
+    after = len(service.build_message(email['to'], email['subject'], html, email['text']).as_bytes())
+    return {
+        'html_bytes': len(html.encode()),
+        'minified_bytes': len(minified.encode()),
+        'classes_bytes': len(collapse_styles(minified).encode()),
+        'html_saved_pct': round(100 * (1 - len(minified) / len(html)), 1),
+        'mime_before': before,
+        'mime_after': after,
+        'mime_saved_pct': round(100 * (1 - after / before), 1),
+        'compact_us': round(compact_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50, help='compact_html timing iterations')
+    parser.add_argument('--output', help='results file (default benchmarks/results/email-<rev>-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    service = EmailService()
+    service.compact_html, service.style_classes = True, False
+    scenarios = {}
+    for name, render in RENDERERS.items():
+        sent = record_emails(service)
+        render(service)
+        for index, email in enumerate(sent):
+            scenarios[name if len(sent) == 1 else f'{name}[{index}]'] = measure(email, service, args.iterations)
+
+    results = {'meta': metadata(kind='email'), 'scenarios': scenarios}
+    print_table([{'template': k, **v} for k, v in scenarios.items()],
+                ['template', 'html_bytes', 'minified_bytes', 'classes_bytes', 'html_saved_pct',
+                 'mime_before', 'mime_after', 'mime_saved_pct', 'compact_us'])
+    path = write_results(results, args.output, 'email')
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare(args.compare, results, fields=('minified_bytes', 'mime_after'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+In-memory stand-ins for Motor used by the benchmarks
+
+Supports the subset of the Motor API the backend uses: find / find_one
+with equality, $in, $gt(e)/$lt(e) and $ne filters and (dotted) projections,
+insert_one, update_one / find_one_and_update with $set, $inc, $unset and
+$setOnInsert, delete_one / delete_many, count_documents and create_index
+(a no-op). ``latency`` adds an asyncio.sleep per operation to stand in for
+the round trip to a real server.
+
+record_emails() short-circuits an EmailService at the SMTP step so the
+templates still render but nothing is sent.
+"""
+
+import asyncio
+import copy
+from typing import Any, Dict, List, Optional
+
+import bson
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+
+def _matches(document: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        value = document.get(key)
+        if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+            for op, operand in condition.items():
+                if op == '$in' and value not in operand:
+                    return False
+                if op == '$nin' and value in operand:
+                    return False
+                if op == '$ne' and value == operand:
+                    return False
+                if op == '$exists' and (key in document) != bool(operand):
+                    return False
+                if op in ('$gt', '$gte', '$lt', '$lte'):
+                    if value is None:
+                        return False
+                    if op == '$gt' and not value > operand:
+                        return False
+                    if op == '$gte' and not value >= operand:
+                        return False
+                    if op == '$lt' and not value < operand:
+                        return False
+                    if op == '$lte' and not value <= operand:
+                        return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _copy(document: dict) -> dict:
+    """Copy through BSON, as a round trip to the server would (datetimes lose sub-ms precision)"""
+    return bson.decode(bson.encode(document))
+
+
+_OMIT = object()
+
+
+def _select(document: dict, paths: List[str]) -> dict:
+    """Inclusion projection with dotted paths, descending into arrays like Mongo"""
+    grouped: Dict[str, List[str]] = {}
+    for path in paths:
+        head, _, rest = path.partition('.')
+        grouped.setdefault(head, []).append(rest)
+    result = {}
+    for head, rests in grouped.items():
+        if head in document:
+            value = document[head] if '' in rests else _select_value(document[head], rests)
+            if value is not _OMIT:
+                result[head] = value
+    return result
+
+
+def _select_value(value, paths: List[str]):
+    if isinstance(value, dict):
+        return _select(value, paths)
+    if isinstance(value, list):
+        return [v for v in (_select_value(item, paths) for item in value) if v is not _OMIT]
+    return _OMIT
+
+
+def _project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return _copy(document)
+    include_id = projection.get('_id', 1)
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    if fields and all(fields.values()):
+        result = _select(document, list(fields))
+    else:
+        result = {k: v for k, v in document.items() if k not in fields}
+    if include_id and '_id' in document:
+        result['_id'] = document['_id']
+    else:
+        result.pop('_id', None)
+    return _copy(result)
+
+
+def _apply_update(document: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        if op == '$set' or (op == '$setOnInsert' and inserting):
+            document.update(copy.deepcopy(fields))
+        elif op == '$inc':
+            for key, amount in fields.items():
+                document[key] = document.get(key, 0) + amount
+        elif op == '$unset':
+            for key in fields:
+                document.pop(key, None)
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+
+
+class FakeCursor:
+    def __init__(self, collection: 'FakeCollection', query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self, length: Optional[int]) -> List[dict]:
+        documents = [d for d in self._collection.documents if _matches(d, self._query)]
+        for key, direction in reversed(self._sort):
+            documents.sort(key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        documents = documents[self._skip:]
+        for limit in (self._limit, length):
+            if limit:
+                documents = documents[:limit]
+        return [_project(d, self._projection) for d in documents]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self._collection.roundtrip()
+        return self._results(length)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._collection.roundtrip()
+        for document in self._results(None):
+            yield document
+
+
+class FakeCollection:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.documents: List[dict] = []
+
+    async def roundtrip(self):
+        await asyncio.sleep(self.latency)
+
+    def _first(self, query: Optional[dict]) -> Optional[dict]:
+        for document in self.documents:
+            if _matches(document, query):
+                return document
+        return None
+
+    async def create_index(self, *args, **kwargs):
+        return 'fake_index'
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        await self.roundtrip()
+        # Motor adds the generated _id to the caller's dict
+        document.setdefault('_id', ObjectId())
+        self.documents.append(_copy(document))
+        return InsertOneResult(document['_id'])
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        await self.roundtrip()
+        document = self._first(query)
+        return _project(document, projection) if document is not None else None
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> FakeCursor:
+        return FakeCursor(self, query, projection)
+
+    def _upsert(self, query: dict, update: dict) -> dict:
+        document = {k: copy.deepcopy(v) for k, v in query.items() if not isinstance(v, dict)}
+        if '_id' in document and any(d['_id'] == document['_id'] for d in self.documents):
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}")
+        document.setdefault('_id', ObjectId())
+        _apply_update(document, update, inserting=True)
+        self.documents.append(document)
+        return document
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.roundtrip()
+        document = self._first(query)
+        if document is None:
+            if upsert:
+                return UpdateResult(0, 0, self._upsert(query, update)['_id'])
+            return UpdateResult(0, 0)
+        _apply_update(document, update, inserting=False)
+        return UpdateResult(1, 1)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection: Optional[dict] = None,
+                                  upsert: bool = False, return_document: bool = False, **kwargs):
+        await self.roundtrip()
+        document = self._first(query)
+        if document is None:
+            if not upsert:
+                return None
+            document = self._upsert(query, update)
+            return _project(document, projection) if return_document else None
+        before = _project(document, projection)
+        _apply_update(document, update, inserting=False)
+        return _project(document, projection) if return_document else before
+
+    async def delete_one(self, query: dict) -> DeleteResult:
+        await self.roundtrip()
+        document = self._first(query)
+        if document is None:
+            return DeleteResult(0)
+        self.documents.remove(document)
+        return DeleteResult(1)
+
+    async def find_one_and_delete(self, query: dict, projection: Optional[dict] = None, sort=None, **kwargs):
+        cursor = self.find(query)
+        if sort:
+            cursor.sort(sort)
+        await self.roundtrip()
+        found = cursor._results(1)
+        if not found:
+            return None
+        document = self._first({'_id': found[0]['_id']})
+        self.documents.remove(document)
+        return _project(document, projection)
+
+    async def delete_many(self, query: dict) -> DeleteResult:
+        await self.roundtrip()
+        before = len(self.documents)
+        self.documents = [d for d in self.documents if not _matches(d, query)]
+        return DeleteResult(before - len(self.documents))
+
+    async def count_documents(self, query: Optional[dict] = None, **kwargs) -> int:
+        await self.roundtrip()
+        return sum(1 for d in self.documents if _matches(d, query))
+
+
+class FakeDatabase:
+    """Dict of FakeCollections reachable as ``db.name`` or ``db['name']``"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.collections[name] = FakeCollection(name, self.latency)
+        return collection
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+
+class SentEmails(list):
+    """What record_emails() captured; ``count`` keeps going when messages are not kept"""
+
+    count = 0
+
+
+def record_emails(service, keep: bool = True, result: bool = True) -> SentEmails:
+    """Replace ``service.send_email`` with a recorder returning ``result``"""
+    sent = SentEmails()
+
+    def send_email(to_email, subject, body_html, body_text=None):
+        sent.count += 1
+        if keep:
+            sent.append({'to': to_email, 'subject': subject, 'html': body_html, 'text': body_text})
+        return result
+
+    service.send_email = send_email
+    return sent
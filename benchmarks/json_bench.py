@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+JSON response class benchmark
+
+Serves GET /api/status and GET /api/content (the fake database is seeded
+with 200 status checks and 20 content sections) through two otherwise
+identical apps, one with the stdlib JSONResponse and one with
+ORJSONResponse, over httpx.ASGITransport. Also times the render step on
+its own. Microseconds per request. Both endpoints now return pre-rendered
+JSON (see server.json_response), so the two apps converge; use --compare
+against an earlier results file to track them across commits:
+
+    python benchmarks/json_bench.py --iterations 2000
+"""
+
+import argparse
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from asgi_bench import measure
+from report import compare, metadata, print_table, write_results
+import server
+
+PATHS = {'status_list': '/api/status', 'content_list': '/api/content'}
+RESPONSE_CLASSES = {'json': JSONResponse, 'orjson': ORJSONResponse}
+
+
+def build_app(response_class) -> FastAPI:
+    app = FastAPI(default_response_class=response_class)
+    app.include_router(server.api_router)
+    return app
+
+
+async def run(iterations: int, warmup: int) -> dict:
+    results = {}
+    for name, path in PATHS.items():
+        row = {}
+        for label, response_class in RESPONSE_CLASSES.items():
+            transport = httpx.ASGITransport(app=build_app(response_class))
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                response = await client.get(path)
+                response.raise_for_status()
+                row[f'{label}_us'] = (await measure(lambda: client.get(path), iterations, warmup))['mean_us']
+
+            content = jsonable_encoder(response.json())
+
+            async def render():
+                response_class(content)
+            row[f'{label}_render_us'] = (await measure(render, iterations, warmup))['mean_us']
+
+        row['bytes'] = len(response.content)
+        row['saved_us'] = round(row['json_us'] - row['orjson_us'], 2)
+        row['speedup'] = round(row['json_us'] / row['orjson_us'], 2)
+        results[name] = row
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--output', help='results file (default benchmarks/results/json-<rev>-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    try:
+        scenarios = asyncio.run(run(args.iterations, args.warmup))
+    finally:
+        server.shutdown_logging()
+
+    results = {'meta': metadata(kind='json', iterations=args.iterations), 'scenarios': scenarios}
+    print_table([{'endpoint': k, **v} for k, v in scenarios.items()],
+                ['endpoint', 'bytes', 'json_us', 'orjson_us', 'saved_us', 'speedup', 'json_render_us',
+                 'orjson_render_us'])
+    path = write_results(results, args.output, 'json')
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare(args.compare, results, fields=('json_us', 'orjson_us'))
+
+
+if __name__ == '__main__':
+    main()
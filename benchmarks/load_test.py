@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Load-testing benchmark suite
+
+Starts the backend under uvicorn with an in-memory Mongo stand-in
+(bench_app.py) and a local SMTP sink, then drives each endpoint at a fixed
+concurrency with an async HTTP client. Reports throughput and p50/p95/p99
+latency per scenario and writes everything to JSON so runs can be compared
+across commits:
+
+    python benchmarks/load_test.py --concurrency 1,16,64 --requests 2000
+    python benchmarks/load_test.py --scenarios order_notify,contact --compare benchmarks/results/old.json
+
+Use --url to load an already running server instead (no fakes are installed
+then). The client shares the machine with the server, so at high
+concurrency compare runs made on the same host only.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+from report import compare, metadata, print_table, summarize, write_results
+from smtp_sink import SmtpSink
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+
+def order_payload(i):
+    return {
+        'order_id': f'LOAD-{i}',
+        'customer_name': 'Load Test',
+        'customer_email': f'customer{i}@example.com',
+        'customer_phone': '555-0100',
+        'shipping_address': {'address': '1 Main St', 'city': 'Toronto', 'state': 'ON', 'zip': 'M5V 1A1', 'country': 'CA'},
+        'items': [{'name': f'Braille sign {n}', 'quantity': 1 + n, 'price': '49.99',
+                   'specifications': {'size': '8x8', 'color': 'black'}} for n in range(3)],
+        'subtotal': '299.94', 'shipping': '15.00', 'tax': '38.99', 'total': '353.93',
+        'notes': 'Deliver after 5pm',
+    }
+
+
+def contact_payload(i):
+    return {'name': 'Load Test', 'email': f'contact{i}@example.com', 'phone': '555-0100',
+            'subject': 'Custom Quote Request', 'message': 'Need 20 ADA room signs. ' * 5,
+            'company': 'Acme', 'urgency': 'normal', 'budget': '$1000'}
+
+
+def review_payload(i):
+    return {'productId': f'product-{i % 10}', 'productName': 'Room sign', 'rating': 5, 'title': 'Great',
+            'content': 'Solid sign. ' * 10, 'author': 'Load Test', 'email': f'review{i}@example.com',
+            'timestamp': '2024-01-01T00:00:00'}
+
+
+def section_payload(i):
+    return {'section_id': f'section-{i % 20}', 'content': '<p>Updated</p>' * 10, 'font_size': '16px',
+            'font_family': 'Inter', 'plain_text': 'Updated' * 10}
+
+
+# name -> i -> (method, path, json body)
+SCENARIOS = {
+    'root': lambda i: ('GET', '/api/', None),
+    'status_create': lambda i: ('POST', '/api/status', {'client_name': f'load-{i}'}),
+    'status_list': lambda i: ('GET', '/api/status', None),
+    'content_list': lambda i: ('GET', '/api/content', None),
+    'content_get': lambda i: ('GET', f'/api/content/section-{i % 20}', None),
+    'content_save': lambda i: ('POST', f'/api/content/section-{i % 20}', section_payload(i)),
+    'reviews_get': lambda i: ('GET', f'/api/reviews/product-{i % 10}', None),
+    'review_submit': lambda i: ('POST', '/api/reviews', review_payload(i)),
+    'newsletter': lambda i: ('POST', '/api/newsletter/subscribe',
+                             {'email': f'news{i}@example.com', 'subscribed_at': '2024-01-01T00:00:00'}),
+    'contact': lambda i: ('POST', '/api/contact', contact_payload(i)),
+    'order_notify': lambda i: ('POST', '/api/orders/notify', order_payload(i)),
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, build, concurrency: int, requests: int, duration: float,
+                       offset: int = 0) -> dict:
+    """Latency of every response; errors are failed requests and 4xx/5xx answers, by type in error_types"""
+    counter = itertools.count(offset)
+    latencies, statuses, error_types = [], Counter(), Counter()
+    last = offset + requests
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if (deadline is None and i >= last) or (deadline is not None and time.perf_counter() >= deadline):
+                return
+            method, path, body = build(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+            except httpx.HTTPError as e:
+                error_types[type(e).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code >= 400:
+                error_types[f'HTTP {response.status_code}'] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = summarize(latencies, time.perf_counter() - start, statuses, sum(error_types.values()))
+    if error_types:
+        summary['error_types'] = dict(error_types)
+    return summary
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int, env: dict) -> subprocess.Popen:
+    command = [sys.executable, '-m', 'uvicorn', 'bench_app:app', '--app-dir', str(BENCH_DIR),
+               '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+               '--log-level', 'warning', '--no-access-log']
+    return wait_until_ready(subprocess.Popen(command, env=env), port)
+
+
+def wait_until_ready(process: subprocess.Popen, port: int, timeout: float = 30) -> subprocess.Popen:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/api/', timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"server did not become ready within {timeout:.0f}s")
+
+
+async def run_all(args, base_url: str) -> dict:
+    results = {}
+    offset = 0
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        for name in args.scenarios:
+            build = SCENARIOS[name]
+            for concurrency in args.concurrency:
+                if args.warmup:
+                    await run_scenario(client, build, concurrency, args.warmup, 0, offset)
+                    offset += args.warmup
+                summary = await run_scenario(client, build, concurrency, args.requests, args.duration, offset)
+                offset += summary['requests'] + summary['errors']
+                results[f'{name}@c{concurrency}'] = summary
+                print(f"{name:>14} c={concurrency:<4} {summary['throughput_rps']:>9} req/s  "
+                      f"p50 {summary['p50_ms']:>8} ms  p95 {summary['p95_ms']:>8} ms  p99 {summary['p99_ms']:>8} ms  "
+                      f"statuses {summary['statuses']}" + (f"  errors {summary['error_types']}" if summary['errors'] else ''))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default='1,16,64', help='comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario and concurrency level')
+    parser.add_argument('--duration', type=float, default=0, help='run each level for this many seconds instead')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers (each has its own fake database)')
+    parser.add_argument('--mongo-latency-ms', type=float, default=0, help='simulated round trip per fake Mongo call')
+    parser.add_argument('--no-smtp', action='store_true', help='leave SENDER_PASSWORD unset so email is skipped')
+    parser.add_argument('--smtp-latency-ms', type=float, default=0, help='delay the SMTP sink adds per message')
+    parser.add_argument('--smtp-failure-rate', type=float, default=0, help='fraction of messages the sink rejects')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--url', help='benchmark this running server instead of starting one')
+    parser.add_argument('--output', help='results file (default benchmarks/results/load-<rev>-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(',') if s]
+    args.concurrency = [int(c) for c in args.concurrency.split(',') if c]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    sink, process = None, None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            env = dict(os.environ, BENCH_MONGO_LATENCY_MS=str(args.mongo_latency_ms))
+            if not args.no_smtp:
+                sink = SmtpSink(keep_messages=False, latency=args.smtp_latency_ms / 1000,
+                                failure_rate=args.smtp_failure_rate)
+                env.update(SMTP_SERVER='127.0.0.1', SMTP_PORT=str(sink.start_in_thread()),
+                           SENDER_PASSWORD='benchmark')
+            port = _free_port()
+            process = start_server(port, args.workers, env)
+            base_url = f'http://127.0.0.1:{port}'
+
+        scenarios = asyncio.run(run_all(args, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if sink is not None:
+            sink.stop_thread()
+
+    results = {
+        'meta': metadata(kind='load', url=args.url, workers=args.workers,
+                         mongo_latency_ms=args.mongo_latency_ms, smtp=sink is not None,
+                         smtp_latency_ms=args.smtp_latency_ms, smtp_failure_rate=args.smtp_failure_rate),
+        'config': {'concurrency': args.concurrency, 'requests': args.requests, 'duration': args.duration,
+                   'warmup': args.warmup},
+        'scenarios': scenarios,
+    }
+    if sink is not None:
+        results['smtp'] = sink.stats()
+
+    print()
+    print_table([{'scenario': k, **v} for k, v in scenarios.items()],
+                ['scenario', 'requests', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'errors'])
+    path = write_results(results, args.output, 'load')
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
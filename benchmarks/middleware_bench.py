@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Middleware stack benchmark
+
+Calls GET /api/ directly over ASGI (no sockets, no HTTP client) with each
+middleware layer switched on and off, and reports requests per second.
+With timing enabled it also prints the nanoseconds spent inside each layer.
+
+    python benchmarks/middleware_bench.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Motor connects lazily, so a placeholder URL is enough for /api/
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+import env  # noqa: E402,F401  (backend/.env first, as the server loads it)
+from fastapi import FastAPI  # noqa: E402
+from middleware_stack import LAYER_NAMES, install_middleware, layer_timings  # noqa: E402
+import server  # noqa: E402
+
+
+def build_app(enabled, timing=False):
+    app = FastAPI()
+    app.include_router(server.api_router)
+    install_middleware(app, disabled=[n for n in LAYER_NAMES if n not in enabled], timing=timing)
+    return app
+
+
+async def call(app, path, headers):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('127.0.0.1', 8001),
+    }
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run_config(name, app, requests, path, headers):
+    for _ in range(min(500, requests)):
+        await call(app, path, headers)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        status = await call(app, path, headers)
+        if status != 200:
+            raise RuntimeError(f"{name}: GET {path} returned {status}")
+    elapsed = time.perf_counter() - start
+    return {'config': name, 'requests': requests, 'seconds': elapsed, 'rps': requests / elapsed}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--path', default='/api/')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    # Browser-like request so CORS and gzip both have work to do
+    headers = [
+        (b'host', b'localhost'),
+        (b'origin', b'http://localhost:3000'),
+        (b'accept-encoding', b'gzip, deflate, br'),
+    ]
+
+    configs = [('none', [])]
+    configs += [(f'only {name}', [name]) for name in LAYER_NAMES]
+    configs += [(f'all but {name}', [n for n in LAYER_NAMES if n != name]) for name in LAYER_NAMES]
+    configs += [('all', list(LAYER_NAMES))]
+
+    results = []
+    for name, enabled in configs:
+        results.append(await run_config(name, build_app(enabled), args.requests, args.path, headers))
+
+    layer_timings.reset()
+    await run_config('all (timed)', build_app(LAYER_NAMES, timing=True), args.requests, args.path, headers)
+    per_layer = layer_timings.snapshot()
+
+    baseline = results[0]['rps']
+    print(f"\nGET {args.path} x {args.requests}")
+    print(f"{'config':<28}{'req/s':>12}{'us/req':>10}{'vs none':>10}")
+    for r in results:
+        print(f"{r['config']:<28}{r['rps']:>12.0f}{1e6 / r['rps']:>10.1f}{r['rps'] / baseline:>10.2f}")
+
+    print(f"\n{'layer':<28}{'avg ns':>12}{'max ns':>12}")
+    for name in LAYER_NAMES:
+        stats = per_layer.get(name, {})
+        print(f"{name:<28}{stats.get('avg_ns', 0):>12}{stats.get('max_ns', 0):>12}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'path': args.path, 'results': results, 'layers': per_layer}, f, indent=2)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Shared result handling for the benchmarks: percentiles, JSON output and
+comparison against an earlier run
+"""
+
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, statuses: Dict[int, int], errors: int = 0) -> dict:
+    """Throughput and latency percentiles (ms) for one scenario"""
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        'requests': total,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / total * 1000, 3) if total else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if total else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'errors': errors,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, timeout=10)
+        revision = result.stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+        return f"{revision}-dirty" if revision and dirty else revision or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def metadata(**extra) -> dict:
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        **extra,
+    }
+
+
+def write_results(results: dict, output: Optional[str], prefix: str) -> Path:
+    """Write results to ``output`` or benchmarks/results/<prefix>-<revision>-<time>.json"""
+    if output:
+        path = Path(output)
+    else:
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = RESULTS_DIR / f"{prefix}-{results['meta'].get('revision') or 'unknown'}-{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + '\n')
+    return path
+
+
+def print_table(rows: List[dict], columns: Sequence[str]):
+    widths = [max(len(c), *(len(str(r.get(c, ''))) for r in rows)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row.get(c, '')).ljust(w) for c, w in zip(columns, widths)))
+
+
+def compare(baseline_file: str, results: dict, key: str = 'scenarios',
+            fields: Sequence[str] = ('throughput_rps', 'p50_ms', 'p99_ms')):
+    """Print the relative change of each field against an earlier results file"""
+    baseline = json.loads(Path(baseline_file).read_text())
+    print(f"\nCompared with {baseline['meta'].get('revision')} ({baseline_file}):")
+    rows = []
+    for name, current in results[key].items():
+        previous = baseline.get(key, {}).get(name)
+        if previous is None:
+            continue
+        row = {'scenario': name}
+        for field in fields:
+            before, after = previous.get(field), current.get(field)
+            if before:
+                row[field] = f"{after} ({(after - before) / before * 100:+.1f}%)"
+            else:
+                row[field] = after
+        rows.append(row)
+    if rows:
+        print_table(rows, ['scenario', *fields])
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Server configuration benchmark
+
+Starts bench_app through the production launcher (backend/run.py) once per
+configuration - worker count, event loop and HTTP parser, gunicorn with and
+without preload, worker recycling, client keep-alive on and off - and
+drives the same scenarios against each. Reports throughput and latency per
+configuration plus how long the server took to become ready and its
+memory (PSS summed over the master and workers, so pages shared after a
+preload count once). Configurations whose server, uvloop or httptools is
+not installed are skipped.
+
+    python benchmarks/server_bench.py
+    python benchmarks/server_bench.py --configs uvicorn_1,uvicorn_n --workers 4 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from load_test import BENCH_DIR, SCENARIOS, _free_port, run_scenario, wait_until_ready
+from report import compare, metadata, print_table, write_results
+
+RUN_PY = BENCH_DIR.parent / 'backend' / 'run.py'
+
+# name -> (launcher flags, modules it needs, client keeps connections alive);
+# "{n}" is replaced by --workers
+CONFIGS = {
+    'uvicorn_1': (['--server', 'uvicorn', '--workers', '1', '--loop', 'asyncio', '--http', 'h11'], (), True),
+    'uvicorn_n': (['--server', 'uvicorn', '--workers', '{n}', '--loop', 'asyncio', '--http', 'h11'], (), True),
+    'uvicorn_n_no_keepalive': (['--server', 'uvicorn', '--workers', '{n}', '--loop', 'asyncio', '--http', 'h11'],
+                               (), False),
+    'uvloop_httptools_n': (['--server', 'uvicorn', '--workers', '{n}', '--loop', 'uvloop', '--http', 'httptools'],
+                           ('uvloop', 'httptools'), True),
+    'gunicorn_n_preload': (['--server', 'gunicorn', '--workers', '{n}'], ('gunicorn',), True),
+    'gunicorn_n_no_preload': (['--server', 'gunicorn', '--workers', '{n}', '--no-preload'], ('gunicorn',), True),
+    'gunicorn_n_recycle': (['--server', 'gunicorn', '--workers', '{n}', '--max-requests', '500'],
+                           ('gunicorn',), True),
+}
+
+
+def missing(modules) -> list:
+    return [m for m in modules if importlib.util.find_spec(m) is None]
+
+
+def _children(pid: int) -> list:
+    pids = []
+    for task in Path(f'/proc/{pid}/task').iterdir():
+        for child in (task / 'children').read_text().split():
+            pids += [int(child), *_children(int(child))]
+    return pids
+
+
+def memory_mb(pid: int) -> float:
+    """Proportional set size of a process tree, in MB"""
+    total_kb = 0
+    for process in (pid, *_children(pid)):
+        try:
+            for line in Path(f'/proc/{process}/smaps_rollup').read_text().splitlines():
+                if line.startswith('Pss:'):
+                    total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return round(total_kb / 1024, 1)
+
+
+def start(flags: list, workers: int, port: int, env: dict) -> subprocess.Popen:
+    command = [sys.executable, str(RUN_PY), '--app', 'bench_app:app', '--app-dir', str(BENCH_DIR),
+               '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', '--no-access-log',
+               '--no-proxy-headers',
+               *(flag.format(n=workers) for flag in flags)]
+    return wait_until_ready(subprocess.Popen(command, env=env), port, timeout=60)
+
+
+async def drive(args, base_url: str, keepalive: bool, offset: int) -> dict:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency,
+                          max_keepalive_connections=args.concurrency if keepalive else 0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        for name in args.scenarios:
+            if args.warmup:
+                await run_scenario(client, SCENARIOS[name], args.concurrency, args.warmup, 0, offset)
+                offset += args.warmup
+            results[name] = await run_scenario(client, SCENARIOS[name], args.concurrency, args.requests,
+                                               args.duration, offset)
+            offset += args.requests
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', default=','.join(CONFIGS), help=f"comma separated, from: {', '.join(CONFIGS)}")
+    parser.add_argument('--scenarios', default='root,status_list,reviews_get', help='load_test scenarios to run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='workers for the *_n configs')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--duration', type=float, default=0, help='run each scenario for this many seconds instead')
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='results file (default benchmarks/results/server-<rev>-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+    configs = [c for c in args.configs.split(',') if c]
+    args.scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(configs) - set(CONFIGS) | set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown configs or scenarios: {', '.join(sorted(unknown))}")
+
+    env = dict(os.environ, ADMISSION_CONTROL='false')
+    scenarios, servers, rows = {}, {}, []
+    for config in configs:
+        flags, needs, keepalive = CONFIGS[config]
+        if missing(needs):
+            print(f"{config:>24}  skipped ({', '.join(missing(needs))} not installed)")
+            continue
+        port = _free_port()
+        started = time.perf_counter()
+        process = start(flags, args.workers, port, env)
+        try:
+            ready_s = round(time.perf_counter() - started, 2)
+            idle_mb = memory_mb(process.pid)
+            results = asyncio.run(drive(args, f'http://127.0.0.1:{port}', keepalive, 0))
+            loaded_mb = memory_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+        servers[config] = {'ready_s': ready_s, 'idle_mb': idle_mb, 'loaded_mb': loaded_mb}
+        for name, summary in results.items():
+            scenarios[f'{name}@{config}'] = summary
+            rows.append({'scenario': name, 'config': config, **summary, **servers[config]})
+            print(f"{config:>24}  {name:>12}  {summary['throughput_rps']:>9} req/s  p50 {summary['p50_ms']:>8} ms  "
+                  f"p99 {summary['p99_ms']:>8} ms  ready {ready_s}s  {loaded_mb} MB")
+
+    results = {
+        'meta': metadata(kind='server', workers=args.workers),
+        'config': {'concurrency': args.concurrency, 'requests': args.requests, 'duration': args.duration,
+                   'warmup': args.warmup},
+        'servers': servers,
+        'scenarios': scenarios,
+    }
+    print()
+    print_table(rows, ['config', 'scenario', 'throughput_rps', 'p50_ms', 'p99_ms', 'errors', 'ready_s', 'idle_mb',
+                       'loaded_mb'])
+    path = write_results(results, args.output, 'server')
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare(args.compare, results)
+        compare(args.compare, results, key='servers', fields=('ready_s', 'idle_mb', 'loaded_mb'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Local SMTP sink for benchmarks
+
+An asyncio SMTP server that speaks enough ESMTP for smtplib - STARTTLS,
+AUTH PLAIN/LOGIN, MAIL/RCPT/DATA - and keeps what it receives in memory, so
+the real delivery path in EmailService can be exercised and load-tested
+without a network. Latency, transient failures (451), auth failures (535)
+and dropped connections can be injected to exercise timeout and retry
+handling. Point the backend at it with:
+
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SENDER_PASSWORD=x
+
+    python benchmarks/smtp_sink.py --port 2525 --latency-ms 200 --failure-rate 0.05
+
+STARTTLS uses a throwaway self-signed certificate made with the openssl
+CLI unless --certfile/--keyfile are given (smtplib does not verify the
+server certificate by default).
+"""
+
+import argparse
+import asyncio
+import base64
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+def self_signed_context(certfile: Optional[str] = None, keyfile: Optional[str] = None) -> ssl.SSLContext:
+    """Server SSLContext from the given files, or from a fresh self-signed localhost certificate"""
+    if certfile is None:
+        directory = Path(tempfile.mkdtemp(prefix='smtp-sink-'))
+        certfile, keyfile = str(directory / 'cert.pem'), str(directory / 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+                        '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+                       check=True, capture_output=True)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+class SmtpSink:
+    """Minimal ESMTP server recording messages, with fault injection.
+
+    ``credentials`` restricts AUTH to one (user, password) pair; by default
+    any login succeeds. ``require_tls`` rejects MAIL before STARTTLS.
+    ``latency`` (+ up to ``jitter``) seconds is added before each DATA reply;
+    ``failure_rate`` of messages get a 451, ``drop_rate`` have the
+    connection cut during DATA and ``auth_failure_rate`` of logins get a
+    535. All of these can be changed while the sink is running.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, keep_messages: bool = True,
+                 tls: bool = True, certfile: Optional[str] = None, keyfile: Optional[str] = None,
+                 credentials: Optional[Tuple[str, str]] = None, require_tls: bool = False,
+                 latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 drop_rate: float = 0.0, auth_failure_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.keep_messages = keep_messages
+        self.ssl_context = self_signed_context(certfile, keyfile) if tls else None
+        self.credentials = credentials
+        self.require_tls = require_tls
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.auth_failure_rate = auth_failure_rate
+        self.messages: List[dict] = []
+        self.counts = Counter()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: dict = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def message_count(self) -> int:
+        return self.counts['accepted']
+
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Closing the transports makes each handler's next read return EOF
+            for writer in list(self._handlers.values()):
+                writer.close()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_in_thread(self) -> int:
+        """Serve from a background thread with its own event loop; returns the port"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def stop_thread(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def _record(self, mail_from: str, rcpt_to: List[str], data: bytes):
+        self.counts['accepted'] += 1
+        if self.keep_messages:
+            self.messages.append({'from': mail_from, 'to': rcpt_to, 'data': data, 'received_at': time.time()})
+
+    def _check_login(self, username: str, password: str) -> bool:
+        if self.auth_failure_rate and random.random() < self.auth_failure_rate:
+            return False
+        return self.credentials is None or (username, password) == tuple(self.credentials)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.counts['connections'] += 1
+        self._handlers[asyncio.current_task()] = writer
+        tls_active = False
+        authenticated = False
+
+        async def reply(code: int, *lines: str):
+            lines = lines or ('OK',)
+            for line in lines[:-1]:
+                writer.write(f"{code}-{line}\r\n".encode())
+            writer.write(f"{code} {lines[-1]}\r\n".encode())
+            await writer.drain()
+
+        async def read_line() -> str:
+            return (await reader.readline()).decode('latin-1').rstrip('\r\n')
+
+        def decode(value: str) -> str:
+            try:
+                return base64.b64decode(value).decode('utf-8')
+            except (ValueError, UnicodeDecodeError):
+                return ''
+
+        mail_from, rcpt_to = None, []
+        try:
+            await reply(220, 'smtp-sink ESMTP ready')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode('latin-1').rstrip('\r\n').partition(' ')
+                command = command.upper()
+
+                if command == 'EHLO':
+                    extensions = ['AUTH PLAIN LOGIN', '8BITMIME', 'SIZE 10485760']
+                    if self.ssl_context is not None and not tls_active:
+                        extensions.insert(0, 'STARTTLS')
+                    await reply(250, 'smtp-sink', *extensions)
+                elif command == 'HELO':
+                    await reply(250, 'smtp-sink')
+                elif command == 'STARTTLS':
+                    if self.ssl_context is None or tls_active:
+                        await reply(503, 'TLS not available')
+                        continue
+                    await reply(220, 'Ready to start TLS')
+                    await writer.start_tls(self.ssl_context)
+                    tls_active, authenticated = True, False
+                    mail_from, rcpt_to = None, []
+                    self.counts['tls_upgrades'] += 1
+                elif command == 'AUTH':
+                    mechanism, _, initial = argument.partition(' ')
+                    mechanism = mechanism.upper()
+                    if mechanism == 'PLAIN':
+                        if not initial:
+                            await reply(334, '')
+                            initial = await read_line()
+                        _, _, credentials = decode(initial).partition('\0')
+                        username, _, password = credentials.partition('\0')
+                    elif mechanism == 'LOGIN':
+                        await reply(334, base64.b64encode(b'Username:').decode())
+                        username = decode(await read_line())
+                        await reply(334, base64.b64encode(b'Password:').decode())
+                        password = decode(await read_line())
+                    else:
+                        await reply(504, 'Unrecognized authentication type')
+                        continue
+                    if self._check_login(username, password):
+                        authenticated = True
+                        self.counts['auth_ok'] += 1
+                        await reply(235, 'Authentication successful')
+                    else:
+                        self.counts['auth_failed'] += 1
+                        await reply(535, 'Authentication credentials invalid')
+                elif command == 'MAIL':
+                    if self.require_tls and not tls_active:
+                        await reply(530, 'Must issue a STARTTLS command first')
+                        continue
+                    if self.credentials is not None and not authenticated:
+                        await reply(530, 'Authentication required')
+                        continue
+                    mail_from, rcpt_to = argument.partition(':')[2].strip(), []
+                    await reply(250)
+                elif command == 'RCPT':
+                    if mail_from is None:
+                        await reply(503, 'Need MAIL command')
+                        continue
+                    rcpt_to.append(argument.partition(':')[2].strip())
+                    await reply(250)
+                elif command == 'DATA':
+                    if not rcpt_to:
+                        await reply(503, 'Need RCPT command')
+                        continue
+                    await reply(354, 'End data with <CR><LF>.<CR><LF>')
+                    data = await reader.readuntil(b'\r\n.\r\n')
+                    if self.latency or self.jitter:
+                        await asyncio.sleep(self.latency + random.random() * self.jitter)
+                    if self.drop_rate and random.random() < self.drop_rate:
+                        self.counts['dropped'] += 1
+                        break
+                    if self.failure_rate and random.random() < self.failure_rate:
+                        self.counts['rejected'] += 1
+                        await reply(451, 'Temporary failure, try again later')
+                    else:
+                        self._record(mail_from, rcpt_to, data[:-5])
+                        await reply(250, 'Queued')
+                    mail_from, rcpt_to = None, []
+                elif command == 'RSET':
+                    mail_from, rcpt_to = None, []
+                    await reply(250)
+                elif command == 'NOOP':
+                    await reply(250)
+                elif command == 'QUIT':
+                    await reply(221, 'Bye')
+                    break
+                else:
+                    await reply(502, 'Command not implemented')
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--no-tls', action='store_true', help='do not offer STARTTLS')
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--user', help='only accept this username (with --password)')
+    parser.add_argument('--password')
+    parser.add_argument('--require-tls', action='store_true')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0, help='fraction of messages answered with 451')
+    parser.add_argument('--drop-rate', type=float, default=0, help='fraction of connections cut during DATA')
+    parser.add_argument('--auth-failure-rate', type=float, default=0, help='fraction of logins answered with 535')
+    args = parser.parse_args()
+
+    sink = SmtpSink(args.host, args.port, keep_messages=False, tls=not args.no_tls,
+                    certfile=args.certfile, keyfile=args.keyfile,
+                    credentials=(args.user, args.password) if args.user else None, require_tls=args.require_tls,
+                    latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, failure_rate=args.failure_rate,
+                    drop_rate=args.drop_rate, auth_failure_rate=args.auth_failure_rate)
+    await sink.start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(sink.stats())
+    finally:
+        await sink.stop()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
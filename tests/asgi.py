@@ -0,0 +1,29 @@
+"""
+Helpers for driving ASGI apps in tests without a server or an HTTP client
+(httpx would undo Content-Encoding before the test sees the body).
+"""
+
+import asyncio
+
+from starlette.datastructures import Headers
+
+
+def call(app, path='/', headers=None, method='GET'):
+    """Run one request through an ASGI app; returns (status, headers, body)"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': query.encode(),
+        'headers': [(k.lower().encode(), v if isinstance(v, bytes) else v.encode())
+                    for k, v in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    return start['status'], Headers(raw=start['headers']), b''.join(m.get('body', b'') for m in messages[1:])
@@ -0,0 +1,47 @@
+"""
+Admin token check: wrong, missing and non-ASCII tokens are refused with a
+403 rather than an error.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import admin_auth  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', 'sécret')
+    app = FastAPI()
+
+    @app.get('/admin', dependencies=[Depends(admin_auth.require_admin)])
+    async def admin():
+        return {'ok': True}
+
+    return TestClient(app)
+
+
+def test_is_admin_token(monkeypatch):
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', 'secret')
+    assert admin_auth.is_admin_token('secret')
+    assert not admin_auth.is_admin_token('Secret')
+    assert not admin_auth.is_admin_token(None)
+    assert not admin_auth.is_admin_token('sécret')
+    assert not admin_auth.is_admin_token('\udcff')
+
+
+def test_non_ascii_header_is_forbidden(client):
+    assert client.get('/admin', headers={'X-Admin-Token': 'tök€n'.encode()}).status_code == 403
+    assert client.get('/admin', headers={'X-Admin-Token': b'\xe9'}).status_code == 403
+    assert client.get('/admin').status_code == 403
+
+
+def test_no_token_configured_hides_the_endpoint(client, monkeypatch):
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', '')
+    assert client.get('/admin', headers={'X-Admin-Token': 'anything'}).status_code == 404
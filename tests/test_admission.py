@@ -0,0 +1,159 @@
+"""
+Admission control: the Limiter's FIFO hand-off, queue_full and timeout
+rejections, a waiter cancelled just after being handed a slot, and the
+middleware's 503 with Retry-After.
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from admission import AdmissionMiddleware, Limiter, RouteClass  # noqa: E402
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_admits_up_to_the_limit_then_hands_slots_over_in_order():
+    async def scenario():
+        limiter = Limiter(limit=2, queue_size=10, max_wait=1)
+        assert await limiter.acquire() is None
+        assert await limiter.acquire() is None
+        waiters = [asyncio.create_task(limiter.acquire()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert not any(w.done() for w in waiters)
+        limiter.release()
+        assert await asyncio.wait_for(waiters[0], 1) is None
+        assert [w.done() for w in waiters] == [True, False, False]
+        limiter.release()
+        limiter.release()
+        assert await asyncio.gather(*waiters) == [None, None, None]
+        assert limiter.active == 2
+        for _ in range(2):
+            limiter.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_queue_full():
+    async def scenario():
+        limiter = Limiter(limit=1, queue_size=1, max_wait=1)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert await limiter.acquire() == 'queue_full'
+        limiter.release()
+        assert await queued is None
+
+    run(scenario())
+
+
+def test_timeout_leaves_the_queue():
+    async def scenario():
+        limiter = Limiter(limit=1, queue_size=1, max_wait=0.01)
+        await limiter.acquire()
+        assert await limiter.acquire() == 'timeout'
+        assert not limiter._waiters
+        # The freed queue place can be used again
+        assert await limiter.acquire() == 'timeout'
+        limiter.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_cancelled_waiter_is_removed():
+    async def scenario():
+        limiter = Limiter(limit=1, queue_size=5, max_wait=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not limiter._waiters
+        limiter.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+@pytest.mark.parametrize('next_in_line', [True, False])
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on(next_in_line):
+    async def scenario():
+        limiter = Limiter(limit=1, queue_size=5, max_wait=1)
+        await limiter.acquire()
+        handed = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        following = asyncio.create_task(limiter.acquire()) if next_in_line else None
+        await asyncio.sleep(0)
+        # The slot goes to ``handed``, which is cancelled before it resumes
+        limiter.release()
+        handed.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await handed
+        if next_in_line:
+            assert await asyncio.wait_for(following, 1) is None
+            assert limiter.active == 1
+            limiter.release()
+        assert limiter.active == 0
+        assert not limiter._waiters
+
+    run(scenario())
+
+
+def call(app, path):
+    """The request coroutine for ``path`` and the list its messages are sent to"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': []}
+    return app(scope, receive, send), messages
+
+
+def test_middleware_sheds_with_503_and_retry_after():
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def app(scope, receive, send):
+            calls.append(scope['path'])
+            await release.wait()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'ok'})
+
+        route_class = RouteClass('admission_test', ('/api/',), limit=1, queue_size=0, max_wait=1, retry_after=7)
+        middleware = AdmissionMiddleware(app, enabled=True, classes=[route_class])
+
+        first, first_messages = call(middleware, '/api/slow')
+        first = asyncio.create_task(first)
+        await asyncio.sleep(0)
+        shed, shed_messages = call(middleware, '/api/other')
+        await shed
+        start, body = shed_messages
+        assert start['status'] == 503
+        assert dict(start['headers'])[b'retry-after'] == b'7'
+        assert json.loads(body['body']) == {'detail': 'Server is busy, please retry shortly'}
+
+        # Not limited: outside every route class
+        unlimited, unlimited_messages = call(middleware, '/metrics')
+        release.set()
+        await asyncio.gather(first, unlimited)
+        assert first_messages[0]['status'] == 200
+        assert unlimited_messages[0]['status'] == 200
+        assert calls == ['/api/slow', '/metrics']
+        assert route_class.limiter.active == 0
+
+    run(scenario())
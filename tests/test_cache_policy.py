@@ -0,0 +1,72 @@
+"""
+Cache policy: API paths are never cached whatever they end in, hashed
+build output is immutable, other static files are matched on the extension
+of the last path segment, and error responses only carry no-store.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from cache_policy import (  # noqa: E402
+    DEFAULT_CACHE_POLICY, IMAGES, IMMUTABLE, NO_STORE, STATIC, CacheHeadersMiddleware, CachePolicy)
+from tests.asgi import call  # noqa: E402
+
+
+@pytest.mark.parametrize('path, headers', [
+    ('/api/', NO_STORE),
+    ('/api/status', NO_STORE),
+    ('/api/reviews/x.png', NO_STORE),
+    ('/api/foo.png.json', NO_STORE),
+    ('/api/content/app.js', NO_STORE),
+    ('/assets/index-3f2a1b.js', IMMUTABLE),
+    ('/assets/logo.png', IMMUTABLE),
+    ('/img/sign.JPG', IMAGES),
+    ('/favicon.ico', IMAGES),
+    ('/fonts/inter.woff2', STATIC),
+    ('/styles.css', STATIC),
+    ('/photo.png.json', None),
+    ('/v1.2/readme', None),
+    ('/products/42', None),
+    ('/', None),
+])
+def test_default_policy(path, headers):
+    assert DEFAULT_CACHE_POLICY.headers_for(path) == headers
+
+
+def test_earlier_extension_rule_beats_a_later_prefix():
+    policy = CachePolicy([('ext', ['png'], IMAGES), ('prefix', '/media/', STATIC)])
+    assert policy.headers_for('/media/a.png') == IMAGES
+    assert policy.headers_for('/media/a.txt') == STATIC
+
+
+def test_unknown_rule_kind():
+    with pytest.raises(ValueError):
+        CachePolicy([('suffix', '.png', IMAGES)])
+
+
+def respond(status):
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': status, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+    return CacheHeadersMiddleware(app)
+
+
+def test_middleware_stamps_headers():
+    _, headers, _ = call(respond(200), '/img/sign.png')
+    assert headers['cache-control'] == IMAGES['Cache-Control']
+    _, headers, _ = call(respond(200), '/api/reviews/x.png')
+    assert headers['cache-control'] == NO_STORE['Cache-Control']
+    assert headers['pragma'] == 'no-cache'
+    _, headers, _ = call(respond(200), '/products/42')
+    assert 'cache-control' not in headers
+
+
+def test_errors_do_not_get_public_caching():
+    _, headers, _ = call(respond(404), '/assets/missing.js')
+    assert 'cache-control' not in headers
+    _, headers, _ = call(respond(500), '/api/status')
+    assert headers['cache-control'] == NO_STORE['Cache-Control']
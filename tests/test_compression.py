@@ -0,0 +1,175 @@
+"""
+CompressionMiddleware: Accept-Encoding negotiation, what gets compressed
+(size threshold, content type, streaming bodies) and the Vary it adds,
+and that the compressed body cache never serves one response's bytes for
+another.
+"""
+
+import gzip
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from compression import CompressedBodyCache, CompressionMiddleware, negotiate_encoding  # noqa: E402
+from static_files import StaticAssets  # noqa: E402
+from tests.asgi import call  # noqa: E402
+
+JS = b''.join(b'console.log("line %d");\n' % i for i in range(250))[:5000]
+
+
+def body_app(body, etag=None, status=200, content_type='application/json'):
+    async def app(scope, receive, send):
+        headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+        if etag:
+            headers.append((b'etag', etag.encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+    return app
+
+
+def stream_app(chunks, content_type='text/plain'):
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type.encode())]})
+        for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    return app
+
+
+def compressed(app, **options):
+    return CompressionMiddleware(app, cache=CompressedBodyCache(1024 * 1024), **options)
+
+
+def static_app(tmp_path):
+    (tmp_path / 'app.js').write_bytes(JS)
+    return StaticAssets([tmp_path])
+
+
+def test_range_request_is_not_compressed(tmp_path):
+    app = compressed(static_app(tmp_path))
+    status, headers, body = call(app, '/app.js', {'Range': 'bytes=0-1999', 'Accept-Encoding': 'gzip'})
+    assert status == 206
+    assert 'content-encoding' not in headers
+    assert headers['content-range'] == f'bytes 0-1999/{len(JS)}'
+    assert body == JS[:2000]
+
+
+def test_full_response_after_range_request_is_complete(tmp_path):
+    app = compressed(static_app(tmp_path))
+    call(app, '/app.js', {'Range': 'bytes=0-1999', 'Accept-Encoding': 'gzip'})
+    status, headers, body = call(app, '/app.js', {'Accept-Encoding': 'gzip'})
+    assert status == 200
+    assert headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(body) == JS
+    # and again from the cache
+    assert gzip.decompress(call(app, '/app.js', {'Accept-Encoding': 'gzip'})[2]) == JS
+
+
+def test_non_200_responses_pass_through():
+    body = b'{"detail": "missing"}' * 100
+    status, headers, sent = call(compressed(body_app(body, status=404)), '/x', {'Accept-Encoding': 'gzip'})
+    assert status == 404
+    assert 'content-encoding' not in headers
+    assert sent == body
+
+
+def test_weak_and_strong_etags_do_not_share_a_cache_entry():
+    cache = CompressedBodyCache(1024 * 1024)
+    strong, weak = b'{"v": "strong"}' * 100, b'{"v": "weak"}' * 100
+    call(CompressionMiddleware(body_app(strong, '"v1"'), cache=cache), '/a', {'Accept-Encoding': 'gzip'})
+    body = call(CompressionMiddleware(body_app(weak, 'W/"v1"'), cache=cache), '/a', {'Accept-Encoding': 'gzip'})[2]
+    assert gzip.decompress(body) == weak
+
+
+def test_same_etag_on_different_paths_does_not_share_a_cache_entry():
+    cache = CompressedBodyCache(1024 * 1024)
+    first, second = b'{"path": "a"}' * 100, b'{"path": "b"}' * 100
+    call(CompressionMiddleware(body_app(first, '"same"'), cache=cache), '/a', {'Accept-Encoding': 'gzip'})
+    body = call(CompressionMiddleware(body_app(second, '"same"'), cache=cache), '/b', {'Accept-Encoding': 'gzip'})[2]
+    assert gzip.decompress(body) == second
+
+
+ALL = ['br', 'zstd', 'gzip']
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip, deflate, br, zstd', 'br'),
+    ('gzip, zstd', 'zstd'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('br;q=0.8, zstd;q=0.9, gzip;q=0.1', 'zstd'),
+    ('GZIP', 'gzip'),
+    ('*', 'br'),
+    ('*, br;q=0', 'zstd'),
+    ('gzip;q=0', None),
+    ('gzip;q=nonsense', None),
+    ('identity;q=0', None),
+    ('deflate', None),
+    ('', None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding, ALL) == expected
+
+
+def test_negotiation_only_offers_what_is_supported():
+    assert negotiate_encoding('br, zstd, gzip;q=0.5', ['gzip']) == 'gzip'
+
+
+@pytest.mark.parametrize('encoding, decompress', [
+    ('gzip', gzip.decompress),
+    ('br', lambda body: pytest.importorskip('brotli').decompress(body)),
+    ('zstd', lambda body: pytest.importorskip('zstandard').ZstdDecompressor().decompress(body)),
+])
+def test_compresses_with_the_negotiated_encoding(encoding, decompress):
+    body = b'{"items": []}' * 100
+    status, headers, sent = call(compressed(body_app(body)), '/x', {'Accept-Encoding': f'{encoding}, identity'})
+    assert headers['content-encoding'] == encoding
+    assert headers['content-length'] == str(len(sent))
+    assert headers['vary'] == 'Accept-Encoding'
+    assert decompress(sent) == body
+
+
+def test_without_accept_encoding_the_response_is_untouched():
+    body = b'{"items": []}' * 100
+    status, headers, sent = call(compressed(body_app(body)), '/x', {'Accept-Encoding': 'identity;q=0'})
+    assert 'content-encoding' not in headers
+    assert sent == body
+
+
+def test_small_bodies_are_sent_as_is_but_vary():
+    body = b'{"ok": true}'
+    status, headers, sent = call(compressed(body_app(body), minimum_size=100), '/x', {'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in headers
+    assert headers['vary'] == 'Accept-Encoding'
+    assert sent == body
+    status, headers, sent = call(compressed(body_app(body), minimum_size=5), '/x', {'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(sent) == body
+
+
+def test_vary_is_added_to_the_existing_one():
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/html'), (b'vary', b'Origin')]})
+        await send({'type': 'http.response.body', 'body': b'<p>hello</p>' * 200})
+
+    status, headers, sent = call(compressed(app), '/', {'Accept-Encoding': 'gzip'})
+    assert headers['vary'] == 'Origin, Accept-Encoding'
+
+
+def test_incompressible_types_pass_through():
+    body = bytes(range(256)) * 20
+    status, headers, sent = call(compressed(body_app(body, content_type='image/png')), '/x.png',
+                                 {'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in headers
+    assert sent == body
+
+
+def test_streaming_bodies_are_compressed_incrementally():
+    chunks = [b'line %d\n' % i * 50 for i in range(20)]
+    status, headers, sent = call(compressed(stream_app(chunks)), '/stream', {'Accept-Encoding': 'gzip'})
+    assert headers['content-encoding'] == 'gzip'
+    assert headers['vary'] == 'Accept-Encoding'
+    assert 'content-length' not in headers
+    assert gzip.decompress(sent) == b''.join(chunks)
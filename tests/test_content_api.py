@@ -0,0 +1,49 @@
+"""
+Content section endpoints against the in-memory database the benchmarks
+use: a saved section round-trips, a missing one is a 404 (as documented
+in the OpenAPI schema) rather than ``200 null``.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import server  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+
+SECTION = {'section_id': 'hero', 'content': '<p>Braille signs</p>', 'font_size': '16px',
+           'font_family': 'Inter', 'plain_text': 'Braille signs'}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, 'db', FakeDatabase())
+    app = FastAPI()
+    app.include_router(server.api_router)
+    return TestClient(app)
+
+
+def test_saved_section_round_trips(client):
+    assert client.post('/api/content/hero', json=SECTION).status_code == 200
+    response = client.get('/api/content/hero')
+    assert response.status_code == 200
+    assert {k: response.json()[k] for k in SECTION} == SECTION
+
+
+def test_missing_section_is_404(client):
+    response = client.get('/api/content/missing')
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'Content section not found'}
+
+
+def test_openapi_documents_the_404(client):
+    responses = client.get('/openapi.json').json()['paths']['/api/content/{section_id}']['get']['responses']
+    assert '404' in responses
+    assert responses['200']['content']['application/json']['schema'] == {'$ref': '#/components/schemas/ContentSection'}
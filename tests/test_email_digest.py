@@ -0,0 +1,101 @@
+"""
+Business digest: the first run only starts a period, a due period is
+claimed by one of several workers, a failed send hands the period back
+for the next digest, and an empty period sends nothing.
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import email_digest  # noqa: E402
+from email_digest import BusinessDigest  # noqa: E402
+from email_dispatcher import QUEUED  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+
+
+class StubDispatcher:
+    def __init__(self, result=True):
+        self.result = result
+        self.sent = []
+
+    async def send(self, lane, send, contacts, pre_orders, since, now):
+        self.sent.append((lane, [c['name'] for c in contacts], since))
+        return self.result
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    dispatcher = StubDispatcher()
+    monkeypatch.setattr(email_digest, 'email_dispatcher', dispatcher)
+    return dispatcher
+
+
+def digest(db) -> BusinessDigest:
+    digest = BusinessDigest(minutes=15, poll_seconds=60)
+    digest.db = db
+    return digest
+
+
+def due_period(db, contacts=('Ada',)):
+    """A period that started 20 minutes ago, due 5 minutes ago, with ``contacts`` submitted in it"""
+    # Whole seconds, as Mongo keeps only milliseconds
+    now = datetime.utcnow().replace(microsecond=0)
+    since = now - timedelta(minutes=20)
+    db.email_digests.documents.append({'_id': 'business', 'since': since, 'due': now - timedelta(minutes=5)})
+    for name in contacts:
+        db.contact_submissions.documents.append({'name': name, 'email': f'{name}@example.com', 'message': 'Hi',
+                                                 'timestamp': now - timedelta(minutes=10)})
+    return since
+
+
+def test_first_run_starts_a_period_without_sending(dispatcher):
+    db = FakeDatabase()
+    assert asyncio.run(digest(db).send_due()) is None
+    [state] = db.email_digests.documents
+    assert state['due'] - state['since'] == timedelta(minutes=15)
+    # Not due yet on the next poll either
+    assert asyncio.run(digest(db).send_due()) is None
+    assert dispatcher.sent == []
+
+
+def test_due_period_is_sent_by_one_worker(dispatcher):
+    db = FakeDatabase(latency=0.001)
+    since = due_period(db, ['Ada', 'Grace'])
+
+    async def workers():
+        return await asyncio.gather(*(digest(db).send_due() for _ in range(3)))
+
+    assert sorted(asyncio.run(workers()), key=str) == [None, None, True]
+    assert dispatcher.sent == [('notifications', ['Ada', 'Grace'], since)]
+    [state] = db.email_digests.documents
+    assert state['since'] > since
+    assert state['due'] - state['since'] == timedelta(minutes=15)
+
+
+@pytest.mark.parametrize('result, rolled_back', [(False, True), (QUEUED, False), (True, False)])
+def test_failed_send_hands_the_period_back(dispatcher, result, rolled_back):
+    dispatcher.result = result
+    db = FakeDatabase()
+    since = due_period(db)
+    assert asyncio.run(digest(db).send_due()) == result
+    [state] = db.email_digests.documents
+    # The next digest starts from the failed one's period, so nothing is missed
+    assert (state['since'] == since) is rolled_back
+    assert state['due'] > datetime.utcnow()
+
+
+def test_empty_period_is_skipped(dispatcher):
+    db = FakeDatabase()
+    since = due_period(db, contacts=())
+    assert asyncio.run(digest(db).send_due()) is None
+    assert dispatcher.sent == []
+    [state] = db.email_digests.documents
+    assert state['since'] > since
@@ -0,0 +1,138 @@
+"""
+EmailDispatcher lanes: parsing EMAIL_LANES, SMTP sessions going to the
+highest priority waiter, the per-lane budget refilling, and send() answering
+QUEUED when the mail has to wait for its lane's budget or takes longer than
+request_wait.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from email_dispatcher import DEFAULT_LANES, QUEUED, EmailDispatcher, PrioritySlots, parse_lanes  # noqa: E402
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_parse_lanes():
+    lanes = parse_lanes(' transactional=4:1200, notifications=2 ,marketing=:20,')
+    assert [(lane.name, lane.priority, lane.concurrency, lane.per_minute) for lane in lanes] == [
+        ('transactional', 0, 4, 1200.0),
+        ('notifications', 1, 2, 60.0),
+        ('marketing', 2, 1, 20.0),
+    ]
+    assert lanes[0].bucket.rate == 20
+    assert lanes[0].bucket.burst == 4
+
+
+def test_default_transactional_lane_keeps_up_with_orders():
+    transactional = parse_lanes(DEFAULT_LANES)[0]
+    # Two emails an order, ten orders a second
+    assert transactional.name == 'transactional'
+    assert transactional.per_minute / 60 >= 20
+
+
+def test_priority_slots_go_to_the_highest_priority_waiter():
+    async def scenario():
+        slots = PrioritySlots(1)
+        await slots.acquire(2)
+        order = []
+
+        async def waiter(priority, name):
+            await slots.acquire(priority)
+            order.append(name)
+            slots.release()
+
+        tasks = [asyncio.create_task(waiter(p, n)) for p, n in [(2, 'marketing'), (1, 'notify'), (0, 'order'), (0, 'order-2')]]
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*tasks)
+        # Highest priority first, first come first served within a priority
+        assert order == ['order', 'order-2', 'notify', 'marketing']
+        assert slots.free == 1
+
+    run(scenario())
+
+
+def test_cancelled_slot_waiter_is_skipped():
+    async def scenario():
+        slots = PrioritySlots(1)
+        await slots.acquire(0)
+        cancelled = asyncio.create_task(slots.acquire(0))
+        later = asyncio.create_task(slots.acquire(1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        slots.release()
+        await asyncio.wait_for(later, 1)
+        slots.release()
+        assert slots.free == 1
+
+    run(scenario())
+
+
+def test_lane_budget_refills_over_time():
+    bucket = parse_lanes('transactional=2:60')[0].bucket
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.retry_after() == pytest.approx(1, abs=0.05)
+    # One token a second
+    bucket.updated -= 1.5
+    assert bucket.available() == pytest.approx(1.5, abs=0.05)
+    assert bucket.try_acquire()
+    # Never more than the burst
+    bucket.updated -= 60
+    assert bucket.available() == 2
+
+
+def sender(sent, delay=0.0):
+    async def runner(send, *args):
+        await asyncio.sleep(delay)
+        return send(*args)
+
+    def send_mail(order_id):
+        sent.append(order_id)
+        return True
+
+    return runner, send_mail
+
+
+def test_mail_past_the_lane_budget_is_queued_without_waiting():
+    async def scenario():
+        sent = []
+        runner, send_mail = sender(sent)
+        dispatcher = EmailDispatcher(parse_lanes('transactional=2:60'), 2, runner, request_wait=5)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(dispatcher.send('transactional', send_mail, i) for i in range(3))), 1)
+        # The burst goes out; the third answers at once and waits for a token
+        assert results == [True, True, QUEUED]
+        assert dispatcher.pending() == 1
+        # and goes out once the budget refills, a second later
+        while dispatcher.pending():
+            await asyncio.sleep(0.01)
+        assert sent == [0, 1, 2]
+        await dispatcher.stop()
+
+    run(scenario())
+
+
+def test_slow_send_answers_queued_after_request_wait():
+    async def scenario():
+        sent = []
+        runner, send_mail = sender(sent, delay=0.2)
+        dispatcher = EmailDispatcher(parse_lanes('transactional=1:60000'), 1, runner, request_wait=0.05)
+        assert await dispatcher.send('transactional', send_mail, 'slow') == QUEUED
+        # Still sent, after the request has answered
+        while dispatcher.pending():
+            await asyncio.sleep(0.01)
+        assert sent == ['slow']
+        await dispatcher.stop()
+
+    run(scenario())
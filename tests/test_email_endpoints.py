@@ -0,0 +1,102 @@
+"""
+What the email-sending endpoints report: success only when the mail was
+actually sent, "queued" when it is still waiting to go out (SMTP down or
+busy), partial_success for an order whose business notification got out
+but not its customer confirmation, and warning otherwise. The dispatcher is
+stubbed, so no SMTP is involved.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import server  # noqa: E402
+from email_dispatcher import QUEUED  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+from load_test import contact_payload, order_payload  # noqa: E402
+
+
+class StubDispatcher:
+    """Answers send() with the result configured for each EmailService method"""
+
+    def __init__(self):
+        self.results = {}
+        self.sent = []
+
+    async def send(self, lane, send, *args):
+        self.sent.append((lane, send.__name__))
+        return self.results.get(send.__name__, True)
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    async def allow(*args, **kwargs):
+        pass
+
+    stub = StubDispatcher()
+    monkeypatch.setattr(server, 'email_dispatcher', stub)
+    monkeypatch.setattr(server, 'db', FakeDatabase())
+    monkeypatch.setattr(server.rate_limiter, 'check', allow)
+    monkeypatch.setattr(server.business_digest, 'minutes', 0)
+    return stub
+
+
+@pytest.fixture
+def client(dispatcher):
+    app = FastAPI()
+    app.include_router(server.api_router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize('result, status', [(True, 'success'), (QUEUED, 'queued'), (False, 'warning')])
+def test_contact_form_status(client, dispatcher, result, status):
+    dispatcher.results['send_contact_form_notification'] = result
+    response = client.post('/api/contact', json=contact_payload(1))
+    assert response.status_code == 200
+    assert response.json()['status'] == status
+    assert dispatcher.sent == [('notifications', 'send_contact_form_notification')]
+
+
+def test_order_mail_deferred_by_an_open_breaker_is_not_reported_as_sent(client, dispatcher):
+    dispatcher.results = {'send_order_notification': QUEUED, 'send_customer_confirmation': QUEUED}
+    body = client.post('/api/orders/notify', json=order_payload(1)).json()
+    assert body['status'] == 'queued'
+    assert 'sent successfully' not in body['message']
+
+
+@pytest.mark.parametrize('business, customer, status', [
+    (True, True, 'success'),
+    (QUEUED, True, 'queued'),
+    (True, QUEUED, 'queued'),
+    (True, False, 'partial_success'),
+    (QUEUED, False, 'partial_success'),
+    (False, True, 'warning'),
+    (False, QUEUED, 'warning'),
+    (False, False, 'warning'),
+])
+def test_order_notify_status(client, dispatcher, business, customer, status):
+    dispatcher.results = {'send_order_notification': business, 'send_customer_confirmation': customer}
+    response = client.post('/api/orders/notify', json=order_payload(1))
+    assert response.status_code == 200
+    assert response.json()['status'] == status
+    assert response.json()['order_id'] == 'LOAD-1'
+    assert sorted(dispatcher.sent) == [('transactional', 'send_customer_confirmation'),
+                                       ('transactional', 'send_order_notification')]
+    # Saved whatever happened to the mail
+    [order] = server.db.orders.documents
+    assert order['order_id'] == 'LOAD-1' and order['status'] == 'pending'
+
+
+def test_order_notify_dispatch_error_is_500(client, dispatcher):
+    async def broken(*args):
+        raise RuntimeError('dispatcher down')
+
+    dispatcher.send = broken
+    assert client.post('/api/orders/notify', json=order_payload(1)).status_code == 500
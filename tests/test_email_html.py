@@ -0,0 +1,143 @@
+"""
+Regression test for the email HTML compactor: every template must render
+the same after compact_html - same elements, same attributes, same
+effective styles and the same text as a mail client would lay it out -
+while getting smaller.
+"""
+
+import re
+import sys
+from datetime import datetime
+from html.parser import HTMLParser
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from email_html import compact_html, minify_html  # noqa: E402
+from email_service import EmailService  # noqa: E402
+
+BLOCK = {'html', 'head', 'body', 'div', 'p', 'table', 'thead', 'tbody', 'tr', 'td', 'th',
+         'h1', 'h2', 'h3', 'h4', 'br', 'hr', 'ul', 'ol', 'li'}
+
+ITEMS = [
+    {'name': 'Men Restroom Sign', 'quantity': 2, 'price': '$58.00',
+     'specifications': {'size': '8 x 8 in', 'color': 'Black', 'braille': 'Grade 2',
+                        'customizations': {'Text': 'MEN', 'Mounting': 'Tape'}}},
+    {'name': 'Room Number Sign', 'quantity': 1, 'price': '$29.00', 'specifications': {}},
+]
+ORDER = {
+    'order_id': 'ABS-TEST-1', 'customer_name': 'Jane Doe', 'customer_email': 'jane@example.com',
+    'customer_phone': '+1 555 0100', 'items': ITEMS, 'cart_items': ITEMS, 'total': 145.0,
+    'subtotal': 116.0, 'tax': 15.08, 'shipping': 15.0, 'amount': 146.08, 'currency': 'cad',
+    'session_id': 'cs_test_abcdefghijkl', 'payment_method': 'stripe',
+    'shipping_address': {'address': '1 Main St', 'city': 'Toronto', 'state': 'ON', 'zip': 'M5V 1A1',
+                         'country': 'CA'},
+}
+CONTACT = {
+    'name': 'Jane Doe', 'email': 'jane@example.com', 'phone': '555-0100',
+    'subject': 'Custom Quote Request', 'company': 'Acme', 'urgency': 'This week',
+    'budget': '$500', 'message': 'Hello,\n  we need 20 signs.\n\nThanks & regards <Jane>',
+}
+TEMPLATES = {
+    'contact_form_notification': lambda s: s.send_contact_form_notification(CONTACT),
+    'order_notification': lambda s: s.send_order_notification(ORDER),
+    'customer_confirmation': lambda s: s.send_customer_confirmation(ORDER),
+    'pre_order_notification': lambda s: s.send_pre_order_notification(ORDER),
+    'order_complete_notification': lambda s: s.send_order_complete_notification(ORDER),
+    'business_digest': lambda s: s.send_business_digest(
+        [{**CONTACT, 'timestamp': datetime(2024, 5, 1, 9, 30)}],
+        [{**ORDER, 'payment_status': 'initiated', 'created_at': datetime(2024, 5, 1, 9, 45)}],
+        datetime(2024, 5, 1, 9), datetime(2024, 5, 1, 10)),
+}
+
+
+def rendered_emails():
+    service = EmailService()
+    sent, params = [], []
+    service.send_email = lambda to, subject, html, text=None: sent.append(html) or True
+    for name, render in TEMPLATES.items():
+        del sent[:]
+        render(service)
+        params += [pytest.param(html, id=f'{name}-{index}') for index, html in enumerate(sent)]
+    return params
+
+
+def parse_style(style):
+    declarations = (d.split(':', 1) for d in (style or '').split(';') if ':' in d)
+    return {name.strip().lower(): ' '.join(value.split()) for name, value in declarations}
+
+
+class Layout(HTMLParser):
+    """What a mail client sees: the element tree with effective styles, and the laid out text"""
+
+    def __init__(self, classes=None):
+        super().__init__()
+        self.classes = classes or {}
+        self.elements = []
+        self.lines = ['']
+        self.preformatted = 0
+        self.in_style = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        style = {}
+        for name in (attrs.pop('class', None) or '').split():
+            style.update(parse_style(self.classes.get(name, '')))
+        style.update(parse_style(attrs.pop('style', None)))
+        self.elements.append((tag, sorted(attrs.items()), sorted(style.items())))
+        if self.preformatted or style.get('white-space', '').startswith('pre') or tag == 'pre':
+            self.preformatted += tag not in ('br', 'hr', 'meta', 'img')
+        if tag in BLOCK:
+            self.lines.append('')
+        self.in_style = tag == 'style'
+
+    def handle_endtag(self, tag):
+        self.elements.append(('/' + tag,))
+        self.in_style = False
+        if self.preformatted:
+            self.preformatted -= 1
+        if tag in BLOCK:
+            self.lines.append('')
+
+    def handle_data(self, data):
+        if self.preformatted:
+            self.lines[-1] += data
+        elif not self.in_style:
+            self.lines[-1] += re.sub(r'\s+', ' ', data)
+
+    def text(self):
+        return [line if '\n' in line else ' '.join(line.split()) for line in self.lines if line.strip()]
+
+
+def layout(html, classes=None):
+    parser = Layout(classes)
+    parser.feed(html)
+    parser.close()
+    return [e for e in parser.elements if e[0] not in ('style', '/style', 'head', '/head')], parser.text()
+
+
+@pytest.mark.parametrize('html', rendered_emails())
+def test_minified_email_renders_the_same(html):
+    minified = minify_html(html)
+    assert layout(minified) == layout(html)
+    assert len(minified) < len(html) * 0.8
+
+
+@pytest.mark.parametrize('html', rendered_emails())
+def test_collapsed_styles_resolve_to_the_inline_styles(html):
+    collapsed = compact_html(html, style_classes=True)
+    classes = dict(re.findall(r'\.(s\d+)\{([^}]*)\}', collapsed))
+    assert layout(collapsed, classes) == layout(html)
+    assert len(collapsed) <= len(minify_html(html))
+
+
+def test_preformatted_text_is_kept():
+    html = '<div>\n  <div style="white-space: pre-wrap">  two\n   lines </div>\n</div>'
+    assert minify_html(html) == '<div><div style="white-space:pre-wrap">  two\n   lines </div></div>'
+
+
+def test_inline_spacing_is_kept():
+    html = '<p>\n  <strong>Name:</strong>   Jane &amp;  <em>co</em>\n</p>'
+    assert minify_html(html) == '<p><strong>Name:</strong> Jane &amp; <em>co</em></p>'
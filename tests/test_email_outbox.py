@@ -0,0 +1,167 @@
+"""
+Email outbox: mail a stopping worker could not send (queued or cut off
+mid-send) is saved to ``email_outbox`` and sent by the next worker, each
+email once - also when several workers claim from the outbox at the same
+time, or one stops between claiming its mail and sending it. A worker
+killed outright after claiming takes its claims with it: they are never
+sent twice.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from email_dispatcher import EmailDispatcher, parse_lanes  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+
+ORDERS = [{'order_id': f'ORDER-{i}', 'amount': 10 * i} for i in range(5)]
+
+
+class Service:
+    """Stands in for EmailService: records what each worker sent"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_order_notification(self, order):
+        self.sent.append(order['order_id'])
+        return True
+
+
+def dispatcher(service, smtp_up: asyncio.Event) -> EmailDispatcher:
+    async def runner(send, *args):
+        await smtp_up.wait()
+        return send(*args)
+
+    return EmailDispatcher(parse_lanes('transactional=1:60000,notifications=1:60000'), 1, runner,
+                           service=service, outbox_poll_seconds=60)
+
+
+async def settle(*dispatchers: EmailDispatcher):
+    while any(d.pending() for d in dispatchers):
+        await asyncio.sleep(0.01)
+
+
+def stopped_worker(db) -> Service:
+    """A worker that queues every order while SMTP hangs, then drains"""
+    async def lifetime():
+        service = Service()
+        worker = dispatcher(service, asyncio.Event())
+        worker.start_outbox(db)
+        for order in ORDERS:
+            worker.submit('transactional', service.send_order_notification, order)
+        await asyncio.sleep(0.05)
+        assert await worker.drain(time.monotonic() + 0.05) == len(ORDERS)
+        return service
+
+    return asyncio.run(lifetime())
+
+
+def stopped_worker_after_restore(db) -> Service:
+    """A worker that claims the outbox while SMTP hangs, then drains"""
+    async def lifetime():
+        service = Service()
+        worker = dispatcher(service, asyncio.Event())
+        worker.start_outbox(db)
+        await asyncio.sleep(0.05)
+        assert db.email_outbox.documents == []
+        assert await worker.drain(time.monotonic() + 0.05) == len(ORDERS)
+        return service
+
+    return asyncio.run(lifetime())
+
+
+def test_unsent_mail_is_saved_and_sent_after_restart():
+    db = FakeDatabase()
+    assert stopped_worker(db).sent == []
+    assert len(db.email_outbox.documents) == len(ORDERS)
+
+    async def next_worker():
+        service = Service()
+        up = asyncio.Event()
+        up.set()
+        worker = dispatcher(service, up)
+        worker.start_outbox(db)
+        await asyncio.sleep(0.05)
+        await settle(worker)
+        await worker.drain(time.monotonic())
+        return service
+
+    # In order, the one cut off mid-send included
+    assert asyncio.run(next_worker()).sent == [order['order_id'] for order in ORDERS]
+    assert db.email_outbox.documents == []
+
+
+def test_workers_claiming_together_send_each_email_once():
+    db = FakeDatabase(latency=0.001)
+    stopped_worker(db)
+
+    async def workers():
+        services = [Service(), Service(), Service()]
+        up = asyncio.Event()
+        up.set()
+        running = [dispatcher(service, up) for service in services]
+        for worker in running:
+            worker.outbox = db.email_outbox
+        await asyncio.gather(*(worker.restore() for worker in running))
+        await settle(*running)
+        for worker in running:
+            await worker.stop()
+        return [order for service in services for order in service.sent]
+
+    assert sorted(asyncio.run(workers())) == sorted(order['order_id'] for order in ORDERS)
+    assert db.email_outbox.documents == []
+
+
+def test_stopping_between_restore_and_send_does_not_duplicate():
+    db = FakeDatabase()
+    stopped_worker(db)
+    # The next worker claims the saved mail but stops before SMTP is back,
+    # so it saves the same mail again
+    restarted = stopped_worker_after_restore(db)
+    assert restarted.sent == []
+    assert len(db.email_outbox.documents) == len(ORDERS)
+
+    async def last_worker():
+        service = Service()
+        up = asyncio.Event()
+        up.set()
+        worker = dispatcher(service, up)
+        worker.start_outbox(db)
+        await asyncio.sleep(0.05)
+        await settle(worker)
+        await worker.drain(time.monotonic())
+        # Nothing was left for a second pass
+        assert await worker.restore() == 0
+        return service
+
+    assert sorted(asyncio.run(last_worker()).sent) == sorted(order['order_id'] for order in ORDERS)
+    assert db.email_outbox.documents == []
+
+
+def test_crashed_worker_does_not_leave_its_claims_for_others():
+    db = FakeDatabase()
+    stopped_worker(db)
+
+    async def crashed_worker():
+        worker = dispatcher(Service(), asyncio.Event())
+        worker.start_outbox(db)
+        await asyncio.sleep(0.05)
+        # Killed before sending: no drain, the claimed mail dies with it
+        for task in (worker._outbox_task, *worker._workers):
+            task.cancel()
+
+    asyncio.run(crashed_worker())
+    assert db.email_outbox.documents == []
+
+    async def next_worker():
+        worker = dispatcher(Service(), asyncio.Event())
+        worker.outbox = db.email_outbox
+        return await worker.restore()
+
+    assert asyncio.run(next_worker()) == 0
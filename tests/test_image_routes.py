@@ -0,0 +1,152 @@
+"""
+Product images: widths rounded up to an allowed size, the output format
+negotiated from Accept, quality rounded to a few levels and ignored for
+PNG, each variant transformed once and then served from the disk cache,
+and least recently used variants evicted over the size budget.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image, features
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import image_routes  # noqa: E402
+from image_routes import ImageCache  # noqa: E402
+
+
+def cache(directory: Path, max_bytes: int = 10 ** 8) -> ImageCache:
+    """An ImageCache transforming on threads, so tests can count the transforms"""
+    image_cache = ImageCache(directory, max_bytes, workers=1)
+    image_cache._pool = ThreadPoolExecutor(max_workers=2)
+    return image_cache
+
+
+@pytest.fixture
+def transforms(monkeypatch):
+    calls = []
+    transform = image_routes._transform
+
+    def counting(source, target, width, fmt, quality):
+        calls.append((Path(source).name, width, fmt, quality))
+        transform(source, target, width, fmt, quality)
+
+    monkeypatch.setattr(image_routes, '_transform', counting)
+    return calls
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, transforms):
+    sources = tmp_path / 'sources'
+    sources.mkdir()
+    Image.new('RGB', (1000, 500), 'navy').save(sources / 'sign.jpg')
+    Image.new('RGBA', (300, 300), (255, 0, 0, 128)).save(sources / 'badge.png')
+    (sources / 'notes.txt').write_text('not an image')
+    monkeypatch.setattr(image_routes, 'IMAGE_SOURCE_DIRS', [sources])
+    monkeypatch.setattr(image_routes, 'image_cache', cache(tmp_path / 'cache'))
+    app = FastAPI()
+    app.include_router(image_routes.image_router)
+    yield TestClient(app)
+    image_routes.image_cache.shutdown()
+
+
+def size(response):
+    return Image.open(io.BytesIO(response.content)).size
+
+
+@pytest.mark.parametrize('w, width', [(300, 320), (320, 320), (1, 64), (0, 64), (5000, 1000)])
+def test_width_is_rounded_up_to_an_allowed_size(client, w, width):
+    response = client.get(f'/img/sign.jpg?w={w}&fmt=jpeg')
+    assert response.status_code == 200
+    # Never upscaled past the source
+    assert size(response)[0] == width
+
+
+@pytest.mark.parametrize('accept, content_type', [
+    pytest.param('image/avif,image/webp,*/*', 'image/avif',
+                 marks=pytest.mark.skipif(not features.check('avif'), reason='Pillow built without AVIF')),
+    ('image/webp,*/*', 'image/webp'),
+    ('*/*', 'image/jpeg'),
+])
+def test_format_follows_accept(client, accept, content_type):
+    response = client.get('/img/sign.jpg?w=640', headers={'Accept': accept})
+    assert response.headers['content-type'] == content_type
+    assert response.headers['vary'] == 'Accept'
+
+
+def test_explicit_format_and_originals(client, transforms):
+    response = client.get('/img/sign.jpg?fmt=png', headers={'Accept': 'image/webp'})
+    assert response.headers['content-type'] == 'image/png'
+    assert 'vary' not in response.headers
+    assert client.get('/img/sign.jpg?fmt=bmp').status_code == 400
+    # No width and no better format than the source: the original, untouched
+    transforms.clear()
+    original = client.get('/img/sign.jpg')
+    assert original.content == (image_routes.IMAGE_SOURCE_DIRS[0] / 'sign.jpg').read_bytes()
+    assert client.get('/img/notes.txt?w=100').content == b'not an image'
+    assert transforms == []
+
+
+@pytest.mark.parametrize('name', ['missing.jpg', '..', '.hidden.jpg'])
+def test_unknown_images_are_404(client, name):
+    assert client.get(f'/img/{name}').status_code == 404
+
+
+def test_variants_are_transformed_once_then_served_from_cache(client, transforms):
+    first = client.get('/img/sign.jpg?w=300&fmt=webp&q=70')
+    # Same width and quality level once rounded up
+    second = client.get('/img/sign.jpg?w=320&fmt=webp&q=80')
+    assert first.content == second.content
+    assert first.headers['etag'] == second.headers['etag']
+    assert transforms == [('sign.jpg', 320, 'webp', 80)]
+    client.get('/img/sign.jpg?w=320&fmt=webp&q=81')
+    assert transforms[-1] == ('sign.jpg', 320, 'webp', 90)
+
+
+def test_quality_is_ignored_for_png(client, transforms):
+    etags = {client.get(f'/img/badge.png?w=128&fmt=png&q={q}').headers['etag'] for q in (10, 50, 95)}
+    assert len(etags) == 1
+    assert transforms == [('badge.png', 128, 'png', 0)]
+
+
+def test_concurrent_requests_share_one_transform(tmp_path, transforms):
+    Image.new('RGB', (800, 800), 'teal').save(tmp_path / 'tile.jpg')
+    image_cache = cache(tmp_path / 'cache')
+
+    async def requests():
+        return await asyncio.gather(*(image_cache.get(tmp_path / 'tile.jpg', 400, 'webp', 80) for _ in range(5)))
+
+    results = asyncio.run(requests())
+    assert len(set(results)) == 1
+    assert len(transforms) == 1
+    image_cache.shutdown()
+
+
+def test_least_recently_used_variants_are_evicted(tmp_path):
+    Image.effect_noise((400, 400), 64).convert('RGB').save(tmp_path / 'noise.png')
+    image_cache = cache(tmp_path / 'cache')
+
+    async def variant(width):
+        path, _ = await image_cache.get(tmp_path / 'noise.png', width, 'png', 0)
+        return path
+
+    paths = {width: asyncio.run(variant(width)) for width in (64, 128, 200)}
+    # 64 is used again, so 128 is now the least recently used
+    old = time.time() - 60
+    os.utime(paths[128], (old, old))
+    os.utime(paths[200], (old + 1, old + 1))
+    # Evicting down to 90% of the budget leaves room for the other two
+    image_cache.max_bytes = int((paths[64].stat().st_size + paths[200].stat().st_size) / 0.9) + 1
+    image_cache._evict()
+    assert paths[64].exists() and paths[200].exists()
+    assert not paths[128].exists()
+    image_cache.shutdown()
@@ -0,0 +1,58 @@
+"""
+Cold start budget: importing ``server`` (what every new worker does before
+it can take traffic) must stay fast. Parses ``python -X importtime``
+output from a fresh interpreter and checks that the modules deferred to
+first use (the Mongo driver, the Stripe SDK, multiprocessing) stay out of
+the import, and that the app's own import time - everything ``server``
+imports except FastAPI itself - stays within IMPORT_TIME_BUDGET_MS. Also
+checks that every module reading settings imports ``env`` first, so
+backend/.env applies whichever module a process imports first.
+"""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+# Best of a few runs, to ride out a busy machine
+RUNS = 3
+BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 200))
+
+DEFERRED = ('motor', 'pymongo', 'bson', 'emergentintegrations', 'multiprocessing')
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def import_times() -> dict:
+    """Module -> cumulative import time in ms, for one fresh ``import server``"""
+    env = dict(os.environ, MONGO_URL='mongodb://localhost:27017', DB_NAME='import_time', LOG_LEVEL='WARNING',
+               SERVE_STATIC='false')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import server'], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for match in LINE.finditer(result.stderr):
+        times.setdefault(match.group(4), int(match.group(2)) / 1000)
+    return times
+
+
+def test_deferred_modules_are_not_imported():
+    imported = {name.split('.')[0] for name in import_times()}
+    assert imported.isdisjoint(DEFERRED), sorted(imported & set(DEFERRED))
+
+
+def test_app_import_time_is_within_budget():
+    own = []
+    for _ in range(RUNS):
+        times = import_times()
+        own.append(times['server'] - times['fastapi'])
+    assert min(own) <= BUDGET_MS, f"importing server took {min(own):.0f}ms on top of FastAPI (budget {BUDGET_MS:.0f}ms)"
+
+
+def test_modules_reading_settings_load_env_first():
+    missing = [path.name for path in sorted(BACKEND_DIR.glob('*.py'))
+               if path.name != 'env.py' and 'os.environ' in path.read_text()
+               and not re.search(r'^import env\b', path.read_text(), re.M)]
+    assert not missing, f"read os.environ without importing env: {', '.join(missing)}"
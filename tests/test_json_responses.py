@@ -0,0 +1,67 @@
+"""
+JSON rendering with orjson: documents read straight from Mongo render the
+same as the response models would (datetimes as ISO 8601, no ``_id``), a
+stray ObjectId renders as its hex string instead of failing, and routes
+returning plain data go through ORJSONResponse.
+"""
+
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import server  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, 'db', FakeDatabase())
+    app = FastAPI(default_response_class=server.app.router.default_response_class)
+    app.include_router(server.api_router)
+    return TestClient(app)
+
+
+def test_datetimes_and_object_ids():
+    body = server.json_response([{
+        '_id': ObjectId('65a1b2c3d4e5f60718293a4b'),
+        'naive': datetime(2024, 1, 2, 3, 4, 5, 678000),
+        'utc': datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    }]).body
+    assert json.loads(body) == [{
+        '_id': '65a1b2c3d4e5f60718293a4b',
+        'naive': '2024-01-02T03:04:05.678000',
+        'utc': '2024-01-02T03:04:05Z',
+    }]
+
+
+def test_status_list_renders_like_the_response_model(client):
+    for name in ('a', 'b'):
+        assert client.post('/api/status', json={'client_name': name}).status_code == 200
+    # Stored documents carry an ObjectId _id; the projection leaves it out
+    assert all(isinstance(d['_id'], ObjectId) for d in server.db.status_checks.documents)
+    response = client.get('/api/status')
+    assert response.headers['content-type'] == 'application/json'
+    documents = response.json()
+    assert [set(d) for d in documents] == [{'id', 'client_name', 'timestamp'}] * 2
+    # Mongo keeps milliseconds, which both renderings print the same way
+    models = TypeAdapter(List[server.StatusCheck]).validate_python(documents)
+    assert json.loads(TypeAdapter(List[server.StatusCheck]).dump_json(models)) == documents
+
+
+def test_plain_data_goes_through_orjson(client):
+    assert server.app.router.default_response_class is server.ORJSONResponse
+    response = client.get('/api/')
+    assert response.json() == {'message': 'Hello World'}
+    assert response.content == b'{"message":"Hello World"}'
@@ -0,0 +1,84 @@
+"""
+Structured logs: every record logged while handling a request, also from
+a worker thread, is one JSON line carrying that request's ID (the incoming
+X-Request-ID or a new one, echoed back), with ``extra`` fields and
+tracebacks as their own keys.
+"""
+
+import io
+import json
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+from starlette.concurrency import run_in_threadpool
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import logging_config  # noqa: E402
+from logging_config import RequestIdMiddleware, setup_logging, shutdown_logging  # noqa: E402
+from tests.asgi import call  # noqa: E402
+
+logger = logging.getLogger('test_logging_config')
+
+
+@pytest.fixture
+def records(monkeypatch):
+    """Routes logging to a buffer as JSON; returns a function reading the records written so far"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    output = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', output)
+    setup_logging(level='INFO', fmt='json', module_levels='')
+
+    def read():
+        shutdown_logging()
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    yield read
+    shutdown_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+async def app(scope, receive, send):
+    logger.info("Handling order", extra={"order_id": "A-1"})
+    await run_in_threadpool(logger.warning, "From a worker thread")
+    try:
+        raise ValueError("bad total")
+    except ValueError:
+        logger.exception("Order failed")
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'ok'})
+
+
+def test_records_carry_the_request_id(records):
+    _, headers, _ = call(RequestIdMiddleware(app), '/api/orders', {'X-Request-ID': 'req-42'})
+    assert headers['x-request-id'] == 'req-42'
+    handling, threaded, failed = records()
+    assert {record['request_id'] for record in (handling, threaded, failed)} == {'req-42'}
+    assert handling['msg'] == 'Handling order'
+    assert handling['order_id'] == 'A-1'
+    assert handling['level'] == 'INFO' and handling['logger'] == 'test_logging_config'
+    assert threaded['level'] == 'WARNING'
+    # The traceback has its own key rather than being folded into msg
+    assert failed['msg'] == 'Order failed'
+    assert 'ValueError: bad total' in failed['exc']
+
+
+def test_a_new_id_is_generated_and_echoed(records):
+    _, headers, _ = call(RequestIdMiddleware(app), '/api/orders')
+    request_id = headers['x-request-id']
+    assert len(request_id) == 32
+    assert {record['request_id'] for record in records()} == {request_id}
+
+
+def test_no_request_id_outside_a_request(records):
+    logger.info("Starting up")
+    [record] = records()
+    assert 'request_id' not in record
+    assert logging_config.request_id_var.get() is None
@@ -0,0 +1,148 @@
+"""
+Metrics: per-thread shards summed on scrape, merging worker snapshots
+(gauges of dead workers dropped), the Prometheus text output (label
+escaping, cumulative buckets) and MetricsMiddleware labelling requests by
+route template.
+"""
+
+import json
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import metrics  # noqa: E402
+from metrics import Counter, Gauge, Histogram, MetricsMiddleware, Registry, merge_snapshots, render  # noqa: E402
+
+
+def test_shards_from_every_thread_are_summed():
+    registry = Registry()
+    counter = Counter('jobs_total', 'Jobs', ('kind',), registry=registry)
+    gauge = Gauge('jobs_running', 'Running jobs', registry=registry)
+
+    def work():
+        for _ in range(1000):
+            counter.inc('a')
+            gauge.inc()
+        counter.inc('b', amount=2.5)
+        gauge.dec(amount=1000)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(counter._shards) == 4
+    assert counter.samples() == {('a',): 4000, ('b',): 10.0}
+    assert gauge.samples() == {(): 0}
+
+
+def test_labels_and_names_are_checked():
+    registry = Registry()
+    counter = Counter('checked_total', 'Checked', ('route',), registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        Counter('checked_total', 'Again', registry=registry)
+
+
+def test_histogram_buckets_and_timer():
+    registry = Registry()
+    histogram = Histogram('work_seconds', 'Work', ('step',), buckets=(1, 0.1), registry=registry)
+    for value in (0.05, 0.1, 0.5, 7):
+        histogram.observe(value, 'x')
+    # A value on a bound falls in that bucket (le); the last one is +Inf
+    assert histogram.samples()[('x',)] == [[2, 1, 1], 7.65, 4]
+    timed = Histogram('call_seconds', 'Calls', ('operation', 'outcome'), registry=registry)
+    with pytest.raises(RuntimeError):
+        with timed.time('charge'):
+            raise RuntimeError
+    with timed.time('charge'):
+        pass
+    assert {labels: entry[2] for labels, entry in timed.samples().items()} == {
+        ('charge', 'error'): 1, ('charge', 'ok'): 1}
+
+
+def snapshot(requests=1, in_flight=1, latency=(1, 0, 0.05, 1)):
+    counts, total, count = [latency[0], latency[1], 0], latency[2], latency[3]
+    return {
+        'requests_total': {'type': 'counter', 'help': 'Requests', 'labelnames': ['route'],
+                           'samples': {'/api/': requests}},
+        'in_flight': {'type': 'gauge', 'help': 'In flight', 'labelnames': [], 'samples': {'': in_flight}},
+        'latency_seconds': {'type': 'histogram', 'help': 'Latency', 'labelnames': [], 'buckets': [0.1, 1],
+                            'samples': {'': [counts, total, count]}},
+    }
+
+
+def test_merge_sums_workers_and_drops_gauges_of_dead_ones():
+    merged = merge_snapshots([
+        (snapshot(requests=3, in_flight=2, latency=(1, 0, 0.05, 1)), True),
+        (snapshot(requests=4, in_flight=5, latency=(0, 1, 0.5, 1)), False),
+        (snapshot(requests=1, in_flight=1, latency=(1, 0, 0.02, 1)), True),
+    ])
+    # Counts of a worker that exited still happened; its in-flight requests did not survive it
+    assert merged['requests_total']['samples'] == {'/api/': 8}
+    assert merged['in_flight']['samples'] == {'': 3}
+    assert merged['latency_seconds']['samples'][''] == [[2, 1, 0], pytest.approx(0.57), 3]
+
+
+def test_render_escapes_labels_and_accumulates_buckets():
+    registry = Registry()
+    counter = Counter('odd_total', 'Odd labels', ('value',), registry=registry)
+    counter.inc('say "hi"\\\nbye')
+    histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1), registry=registry)
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value, '/api/')
+    lines = render(registry.snapshot()).splitlines()
+    assert 'odd_total{value="say \\"hi\\"\\\\\\nbye"} 1' in lines
+    assert lines[:2] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert lines[2:7] == [
+        'latency_seconds_bucket{route="/api/",le="0.1"} 1',
+        'latency_seconds_bucket{route="/api/",le="1"} 3',
+        'latency_seconds_bucket{route="/api/",le="+Inf"} 4',
+        'latency_seconds_sum{route="/api/"} 4.25',
+        'latency_seconds_count{route="/api/"} 4',
+    ]
+
+
+def test_collect_merges_the_worker_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'MULTIPROC_DIR', str(tmp_path))
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    (tmp_path / f'{exited.pid}.json').write_text(json.dumps(snapshot(requests=5, in_flight=7)))
+    (tmp_path / 'garbage.json').write_text('{')
+    text = metrics.collect()
+    assert 'requests_total{route="/api/"} 5' in text
+    assert '# TYPE in_flight gauge' not in text
+    # This process wrote its own snapshot to answer
+    assert (tmp_path / f'{metrics.os.getpid()}.json').exists()
+
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+
+    @app.get('/api/reviews/{product_id}')
+    async def reviews(product_id: str):
+        return []
+
+    client = TestClient(MetricsMiddleware(app))
+    before = metrics.http_requests_total.samples()
+    for product in ('a', 'b', 'c'):
+        assert client.get(f'/api/reviews/{product}').status_code == 200
+    assert client.get('/nowhere').status_code == 404
+    after = metrics.http_requests_total.samples()
+
+    def added(*labels):
+        return after.get(labels, 0) - before.get(labels, 0)
+
+    assert added('GET', '/api/reviews/{product_id}', '200') == 3
+    assert added('GET', 'unmatched', '404') == 1
+    assert not any(route.startswith('/api/reviews/') and route != '/api/reviews/{product_id}'
+                   for _, route, _ in after)
+    assert metrics.http_requests_in_flight.samples().get((), 0) == 0
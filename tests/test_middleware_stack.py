@@ -0,0 +1,89 @@
+"""
+Middleware stack: TimedLayer records a layer's own time without the app it
+wraps, MIDDLEWARE_TIMING / ``timing`` switches the wrapping on and off, and
+MIDDLEWARE_DISABLED leaves layers out.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from middleware_stack import LAYER_NAMES, LAYERS, LayerTimings, TimedLayer, install_middleware  # noqa: E402
+
+
+class SlowLayer:
+    """Spends ``own`` seconds itself around the app it wraps"""
+
+    def __init__(self, app, own: float):
+        self.app = app
+        self.own = own
+
+    async def __call__(self, scope, receive, send):
+        time.sleep(self.own / 2)
+        await self.app(scope, receive, send)
+        time.sleep(self.own / 2)
+
+
+async def slow_app(scope, receive, send):
+    time.sleep(0.05)
+
+
+def test_timed_layer_records_only_its_own_time():
+    timings = LayerTimings()
+    outer = TimedLayer(slow_app, 'slow', SlowLayer, {'own': 0.02}, timings)
+    for _ in range(2):
+        asyncio.run(outer({'type': 'http'}, None, None))
+    stats = timings.snapshot()['slow']
+    assert stats['count'] == 2
+    # The 50 ms spent in the wrapped app is not the layer's
+    assert 20e6 <= stats['avg_ns'] < 45e6
+    assert stats['max_ns'] >= stats['avg_ns']
+    assert stats['total_ns'] == pytest.approx(2 * stats['avg_ns'], abs=1)
+
+
+def test_nested_timed_layers_each_get_their_own_time():
+    timings = LayerTimings()
+    inner = TimedLayer(slow_app, 'inner', SlowLayer, {'own': 0.01}, timings)
+    outer = TimedLayer(inner, 'outer', SlowLayer, {'own': 0.03}, timings)
+    asyncio.run(outer({'type': 'http'}, None, None))
+    stats = timings.snapshot()
+    assert 10e6 <= stats['inner']['total_ns'] < 30e6
+    assert 30e6 <= stats['outer']['total_ns'] < 45e6
+
+
+def test_lifespan_is_not_timed():
+    timings = LayerTimings()
+    asyncio.run(TimedLayer(slow_app, 'slow', SlowLayer, {'own': 0}, timings)({'type': 'lifespan'}, None, None))
+    assert timings.snapshot() == {}
+    timings.record('x', 5)
+    timings.reset()
+    assert timings.snapshot() == {}
+
+
+def installed(app):
+    return [(m.kwargs.get('name'), m.cls) for m in app.user_middleware]
+
+
+@pytest.mark.parametrize('timing', [True, False])
+def test_timing_toggle(timing):
+    app = FastAPI()
+    install_middleware(app, disabled=[], timing=timing)
+    # add_middleware puts each layer outside the ones before it
+    expected = [(name if timing else None, TimedLayer if timing else layer) for name, layer, _ in reversed(LAYERS)]
+    assert installed(app) == expected
+
+
+def test_environment_settings(monkeypatch):
+    monkeypatch.setenv('MIDDLEWARE_TIMING', 'true')
+    monkeypatch.setenv('MIDDLEWARE_DISABLED', 'profiling, compression')
+    app = FastAPI()
+    install_middleware(app)
+    assert [name for name, _ in installed(app)] == [n for n in reversed(LAYER_NAMES) if n not in ('profiling', 'compression')]
+    with pytest.raises(ValueError):
+        install_middleware(FastAPI(), disabled=['gzip'])
@@ -0,0 +1,65 @@
+"""
+Order details by checkout session: the summary the confirmation page shows
+is public to the session holder, the full view with addresses is admin only.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import admin_auth  # noqa: E402
+import payment_routes  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+
+TRANSACTION = {
+    'session_id': 'cs_test_1', 'status': 'complete', 'payment_status': 'paid', 'amount': 49.99, 'currency': 'usd',
+    'customer_name': 'Ada', 'customer_email': 'ada@example.com',
+    'cart_items': [{'name': 'Room sign', 'quantity': 1, 'price': 49.99, 'specifications': {'size': '8x8'}}],
+    'shipping_address': {'address': '1 Main St', 'city': 'Toronto'},
+    'billing_address': {'address': '1 Main St', 'city': 'Toronto'},
+    'metadata': {'source': 'web'},
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = FakeDatabase()
+    db.payment_transactions.documents.append(dict(TRANSACTION))
+    monkeypatch.setattr(payment_routes, 'db', db)
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', 'secret')
+    app = FastAPI()
+    app.include_router(payment_routes.payment_router)
+    return TestClient(app)
+
+
+def test_summary_has_no_addresses(client):
+    response = client.get('/api/payments/order/cs_test_1')
+    assert response.status_code == 200
+    body = response.json()
+    assert body['customer_email'] == 'ada@example.com'
+    assert body['cart_items'] == [{'name': 'Room sign', 'quantity': 1, 'price': 49.99}]
+    assert 'shipping_address' not in body and 'metadata' not in body
+
+
+@pytest.mark.parametrize('headers, status', [({}, 403), ({'X-Admin-Token': 'wrong'}, 403), ({'X-Admin-Token': 'secret'}, 200)])
+def test_full_view_needs_the_admin_token(client, headers, status):
+    response = client.get('/api/payments/order/cs_test_1?view=full', headers=headers)
+    assert response.status_code == status
+    if status == 200:
+        assert response.json()['shipping_address'] == TRANSACTION['shipping_address']
+
+
+def test_full_view_is_hidden_without_an_admin_token(client, monkeypatch):
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', '')
+    assert client.get('/api/payments/order/cs_test_1?view=full').status_code == 404
+
+
+def test_unknown_session_is_404(client):
+    assert client.get('/api/payments/order/cs_missing').status_code == 404
@@ -0,0 +1,71 @@
+"""
+Profiling: the sampling profiler endpoint and the per-request cProfile mode
+answer admins only, and the sampled stacks fold into a flame graph tree.
+"""
+
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import admin_auth  # noqa: E402
+from profiling import ProfilingMiddleware, profile_router, to_flamegraph  # noqa: E402
+
+ADMIN = {'X-Admin-Token': 'secret'}
+PROFILE = '/api/admin/profile?seconds=0.1&interval_ms=5'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', 'secret')
+    app = FastAPI()
+    app.include_router(profile_router)
+
+    @app.get('/api/slow')
+    async def slow():
+        return {'total': sum(range(10000))}
+
+    return TestClient(ProfilingMiddleware(app))
+
+
+def test_profiler_endpoint_needs_the_admin_token(client, monkeypatch):
+    assert client.post(PROFILE).status_code == 403
+    assert client.post(PROFILE, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', '')
+    # Without a configured token the endpoint does not exist
+    assert client.post(PROFILE, headers=ADMIN).status_code == 404
+
+
+def test_profiler_endpoint_returns_stacks(client):
+    response = client.post(PROFILE, headers=ADMIN)
+    assert response.status_code == 200
+    assert int(response.headers['x-profile-samples']) > 0
+    stack, _, count = response.text.splitlines()[0].rpartition(' ')
+    assert ';' in stack and int(count) > 0
+    body = client.post(PROFILE + '&format=json', headers=ADMIN).json()
+    assert body['flamegraph']['name'] == 'root' and body['flamegraph']['value'] > 0
+    assert client.post(PROFILE + '&format=svg', headers=ADMIN).status_code == 400
+
+
+def test_request_profile_needs_the_admin_token(client):
+    assert client.get('/api/slow', headers={'X-Profile': '1'}).json() == {'total': 49995000}
+    assert client.get('/api/slow', headers={'X-Profile': '1', 'X-Admin-Token': 'wrong'}).json() == {'total': 49995000}
+    response = client.get('/api/slow', headers={'X-Profile': '1', 'X-Profile-Sort': 'tottime', **ADMIN})
+    assert response.headers['x-profiled-status'] == '200'
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'function calls' in response.text and 'tottime' in response.text
+
+
+def test_flamegraph_tree():
+    tree = to_flamegraph(Counter({'main;serve;handle': 3, 'main;serve;idle': 1, 'main;gc': 2}))
+    assert tree['value'] == 6
+    [main] = tree['children']
+    assert (main['name'], main['value']) == ('main', 6)
+    serve, gc = main['children']
+    assert (serve['value'], gc['value']) == (4, 2)
+    assert [(c['name'], c['value']) for c in serve['children']] == [('handle', 3), ('idle', 1)]
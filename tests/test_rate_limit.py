@@ -0,0 +1,107 @@
+"""
+RateLimiter: the shared GCRA bucket in Mongo (new key, existing key via
+the DuplicateKeyError path, over the limit), the local pre-check that
+rejects without a round trip, failing open when Mongo is slow, and which
+address the public forms are limited by.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from fastapi import HTTPException  # noqa: E402
+
+import rate_limit  # noqa: E402
+from fakes import FakeCollection  # noqa: E402
+from rate_limit import Limit, RateLimiter  # noqa: E402
+
+
+class CountingCollection(FakeCollection):
+    def __init__(self, name='rate_limits', latency=0.0):
+        super().__init__(name, latency)
+        self.calls = 0
+
+    async def roundtrip(self):
+        self.calls += 1
+        await super().roundtrip()
+
+
+def limiter(collection, count=3, seconds=60):
+    """A RateLimiter with one form limited to ``count`` per ``seconds`` by IP and by email"""
+    limiter = RateLimiter({'form': (Limit(count, seconds), Limit(count, seconds))})
+    asyncio.run(limiter.start(SimpleNamespace(rate_limits=collection)))
+    return limiter
+
+
+def hits(limiter, value, times, key_type='ip'):
+    async def run():
+        limit = limiter.limits['form'][0]
+        return [await limiter.hit('form', key_type, value, limit) for _ in range(times)]
+    return asyncio.run(run())
+
+
+def test_existing_key_spends_from_the_shared_bucket():
+    collection = CountingCollection()
+    first, second = hits(limiter(collection), '10.0.0.1', 2)
+    assert first is None and second is None
+    # The second hit found the key, so its upsert raised DuplicateKeyError
+    # and the conditional $inc spent a token instead
+    [document] = collection.documents
+    assert document['_id'] == 'form:ip:10.0.0.1'
+    assert document['tat'] == pytest.approx(time.time() + 40, abs=2)
+
+
+def test_workers_share_the_limit():
+    collection = CountingCollection()
+    workers = [limiter(collection), limiter(collection)]
+    results = [hits(workers[i % 2], 'someone@example.com', 1, 'email')[0] for i in range(4)]
+    # Each worker's local bucket still has tokens; the shared one is empty
+    assert results[:3] == [None, None, None]
+    assert results[3] == pytest.approx(20, abs=1)
+
+
+def test_empty_local_bucket_rejects_without_a_round_trip():
+    collection = CountingCollection()
+    shared = limiter(collection)
+    assert hits(shared, '10.0.0.1', 3) == [None, None, None]
+    calls = collection.calls
+    assert hits(shared, '10.0.0.1', 1)[0] == pytest.approx(20, abs=1)
+    assert collection.calls == calls
+
+
+def test_fails_open_when_mongo_is_slow(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_MONGO_TIMEOUT', 0.05)
+    slow = limiter(CountingCollection(latency=1), count=2)
+    started = time.monotonic()
+    # Only the local bucket applies
+    assert hits(slow, '10.0.0.1', 3)[:2] == [None, None]
+    assert time.monotonic() - started < 0.5
+
+
+def test_check_raises_429_with_retry_after():
+    shared = limiter(CountingCollection(), count=1)
+
+    async def submit():
+        await shared.check('form', '10.0.0.1', 'someone@example.com')
+
+    asyncio.run(submit())
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(submit())
+    assert error.value.status_code == 429
+    assert error.value.headers['Retry-After'] == '60'
+
+
+def test_requests_from_a_trusted_proxy_have_no_client_ip(monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'TRUSTED_PROXIES', {'10.0.0.2'})
+    assert server.client_ip(SimpleNamespace(client=SimpleNamespace(host='203.0.113.7'))) == '203.0.113.7'
+    assert server.client_ip(SimpleNamespace(client=SimpleNamespace(host='10.0.0.2'))) is None
+    assert server.client_ip(SimpleNamespace(client=None)) is None
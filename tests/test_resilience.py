@@ -0,0 +1,166 @@
+"""
+CircuitBreaker state machine - closed, open after ``failures`` in a row,
+half-open after ``reset_seconds`` with a single probe that closes or
+re-opens it - and the email dispatcher queueing rather than failing mail
+while the SMTP breaker is open.
+"""
+
+import asyncio
+import smtplib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from email_dispatcher import QUEUED, EmailDispatcher, parse_lanes  # noqa: E402
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, _smtp_outage  # noqa: E402
+
+
+def fail(breaker, times=1, exc=None):
+    for _ in range(times):
+        breaker.acquire()
+        breaker.record(exc or ConnectionError('down'))
+
+
+def elapse(breaker):
+    """Move the breaker's clock past its reset period"""
+    breaker.opened_at -= breaker.reset_seconds
+
+
+def test_opens_at_the_failure_threshold():
+    breaker = CircuitBreaker('test', failures=3, reset_seconds=30)
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+    breaker.acquire()
+    breaker.record()
+    fail(breaker, 2)
+    # A success in between reset the count
+    assert breaker.state == CLOSED
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.acquire()
+    assert 29 < error.value.retry_after <= 30
+
+
+def test_caller_errors_do_not_count():
+    breaker = CircuitBreaker('smtp', failures=1, is_failure=_smtp_outage)
+    fail(breaker, 3, smtplib.SMTPRecipientsRefused({}))
+    assert breaker.state == CLOSED
+
+
+def test_half_open_after_the_reset_period_lets_one_probe_through():
+    breaker = CircuitBreaker('test', failures=1, reset_seconds=30)
+    fail(breaker)
+    elapse(breaker)
+    assert not breaker.is_open
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker('test', failures=3, reset_seconds=30)
+    fail(breaker, 3)
+    elapse(breaker)
+    # One failure is enough while half-open
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.retry_after() > 29
+
+
+def test_successful_probe_closes():
+    breaker = CircuitBreaker('test', failures=1, reset_seconds=30)
+    fail(breaker)
+    elapse(breaker)
+    with breaker.guard():
+        pass
+    assert breaker.state == CLOSED
+    breaker.acquire()
+    breaker.acquire()
+
+
+def test_cancelled_probe_frees_the_probe_slot():
+    breaker = CircuitBreaker('test', failures=1, reset_seconds=30)
+    fail(breaker)
+    elapse(breaker)
+    with pytest.raises(asyncio.CancelledError):
+        with breaker.guard():
+            raise asyncio.CancelledError()
+    assert breaker.state == HALF_OPEN
+    breaker.acquire()
+
+
+def test_only_one_waiter_is_let_through_per_half_open_window():
+    async def scenario():
+        breaker = CircuitBreaker('test', failures=1, reset_seconds=0.05)
+        fail(breaker)
+        through = []
+
+        async def waiter(i):
+            await breaker.wait_until_closed()
+            through.append(breaker.state)
+
+        waiters = [asyncio.create_task(waiter(i)) for i in range(4)]
+        await asyncio.sleep(0.2)
+        # The first waiter through makes the probe; the rest wait for it
+        assert through == [OPEN]
+        with breaker.guard():
+            pass
+        await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        assert through == [OPEN, CLOSED, CLOSED, CLOSED]
+
+    asyncio.run(scenario())
+
+
+def test_send_is_queued_while_the_breaker_is_open():
+    async def scenario():
+        breaker = CircuitBreaker('smtp', failures=1, reset_seconds=0.1)
+        fail(breaker)
+        sent = []
+
+        async def runner(send, *args):
+            with breaker.guard():
+                return send(*args)
+
+        dispatcher = EmailDispatcher(parse_lanes('transactional=1:60000'), 1, runner, breaker, request_wait=1)
+        assert await dispatcher.send('transactional', lambda: sent.append('mail') or True) == QUEUED
+        # Goes out once the breaker lets a probe through
+        while dispatcher.pending():
+            await asyncio.sleep(0.01)
+        assert sent == ['mail']
+        assert breaker.state == CLOSED
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+
+def test_send_failing_with_the_breaker_open_stays_queued():
+    async def scenario():
+        breaker = CircuitBreaker('smtp', failures=1, reset_seconds=0.1)
+        outcomes = [ConnectionError('down'), None]
+        sent = []
+
+        async def runner(send, *args):
+            try:
+                with breaker.guard():
+                    exc = outcomes.pop(0)
+                    if exc:
+                        raise exc
+                    return send(*args)
+            except ConnectionError:
+                return False
+
+        dispatcher = EmailDispatcher(parse_lanes('transactional=1:60000'), 1, runner, breaker, request_wait=0.05)
+        # The first attempt opens the breaker: deferred, not failed
+        assert await dispatcher.send('transactional', lambda: sent.append('mail') or True) == QUEUED
+        while dispatcher.pending():
+            await asyncio.sleep(0.01)
+        assert sent == ['mail']
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+"""
+Launcher settings: environment defaults and the flags overriding them,
+proxy headers following FORWARDED_ALLOW_IPS, and worker recycling and
+preload resolved per process manager.
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import run  # noqa: E402
+
+SETTINGS = ('HOST', 'PORT', 'WEB_CONCURRENCY', 'SERVER', 'MAX_REQUESTS', 'MAX_REQUESTS_JITTER', 'PRELOAD',
+            'PROXY_HEADERS', 'FORWARDED_ALLOW_IPS', 'LOG_LEVEL')
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in SETTINGS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(run, 'available_cpus', lambda: 4)
+
+
+def test_environment_defaults_and_flag_overrides(monkeypatch):
+    monkeypatch.setenv('PORT', '9000')
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+    args = run.parse_args(['--server', 'uvicorn'])
+    assert (args.port, args.workers, args.log_level) == (9000, 3, 'warning')
+    args = run.parse_args(['--server', 'uvicorn', '--port', '9100', '--workers', '2'])
+    assert (args.port, args.workers) == (9100, 2)
+    # No WEB_CONCURRENCY: one worker per available core
+    monkeypatch.delenv('WEB_CONCURRENCY')
+    assert run.parse_args(['--server', 'uvicorn']).workers == 4
+
+
+def test_starts_without_proxy_settings(caplog):
+    with caplog.at_level(logging.WARNING, logger='run'):
+        args = run.parse_args(['--server', 'uvicorn'])
+    assert not args.proxy_headers
+    assert args.forwarded_allow_ips == ''
+    assert not caplog.records
+
+
+def test_forwarded_allow_ips_turns_proxy_headers_on(monkeypatch):
+    monkeypatch.setenv('FORWARDED_ALLOW_IPS', '10.0.0.2,10.0.0.3')
+    args = run.parse_args(['--server', 'uvicorn'])
+    assert args.proxy_headers
+    assert args.forwarded_allow_ips == '10.0.0.2,10.0.0.3'
+    assert not run.parse_args(['--server', 'uvicorn', '--no-proxy-headers']).proxy_headers
+    monkeypatch.setenv('PROXY_HEADERS', 'false')
+    assert not run.parse_args(['--server', 'uvicorn']).proxy_headers
+
+
+@pytest.mark.parametrize('env, argv', [({'PROXY_HEADERS': 'true'}, []), ({}, ['--proxy-headers'])])
+def test_proxy_headers_without_allowed_ips_warn_and_trust_localhost(monkeypatch, caplog, env, argv):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    with caplog.at_level(logging.WARNING, logger='run'):
+        args = run.parse_args(['--server', 'uvicorn', *argv])
+    assert args.proxy_headers
+    assert args.forwarded_allow_ips == '127.0.0.1'
+    assert 'FORWARDED_ALLOW_IPS' in caplog.text
+
+
+def test_gunicorn_recycles_and_preloads_by_default(monkeypatch):
+    args = run.parse_args(['--server', 'gunicorn'])
+    assert (args.max_requests, args.max_requests_jitter, args.preload) == (10000, 1000, True)
+    monkeypatch.setenv('MAX_REQUESTS', '0')
+    monkeypatch.setenv('PRELOAD', 'false')
+    args = run.parse_args(['--server', 'gunicorn'])
+    assert (args.max_requests, args.max_requests_jitter, args.preload) == (0, 0, False)
+    args = run.parse_args(['--server', 'gunicorn', '--max-requests', '500', '--max-requests-jitter', '7'])
+    assert (args.max_requests, args.max_requests_jitter) == (500, 7)
+
+
+def test_uvicorn_recycles_only_when_asked(monkeypatch, caplog):
+    args = run.parse_args(['--server', 'uvicorn', '--workers', '1'])
+    # uvicorn cannot preload, and a lone worker is not recycled by default
+    assert (args.max_requests, args.max_requests_jitter, args.preload) == (0, 0, False)
+    monkeypatch.setenv('MAX_REQUESTS', '500')
+    assert run.parse_args(['--server', 'uvicorn', '--workers', '1']).max_requests == 500
+    with caplog.at_level(logging.WARNING, logger='run'):
+        args = run.parse_args(['--server', 'uvicorn', '--workers', '2'])
+    # Its supervisor would not replace recycled workers
+    assert args.max_requests == 0
+    assert 'MAX_REQUESTS ignored' in caplog.text
+
+
+def test_print_config_reports_the_effective_settings(capsys):
+    run.main(['--server', 'uvicorn', '--workers', '2', '--print-config'])
+    config = dict(line.split('=', 1) for line in capsys.readouterr().out.splitlines())
+    assert config['server'] == 'uvicorn'
+    assert config['workers'] == '2'
+    assert config['preload'] == 'False'
+    assert config['max_requests'] == '0'
+    assert 'print_config' not in config
+
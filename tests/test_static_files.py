@@ -0,0 +1,143 @@
+"""
+StaticAssets: byte ranges (206 and 416), conditional requests (304 for
+strong and weak If-None-Match), choosing the .br/.gz sibling, chunked
+reads of large files and the SPA fallback.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import static_files  # noqa: E402
+from static_files import StaticAssets  # noqa: E402
+from tests.asgi import call  # noqa: E402
+
+JS = bytes(range(256)) * 20
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / 'app.js').write_bytes(JS)
+    (tmp_path / 'index.html').write_bytes(b'<!doctype html>')
+    return StaticAssets([tmp_path])
+
+
+def test_full_response(assets):
+    status, headers, body = call(assets, '/app.js')
+    assert status == 200
+    assert body == JS
+    assert headers['content-length'] == str(len(JS))
+    assert headers['accept-ranges'] == 'bytes'
+    assert 'vary' not in headers
+
+
+@pytest.mark.parametrize('range_header, start, end', [
+    ('bytes=10-19', 10, 19),
+    ('bytes=5000-', 5000, 5119),
+    ('bytes=-20', 5100, 5119),
+    ('bytes=5100-9999', 5100, 5119),
+])
+def test_range(assets, range_header, start, end):
+    status, headers, body = call(assets, '/app.js', {'Range': range_header})
+    assert status == 206
+    assert headers['content-range'] == f'bytes {start}-{end}/{len(JS)}'
+    assert headers['content-length'] == str(end - start + 1)
+    assert body == JS[start:end + 1]
+
+
+@pytest.mark.parametrize('range_header', ['bytes=5120-', 'bytes=6000-7000', 'bytes=-0', 'bytes=20-10'])
+def test_unsatisfiable_range(assets, range_header):
+    status, headers, body = call(assets, '/app.js', {'Range': range_header})
+    assert status == 416
+    assert headers['content-range'] == f'bytes */{len(JS)}'
+
+
+@pytest.mark.parametrize('range_header', ['bytes=0-1,5-6', 'items=0-1', 'bytes=abc'])
+def test_unsupported_ranges_get_the_whole_file(assets, range_header):
+    status, headers, body = call(assets, '/app.js', {'Range': range_header})
+    assert status == 200
+    assert body == JS
+
+
+def test_if_range_mismatch_gets_the_whole_file(assets):
+    status, headers, body = call(assets, '/app.js', {'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert status == 200
+    assert body == JS
+
+
+def test_head_has_headers_but_no_body(assets):
+    status, headers, body = call(assets, '/app.js', method='HEAD')
+    assert status == 200
+    assert headers['content-length'] == str(len(JS))
+    assert body == b''
+
+
+@pytest.mark.parametrize('if_none_match, status', [
+    ('{etag}', 304),
+    ('W/{etag}', 304),
+    ('"other", W/{etag}', 304),
+    ('*', 304),
+    ('"other"', 200),
+])
+def test_if_none_match(assets, if_none_match, status):
+    etag = call(assets, '/app.js')[1]['etag']
+    got, headers, body = call(assets, '/app.js', {'If-None-Match': if_none_match.format(etag=etag)})
+    assert got == status
+    if status == 304:
+        assert body == b''
+        assert headers['etag'] == etag
+
+
+def test_if_modified_since(assets):
+    last_modified = call(assets, '/app.js')[1]['last-modified']
+    assert call(assets, '/app.js', {'If-Modified-Since': last_modified})[0] == 304
+    assert call(assets, '/app.js', {'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'})[0] == 200
+
+
+@pytest.fixture
+def precompressed(tmp_path):
+    (tmp_path / 'app.js').write_bytes(JS)
+    (tmp_path / 'app.js.br').write_bytes(b'brotli bytes')
+    (tmp_path / 'app.js.gz').write_bytes(b'gzip bytes')
+    return StaticAssets([tmp_path])
+
+
+@pytest.mark.parametrize('accept_encoding, encoding, body', [
+    ('gzip, deflate, br', 'br', b'brotli bytes'),
+    ('gzip', 'gzip', b'gzip bytes'),
+    ('br;q=0.5, gzip', 'gzip', b'gzip bytes'),
+    ('zstd', None, JS),
+    ('', None, JS),
+])
+def test_precompressed_sibling(precompressed, accept_encoding, encoding, body):
+    status, headers, sent = call(precompressed, '/app.js', {'Accept-Encoding': accept_encoding})
+    assert status == 200
+    assert headers.get('content-encoding') == encoding
+    assert headers['content-length'] == str(len(body))
+    assert headers['vary'] == 'Accept-Encoding'
+    assert sent == body
+
+
+def test_range_on_a_precompressed_file_is_served_from_the_original(precompressed):
+    status, headers, body = call(precompressed, '/app.js', {'Range': 'bytes=0-9', 'Accept-Encoding': 'br'})
+    assert status == 206
+    assert 'content-encoding' not in headers
+    assert body == JS[:10]
+
+
+def test_large_files_are_read_in_chunks(assets, monkeypatch):
+    monkeypatch.setattr(static_files, 'SINGLE_READ_LIMIT', 1000)
+    monkeypatch.setattr(static_files, 'CHUNK_SIZE', 1000)
+    assert call(assets, '/app.js')[2] == JS
+    assert call(assets, '/app.js', {'Range': 'bytes=100-3099'})[2] == JS[100:3100]
+
+
+def test_routes_fall_back_to_index_but_files_and_api_do_not(assets):
+    assert call(assets, '/products/42')[2] == b'<!doctype html>'
+    assert call(assets, '/missing.js')[0] == 404
+    assert call(assets, '/api/missing')[0] == 404
+    assert call(assets, '/../secret.txt')[0] == 404
+    assert call(assets, '/app.js', method='POST')[0] == 405
@@ -0,0 +1,112 @@
+"""
+Tracing: spans nest under the span that was current when they started,
+across awaits and concurrent tasks; the middleware samples requests (or
+traces one on an admin's X-Trace), names the trace by route template and
+echoes its ID; TracedDatabase records a span per Mongo operation.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import admin_auth  # noqa: E402
+import tracing  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+from logging_config import RequestIdMiddleware  # noqa: E402
+from tracing import NULL_SPAN, Trace, TracedDatabase, TraceRecorder, TracingMiddleware, span  # noqa: E402
+
+
+def by_name(trace: Trace) -> dict:
+    return {s['name']: s for s in trace.spans}
+
+
+def test_spans_nest_across_awaits_and_tasks():
+    async def charge(name):
+        with span(name):
+            await asyncio.sleep(0.01)
+            with span(f'{name}.http'):
+                await asyncio.sleep(0)
+
+    async def request():
+        trace = Trace('t1', 'POST /api/orders/notify')
+        tracing._current.set((trace, None))
+        with span('handler', route='/api/orders/notify') as handler:
+            await asyncio.gather(charge('a'), charge('b'))
+            handler.set(status=200)
+        return trace
+
+    trace = asyncio.run(request())
+    spans = by_name(trace)
+    assert spans['handler']['parent_id'] is None
+    assert spans['handler']['attributes'] == {'route': '/api/orders/notify', 'status': 200}
+    # Both tasks ran at once, yet each child hangs under its own parent
+    assert spans['a']['parent_id'] == spans['b']['parent_id'] == spans['handler']['span_id']
+    assert spans['a.http']['parent_id'] == spans['a']['span_id']
+    assert spans['b.http']['parent_id'] == spans['b']['span_id']
+    assert spans['a']['duration_ms'] >= 10
+
+
+def test_errors_are_recorded_and_unsampled_spans_are_free():
+    async def request():
+        trace = Trace('t2', 'GET /')
+        tracing._current.set((trace, None))
+        with pytest.raises(ValueError):
+            with span('boom'):
+                raise ValueError('bad')
+        return trace
+
+    assert by_name(asyncio.run(request()))['boom']['error'] == "ValueError('bad')"
+    assert span('outside a trace') is NULL_SPAN
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    db = TracedDatabase(FakeDatabase())
+
+    @app.get('/api/reviews/{product_id}')
+    async def reviews(product_id: str):
+        with span('render'):
+            await db.reviews.insert_one({'product_id': product_id})
+            return await db.reviews.find({'product_id': product_id}, {'_id': 0}).to_list(None)
+
+    return app
+
+
+def client(app, sample_rate):
+    recorder = TraceRecorder(10)
+    return TestClient(RequestIdMiddleware(TracingMiddleware(app, sample_rate, recorder))), recorder
+
+
+def test_middleware_records_the_trace(app):
+    test_client, recorder = client(app, sample_rate=1)
+    response = test_client.get('/api/reviews/p1', headers={'X-Request-ID': 'req-7'})
+    assert response.json() == [{'product_id': 'p1'}]
+    [trace] = recorder.traces
+    # The trace ID is the request ID, so traces line up with log lines
+    assert trace.trace_id == response.headers['x-trace-id'] == 'req-7'
+    assert trace.name == 'GET /api/reviews/{product_id}'
+    assert trace.status == 200 and trace.duration_ms > 0
+    spans = by_name(trace)
+    assert spans['mongo.insert_one']['attributes'] == {'collection': 'reviews'}
+    assert spans['mongo.find']['attributes'] == {'collection': 'reviews', 'documents': 1}
+    assert spans['mongo.find']['parent_id'] == spans['render']['span_id']
+    assert recorder.find('req-7') is trace
+
+
+def test_admins_can_force_a_trace(app, monkeypatch):
+    monkeypatch.setattr(admin_auth, 'ADMIN_TOKEN', 'secret')
+    test_client, recorder = client(app, sample_rate=0)
+    assert 'x-trace-id' not in test_client.get('/api/reviews/p1').headers
+    assert 'x-trace-id' not in test_client.get('/api/reviews/p1', headers={'X-Trace': '1'}).headers
+    assert not recorder.traces
+    response = test_client.get('/api/reviews/p1', headers={'X-Trace': '1', 'X-Admin-Token': 'secret'})
+    assert [trace.trace_id for trace in recorder.traces] == [response.headers['x-trace-id']]